@@ -1,21 +1,294 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import unquote, urljoin, urlparse
+
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import DATA_DIR
 
 BASE_URL = "https://dadosabertos.ans.gov.br/FTP/PDA/"
 
-def listar_pastas():
-    response = requests.get(BASE_URL, timeout=30)
+# pastas baixadas por padrao: ZIPs trimestrais e o cadastro de operadoras (CADOP)
+PASTAS = ["demonstracoes_contabeis/", "operadoras_de_plano_de_saude_ativas/"]
+CADOP_DIR = "operadoras_de_plano_de_saude_ativas/"
+CADOP_DEST = "cadastro_operadoras_ativas.csv"
+INCLUIR = r"\.(zip|csv)$"
+
+META_FILE = ".downloads.json"
+CHUNK = 1024 * 1024
+
+_local = threading.local()
+
+
+# =========================
+# SESSAO HTTP
+# =========================
+def criar_sessao(pool=8):
+    """Sessao keep-alive com retry para erros transitorios."""
+    s = requests.Session()
+    retry = Retry(total=4, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("GET", "HEAD"))
+    adapter = HTTPAdapter(pool_connections=pool, pool_maxsize=pool, max_retries=retry)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+def sessao():
+    # uma sessao por thread: requests.Session nao e garantidamente thread-safe
+    s = getattr(_local, "session", None)
+    if s is None:
+        s = _local.session = criar_sessao(pool=2)
+    return s
+
+
+# =========================
+# LISTAGEM
+# =========================
+def listar(url, session=None):
+    """Subpastas e arquivos (URLs absolutas) da listagem HTML de `url`."""
+    response = (session or sessao()).get(url, timeout=30)
     response.raise_for_status()
 
     soup = BeautifulSoup(response.text, "html.parser")
 
     pastas = []
+    arquivos = []
 
     for link in soup.find_all("a"):
         href = link.get("href")
+        if not href or href.startswith(("?", "#")):
+            continue
+        full = urljoin(url, href)
+        # so filhos diretos: ignora "../", links absolutos e de ordenacao
+        if not full.startswith(url) or full == url:
+            continue
+        if full.endswith("/"):
+            pastas.append(full)
+        else:
+            arquivos.append(full)
+
+    return pastas, arquivos
+
+
+def listar_pastas(base_url=BASE_URL):
+    pastas, _ = listar(base_url)
+    return [unquote(p[len(base_url):]).strip("/") for p in pastas]
+
+
+def percorrer(url, incluir=INCLUIR, session=None):
+    """Arquivos de `url` e subpastas (recursivo) cujo nome casa com `incluir`."""
+    padrao = re.compile(incluir, re.IGNORECASE)
+    pendentes = [url]
+    vistos = set()
+    while pendentes:
+        atual = pendentes.pop()
+        if atual in vistos:
+            continue
+        vistos.add(atual)
+        pastas, arquivos = listar(atual, session)
+        for a in sorted(arquivos):
+            if padrao.search(urlparse(a).path):
+                yield a
+        pendentes.extend(sorted(pastas, reverse=True))
+
+
+# =========================
+# DOWNLOAD (condicional + retomada)
+# =========================
+class Registro:
+    """ETag/Last-Modified/tamanho de cada URL baixada, em DATA_DIR/.downloads.json."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self._data = json.load(f)
+        except (OSError, ValueError):
+            self._data = {}
+
+    def get(self, url):
+        with self._lock:
+            return dict(self._data.get(url, {}))
+
+    def update(self, url, **info):
+        with self._lock:
+            self._data.setdefault(url, {}).update(info)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._data, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+
+
+def _validadores(response):
+    return {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+
+
+def baixar(url, dest, registro, session=None):
+    """Baixa `url` em `dest`. Devolve "nao modificado", "retomado" ou "baixado".
+
+    Com o arquivo completo e validadores salvos, faz GET condicional
+    (If-None-Match/If-Modified-Since). Um `dest.part` de uma execucao
+    interrompida e retomado com Range + If-Range; se o servidor ignorar o
+    Range (200) o download recomeca do zero.
+    """
+    s = session or sessao()
+    meta = registro.get(url)
+    part = dest + ".part"
+    headers = {}
+
+    completo = os.path.exists(dest) and meta.get("size") == os.path.getsize(dest)
+    if completo:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    offset = 0
+    parcial = meta.get("parcial") or {}
+    if not completo and os.path.exists(part):
+        validador = parcial.get("etag") or parcial.get("last_modified")
+        if validador:
+            offset = os.path.getsize(part)
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = validador
+
+    with s.get(url, headers=headers, stream=True, timeout=60) as r:
+        if r.status_code == 304:
+            return "nao modificado"
+        if r.status_code == 416:
+            # .part invalido para o recurso atual
+            os.remove(part)
+            return baixar(url, dest, registro, session)
+        r.raise_for_status()
+
+        retomado = r.status_code == 206 and r.headers.get("Content-Range", "").startswith(f"bytes {offset}-")
+        if not retomado:
+            offset = 0
+        validadores = _validadores(r)
+        registro.update(url, parcial=validadores)
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(part, "ab" if retomado else "wb") as f:
+            for chunk in r.iter_content(CHUNK):
+                f.write(chunk)
+
+    os.replace(part, dest)
+    registro.update(url, size=os.path.getsize(dest), parcial=None, **validadores)
+    return "retomado" if retomado else "baixado"
+
+
+# =========================
+# EXTRACAO
+# =========================
+def extrair_zip(path, dest_dir):
+    """Extrai membro a membro em blocos (nada do ZIP fica inteiro em memoria)."""
+    extraidos = []
+    raiz = os.path.abspath(dest_dir)
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            alvo = os.path.abspath(os.path.join(raiz, info.filename))
+            if not alvo.startswith(raiz + os.sep):
+                print("AVISO: membro ignorado (caminho fora da pasta):", info.filename)
+                continue
+            os.makedirs(os.path.dirname(alvo), exist_ok=True)
+            tmp = alvo + ".tmp"
+            with zf.open(info) as src, open(tmp, "wb") as dst:
+                shutil.copyfileobj(src, dst, CHUNK)
+            os.replace(tmp, alvo)
+            extraidos.append(alvo)
+    return extraidos
+
+
+# =========================
+# SINCRONIZACAO
+# =========================
+def destino(url, base_url, data_dir):
+    """Caminho local: espelha a arvore remota; o CSV do CADOP vai para o nome usado pelo pipeline."""
+    rel = unquote(url[len(base_url):])
+    if rel.startswith(CADOP_DIR) and rel.lower().endswith(".csv"):
+        return os.path.join(data_dir, CADOP_DEST)
+    return os.path.join(data_dir, *rel.split("/"))
+
+
+def processar(url, base_url, data_dir, registro, extrair=True):
+    dest = destino(url, base_url, data_dir)
+    status = baixar(url, dest, registro)
+    extraidos = 0
+    if extrair and dest.lower().endswith(".zip"):
+        meta = registro.get(url)
+        versao = meta.get("etag") or meta.get("last_modified") or meta.get("size")
+        if status != "nao modificado" or meta.get("extraido") != versao:
+            extraidos = len(extrair_zip(dest, os.path.dirname(dest)))
+            registro.update(url, extraido=versao)
+    return url, status, extraidos
+
+
+def sincronizar(base_url=BASE_URL, data_dir=DATA_DIR, pastas=PASTAS, workers=4,
+                incluir=INCLUIR, extrair=True):
+    """Percorre `pastas` em `base_url` e baixa/extrai em paralelo (no maximo `workers`)."""
+    if not base_url.endswith("/"):
+        base_url += "/"
+    registro = Registro(os.path.join(data_dir, META_FILE))
+
+    urls = []
+    for pasta in pastas:
+        urls.extend(percorrer(urljoin(base_url, pasta), incluir))
+    print("Arquivos encontrados:", len(urls))
+
+    resumo = {"baixado": 0, "retomado": 0, "nao modificado": 0, "erro": 0, "extraidos": 0}
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futuros = {ex.submit(processar, u, base_url, data_dir, registro, extrair): u for u in urls}
+        for fut in as_completed(futuros):
+            url = futuros[fut]
+            try:
+                _, status, extraidos = fut.result()
+            except (requests.RequestException, OSError, zipfile.BadZipFile) as e:
+                print("ERRO:", url, "-", e)
+                resumo["erro"] += 1
+                continue
+            resumo[status] += 1
+            resumo["extraidos"] += extraidos
+            print(f"{status:<15}", unquote(url[len(base_url):]))
+    return resumo
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Baixa os dados abertos da ANS (demonstracoes contabeis e CADOP).")
+    ap.add_argument("--base-url", default=BASE_URL)
+    ap.add_argument("--data-dir", default=DATA_DIR)
+    ap.add_argument("--pastas", default=",".join(PASTAS),
+                    help="pastas (relativas a --base-url) percorridas recursivamente")
+    ap.add_argument("--incluir", default=INCLUIR, help="regex dos arquivos a baixar")
+    ap.add_argument("--workers", type=int, default=4, help="downloads simultaneos")
+    ap.add_argument("--sem-extrair", action="store_true", help="nao extrai os ZIPs")
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    pastas = [p.strip().strip("/") + "/" for p in args.pastas.split(",") if p.strip()]
+    resumo = sincronizar(args.base_url, args.data_dir, pastas, max(1, args.workers),
+                         args.incluir, not args.sem_extrair)
+    print("Resumo:", ", ".join(f"{k}: {v}" for k, v in resumo.items()))
+    print(f"Tempo: {time.perf_counter() - t0:.2f}s")
+    return resumo
 
-        if href and href.endswith("/"):
-            if href != "../":
-                pastas.append(href.replace("/", ""))
 
-    return pastas
+if __name__ == "__main__":
+    main()
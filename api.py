@@ -1,176 +1,780 @@
+import asyncio
+import base64
+import csv
+import io
+import json
+import logging
 import os
-from typing import Optional
-
-import psycopg2
-from psycopg2.extras import RealDictCursor
-
-from fastapi import FastAPI, HTTPException, Query
-
-app = FastAPI(title="Teste Intuitive API", version="1.0")
+import time
+import zlib
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime
+from decimal import Decimal
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Literal, Optional
+
+from psycopg import errors as pg_errors
+from psycopg.rows import tuple_row
+from psycopg_pool import PoolTimeout
+
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+
+import orjson
+
+import metrics
+from cache import MISSING, LRUCache, TTLCache
+from cubo import SELECT_CELULAS, Cubo, parse_dims, parse_lista
+from db import async_pool_stats, open_async_pool
+from metrics import MetricsMiddleware, timed_connection
+from schema import REFRESH_RESUMO, SELECT_RESUMO
+
+logger = logging.getLogger(__name__)
+
+estatisticas_cache = TTLCache(ttl=float(os.getenv("ESTATISTICAS_TTL", "60")))
+count_cache = TTLCache(ttl=float(os.getenv("COUNT_TTL", "60")))
+BATCH_MAX = int(os.getenv("BATCH_MAX", "1000"))
+EXPORT_CHUNK = int(os.getenv("EXPORT_CHUNK", "5000"))
+
+lookup_cache = LRUCache(
+    maxsize=int(os.getenv("LOOKUP_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("LOOKUP_CACHE_TTL", "3600")),
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pool = open_async_pool()
+    await pool.open()
+    app.state.pool = pool
+    app.state.search_mode = None
+    app.state.search_versao = MISSING
+    await modo_busca(app)
+    app.state.cubo = None
+    app.state.cubo_lock = asyncio.Lock()
+    try:
+        await cubo_atual(app)
+    except pg_errors.Error as e:
+        # tabelas ainda nao carregadas: o cubo e montado no primeiro /api/analitico
+        # (que responde 503 enquanto faltarem); api_cubo_montado=0 no /metrics
+        logger.warning("cubo analitico nao montado: %s", str(e).splitlines()[0])
+    try:
+        yield
+    finally:
+        await pool.close()
+
+
+app = FastAPI(title="Teste Intuitive API", version="1.0", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware, server_timing=os.getenv("SERVER_TIMING", "0") == "1")
+
+
+@app.exception_handler(PoolTimeout)
+async def pool_exhausted_handler(request: Request, exc: PoolTimeout):
+    return JSONResponse(status_code=503, content={"detail": "nenhuma conexao livre no pool"})
+
+
+@app.exception_handler(pg_errors.UndefinedTable)
+async def undefined_table_handler(request: Request, exc: pg_errors.UndefinedTable):
+    # a API nao roda DDL: tabelas e o resumo vem da carga (load_pg.py) ou de `schema.py criar`
+    detail = f"{str(exc).splitlines()[0]}; rode `python schema.py criar` apos a carga"
+    return JSONResponse(status_code=503, content={"detail": detail})
 
 
 # =========================
 # CONEXAO COM O BANCO
 # =========================
-def get_db_conn():
-    host = os.getenv("PGHOST", "127.0.0.1").strip()
-    port = os.getenv("PGPORT", "5432").strip()
-    dbname = os.getenv("PGDATABASE", "teste_intuitive").strip()
-    user = os.getenv("PGUSER", "postgres").strip()
-    password = os.getenv("PGPASSWORD", "").strip()
-
-    return psycopg2.connect(
-        host=host,
-        port=port,
-        dbname=dbname,
-        user=user,
-        password=password,
-        options="-c client_encoding=UTF8",
-    )
+async def get_db_conn(request: Request):
+    # uma conexao do pool por request, devolvida ao final
+    async with timed_connection(request.app.state.pool) as conn:
+        yield conn
 
 
 # =========================
 # HELPERS
 # =========================
-def fetch_all(sql: str, params: tuple = ()):
-    with get_db_conn() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(sql, params)
-            return cur.fetchall()
+async def fetch_all(conn, label: str, sql: str, params: tuple = ()):
+    # `label` identifica a consulta nas metricas (/metrics e Server-Timing).
+    # Linhas vem como tuplas e NUMERIC ja como float (loader do pool, em db.py),
+    # prontas para o orjson.
+    async with conn.cursor(row_factory=tuple_row) as cur:
+        t0 = time.perf_counter()
+        await cur.execute(sql, params)
+        t1 = time.perf_counter()
+        raw = await cur.fetchall()
+        cols = [c.name for c in cur.description] if cur.description else []
+        rows = [dict(zip(cols, r)) for r in raw]
+        t2 = time.perf_counter()
+    metrics.QUERY_LATENCY.observe(t1 - t0, label)
+    metrics.QUERY_FETCH.observe(t2 - t1, label)
+    metrics.QUERY_ROWS.observe(len(rows), label)
+    metrics.add_timing("db", t2 - t0)
+    return rows
+
+
+async def fetch_one(conn, label: str, sql: str, params: tuple = ()):
+    rows = await fetch_all(conn, label, sql, params)
+    return rows[0] if rows else None
 
 
-def fetch_one(sql: str, params: tuple = ()):
-    rows = fetch_all(sql, params)
-    return rows[0] if rows else None
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"tipo nao serializavel: {type(value).__name__}")
+
+
+def json_bytes(content) -> bytes:
+    t0 = time.perf_counter()
+    data = orjson.dumps(content, default=_json_default)
+    metrics.add_timing("serialize", time.perf_counter() - t0)
+    return data
+
+
+class FastJSONResponse(Response):
+    """JSON via orjson, sem passar pelo jsonable_encoder do FastAPI.
+
+    Aceita bytes ja serializados (ex.: vindos do lookup_cache).
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return content if isinstance(content, bytes) else json_bytes(content)
+
+
+def encode_cursor(payload: dict) -> str:
+    raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> dict:
+    # {"r": razao_social, "c": cnpj} (keyset) ou {"o": offset} (busca ranqueada)
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw.decode("utf-8"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cursor invalido")
+    if isinstance(payload, dict):
+        if isinstance(payload.get("o"), int) and payload["o"] >= 0:
+            return payload
+        if isinstance(payload.get("c"), str) and isinstance(payload.get("r"), (str, type(None))):
+            return payload
+    raise HTTPException(status_code=400, detail="cursor invalido")
+
+
+# =========================
+# BUSCA
+# =========================
+KEYSET_ORDER = "razao_social ASC NULLS LAST, COALESCE(cnpj, '') ASC"
+
+async def detect_search_mode(conn) -> str:
+    # "trgm": coluna busca + pg_trgm; "busca": so a coluna; "ilike": schema antigo
+    row = await fetch_one(
+        conn,
+        "search_mode",
+        """
+        SELECT
+            EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'operadoras' AND column_name = 'busca'
+            ) AS busca,
+            EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm') AS trgm
+        """,
+    )
+    if not row["busca"]:
+        return "ilike"
+    return "trgm" if row["trgm"] else "busca"
+
+
+async def modo_busca(app) -> str:
+    """Modo de busca da versao atual dos dados (`atualizado_em` do resumo).
+
+    Redetectado quando a versao muda: a API pode subir antes do `schema.py
+    criar`/load_pg criarem a coluna `busca` e o indice trigram.
+    """
+    try:
+        versao = (await current_resumo(app.state.pool))["atualizado_em"]
+    except pg_errors.UndefinedTable:
+        versao = None
+    if versao != app.state.search_versao:
+        async with timed_connection(app.state.pool) as conn:
+            app.state.search_mode = await detect_search_mode(conn)
+        app.state.search_versao = versao
+    return app.state.search_mode
+
+
+def search_clause(q: str, mode: str):
+    """Monta (filtro, params, ordem, params_ordem) para o parametro `q`.
+
+    Consultas so com digitos (e pontuacao de CNPJ) vao direto ao indice de
+    CNPJ: igualdade com 14 digitos, prefixo com menos. Texto e comparado
+    com a coluna normalizada `busca`, ranqueado por relevancia.
+    """
+    digits = "".join(ch for ch in q if ch.isdigit())
+    if digits and not q.strip(" ./-0123456789"):
+        if len(digits) >= 14:
+            return "cnpj = %s", [digits[:14]], "cnpj ASC", []
+        return "cnpj LIKE %s", [digits + "%"], "cnpj ASC", []
+
+    if mode == "ilike":
+        return "(cnpj ILIKE %s OR razao_social ILIKE %s)", [f"%{q}%", f"%{q}%"], KEYSET_ORDER, []
+
+    rank = [
+        "(busca LIKE busca_normaliza(%s) || '%%') DESC",
+        "(busca LIKE '%% ' || busca_normaliza(%s) || '%%') DESC",
+    ]
+    rank_params = [q, q]
+    where = "busca LIKE '%%' || busca_normaliza(%s) || '%%'"
+    params = [q]
+
+    if mode == "trgm":
+        # aceita erros de digitacao via similaridade de palavras (indice GIN)
+        where = f"({where} OR busca_normaliza(%s) <%% busca)"
+        params.append(q)
+        rank.append("word_similarity(busca_normaliza(%s), busca) DESC")
+        rank_params.append(q)
+
+    rank.append("length(busca) ASC, razao_social ASC, COALESCE(cnpj, '') ASC")
+    return where, params, ", ".join(rank), rank_params
+
+
+async def count_operadoras(conn, where: str, params: list, mode: str, cache_key):
+    if mode == "none":
+        return None
+
+    if mode == "estimate":
+        if not where:
+            row = await fetch_one(
+                conn,
+                "operadoras.count_estimate",
+                "SELECT reltuples::bigint AS total FROM pg_class WHERE oid = 'operadoras'::regclass",
+            )
+            if row and row["total"] >= 0:
+                return int(row["total"])
+        else:
+            row = await fetch_one(
+                conn,
+                "operadoras.count_explain",
+                f"EXPLAIN (FORMAT JSON) SELECT 1 FROM operadoras {where}",
+                tuple(params),
+            )
+            if row:
+                return int(row["QUERY PLAN"][0]["Plan"]["Plan Rows"])
+
+    total = count_cache.get(cache_key)
+    if total is None:
+        row = await fetch_one(
+            conn,
+            "operadoras.count",
+            f"SELECT COUNT(*) AS total FROM operadoras {where}",
+            tuple(params),
+        )
+        total = int(row["total"]) if row else 0
+        count_cache.set(cache_key, total)
+    return total
 
 
 # =========================
 # ENDPOINTS
 # =========================
 @app.get("/api/operadoras")
-def list_operadoras(
+async def list_operadoras(
+    request: Request,
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=200),
     q: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="next_cursor da pagina anterior; quando informado, `page` e ignorado"),
+    total: Optional[Literal["exact", "estimate", "none"]] = Query(
+        None, description="padrao: exact na paginacao por page, none na paginacao por cursor"
+    ),
+    conn=Depends(get_db_conn),
 ):
-    offset = (page - 1) * limit
-
-    where = ""
+    filters = []
     params = []
+    order = KEYSET_ORDER
+    order_params = []
 
-    if q and q.strip():
-        qq = q.strip()
-        where = "WHERE cnpj ILIKE %s OR razao_social ILIKE %s"
-        params.extend([f"%{qq}%", f"%{qq}%"])
+    qq = (q or "").strip()
+    if qq:
+        where_q, params, order, order_params = search_clause(qq, await modo_busca(request.app))
+        filters.append(where_q)
 
-    total_row = fetch_one(
-        f"SELECT COUNT(*) AS total FROM operadoras {where}",
-        tuple(params),
-    )
-    total = int(total_row["total"]) if total_row else 0
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    total_mode = total or ("none" if cursor else "exact")
+    total_count = await count_operadoras(conn, where, params, total_mode, qq)
 
-    rows = fetch_all(
-        f"""
+    page_filters = list(filters)
+    page_params = list(params)
+    offset = (page - 1) * limit
+    after = decode_cursor(cursor) if cursor else None
+
+    if after is not None and "o" in after:
+        offset = after["o"]
+    elif after is not None:
+        # keyset em duas fases, cada uma servida pelo indice (razao_social, COALESCE(cnpj, '')):
+        # primeiro as razoes nao nulas, depois o trecho com razao NULL (NULLS LAST)
+        if after["r"] is None:
+            page_filters.append("(razao_social IS NULL AND COALESCE(cnpj, '') > %s)")
+            page_params.append(after["c"])
+        else:
+            page_filters.append("(razao_social, COALESCE(cnpj, '')) > (%s, %s)")
+            page_params.extend([after["r"], after["c"]])
+        offset = 0
+
+    page_where = f"WHERE {' AND '.join(page_filters)}" if page_filters else ""
+    page_sql = """
         SELECT cnpj, registro_ans, razao_social, modalidade, uf
         FROM operadoras
         {where}
-        ORDER BY razao_social ASC NULLS LAST
+        ORDER BY {order}
         LIMIT %s OFFSET %s
-        """,
-        tuple(params + [limit, offset]),
+        """
+
+    rows = await fetch_all(
+        conn,
+        "operadoras.page",
+        page_sql.format(where=page_where, order=order),
+        tuple(page_params + order_params + [limit + 1, offset]),
     )
 
-    return {
+    if after is not None and after.get("r") is not None and len(rows) <= limit:
+        # razoes nao nulas acabaram: completa a pagina com o inicio do trecho NULL
+        null_where = f"WHERE {' AND '.join(filters + ['razao_social IS NULL'])}"
+        rows += await fetch_all(
+            conn,
+            "operadoras.page",
+            page_sql.format(where=null_where, order=order),
+            tuple(params + [limit + 1 - len(rows), 0]),
+        )
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if order != KEYSET_ORDER:
+            # resultado ranqueado nao tem chave estavel: o cursor guarda o offset
+            next_cursor = encode_cursor({"o": offset + limit})
+        else:
+            last = rows[-1]
+            next_cursor = encode_cursor({"r": last["razao_social"], "c": last["cnpj"] or ""})
+
+    return FastJSONResponse({
         "data": rows,
-        "page": page,
+        "page": None if cursor else page,
         "limit": limit,
-        "total": total,
-    }
+        "total": total_count,
+        "next_cursor": next_cursor,
+    })
 
 
-@app.get("/api/operadoras/{cnpj}")
-def get_operadora(cnpj: str):
-    cnpj = "".join(ch for ch in cnpj if ch.isdigit())
+def digits_only(value: str) -> str:
+    return "".join(ch for ch in value if ch.isdigit())
+
+
+def parse_cnpj(cnpj: str) -> str:
+    cnpj = digits_only(cnpj)
     if not cnpj:
         raise HTTPException(status_code=400, detail="cnpj invalido")
+    return cnpj
+
+
+def not_modified(request: Request, etag: str, last_modified: datetime) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        tags = [t.strip() for t in inm.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def cached_lookup(request: Request, key, loader, not_found: str = "nao encontrado"):
+    """Read-through do lookup_cache com validacao condicional.
+
+    A versao do dataset e o `atualizado_em` do resumo (ja em cache). O
+    recurso e resolvido antes da validacao condicional (`If-None-Match: *`
+    nao vale para um CNPJ inexistente); com o cache quente, o 304 sai sem
+    tocar no banco. O cache guarda o JSON ja serializado, inclusive a
+    ausencia: `loader` devolvendo None vira 404.
+    """
+    resumo = await current_resumo(request.app.state.pool)
+    version = resumo["atualizado_em"]
+    last_modified = datetime.fromisoformat(version)
+    etag = f'"{int(last_modified.timestamp() * 1_000_000):x}"'
+    headers = {"ETag": etag, "Last-Modified": format_datetime(last_modified, usegmt=True)}
+
+    body = lookup_cache.get(key, version, default=MISSING)
+    if body is MISSING:
+        async with timed_connection(request.app.state.pool) as conn:
+            value = await loader(conn)
+        body = None if value is None else json_bytes(value)
+        lookup_cache.set(key, body, version)
+
+    if body is None:
+        raise HTTPException(status_code=404, detail=not_found)
+
+    if not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    return FastJSONResponse(body, headers=headers)
+
+
+@app.get("/api/operadoras/{cnpj}")
+async def get_operadora(cnpj: str, request: Request):
+    cnpj = parse_cnpj(cnpj)
+
+    async def load(conn):
+        return await fetch_one(
+            conn,
+            "operadora.get",
+            """
+            SELECT cnpj, registro_ans, razao_social, modalidade, uf
+            FROM operadoras
+            WHERE cnpj = %s
+            """,
+            (cnpj,),
+        )
 
-    row = fetch_one(
+    return await cached_lookup(request, ("operadora", cnpj), load, "operadora nao encontrada")
+
+
+@app.get("/api/operadoras/{cnpj}/despesas")
+async def get_despesas_operadora(cnpj: str, request: Request):
+    cnpj = parse_cnpj(cnpj)
+
+    async def load(conn):
+        rows = await fetch_all(
+            conn,
+            "operadora.despesas",
+            """
+            SELECT ano, trimestre, SUM(valor_despesas) AS total_despesas
+            FROM despesas_consolidadas
+            WHERE cnpj = %s
+            GROUP BY ano, trimestre
+            ORDER BY ano ASC, trimestre ASC
+            """,
+            (cnpj,),
+        )
+        return {"cnpj": cnpj, "historico": rows}
+
+    return await cached_lookup(request, ("despesas", cnpj), load)
+
+
+class BatchRequest(BaseModel):
+    cnpjs: list[str] = Field(..., min_length=1, max_length=BATCH_MAX)
+
+
+@app.post("/api/operadoras/batch")
+async def batch_operadoras(body: BatchRequest, conn=Depends(get_db_conn)):
+    cnpjs = []
+    invalidos = []
+    seen = set()
+    for raw in body.cnpjs:
+        cnpj = digits_only(raw)
+        if not cnpj:
+            invalidos.append(raw)
+        elif cnpj not in seen:
+            seen.add(cnpj)
+            cnpjs.append(cnpj)
+
+    operadoras = await fetch_all(
+        conn,
+        "batch.operadoras",
         """
         SELECT cnpj, registro_ans, razao_social, modalidade, uf
         FROM operadoras
-        WHERE cnpj = %s
+        WHERE cnpj = ANY(%s)
         """,
-        (cnpj,),
+        (cnpjs,),
+    )
+    despesas = await fetch_all(
+        conn,
+        "batch.despesas",
+        """
+        SELECT cnpj, ano, trimestre, SUM(valor_despesas) AS total_despesas
+        FROM despesas_consolidadas
+        WHERE cnpj = ANY(%s)
+        GROUP BY cnpj, ano, trimestre
+        ORDER BY cnpj ASC, ano ASC, trimestre ASC
+        """,
+        (cnpjs,),
     )
 
-    if not row:
-        raise HTTPException(status_code=404, detail="operadora nao encontrada")
+    por_cnpj = {}
+    for row in operadoras:
+        por_cnpj.setdefault(row["cnpj"], row)
 
-    return row
+    historicos = {}
+    for row in despesas:
+        cnpj = row.pop("cnpj")
+        historicos.setdefault(cnpj, []).append(row)
 
+    data = []
+    nao_encontrados = []
+    for cnpj in cnpjs:
+        row = por_cnpj.get(cnpj)
+        if row is None:
+            nao_encontrados.append(cnpj)
+            continue
+        data.append({"cnpj": cnpj, "operadora": row, "historico": historicos.get(cnpj, [])})
 
-@app.get("/api/operadoras/{cnpj}/despesas")
-def get_despesas_operadora(cnpj: str):
-    cnpj = "".join(ch for ch in cnpj if ch.isdigit())
-    if not cnpj:
-        raise HTTPException(status_code=400, detail="cnpj invalido")
+    return FastJSONResponse({"data": data, "nao_encontrados": nao_encontrados, "invalidos": invalidos})
 
-    rows = fetch_all(
-        """
-        SELECT ano, trimestre, SUM(valor_despesas) AS total_despesas
-        FROM despesas_consolidadas
-        WHERE cnpj = %s
-        GROUP BY ano, trimestre
-        ORDER BY ano ASC, trimestre ASC
-        """,
-        (cnpj,),
-    )
 
-    return {"cnpj": cnpj, "historico": rows}
+# =========================
+# EXPORTACAO
+# =========================
+EXPORT_COLUMNS = ["cnpj", "razao_social", "uf", "modalidade", "ano", "trimestre", "valor_despesas"]
 
 
-@app.get("/api/estatisticas")
-def get_estatisticas():
-    total_row = fetch_one(
-        "SELECT SUM(valor_despesas) AS total FROM despesas_consolidadas"
-    )
-    total = float(total_row["total"]) if total_row and total_row["total"] else 0.0
+def _encode_csv(rows, header=False) -> str:
+    buf = io.StringIO()
+    w = csv.writer(buf, delimiter=";", lineterminator="\n")
+    if header:
+        w.writerow(EXPORT_COLUMNS)
+    w.writerows(rows)
+    return buf.getvalue()
 
-    media_row = fetch_one(
-        "SELECT AVG(valor_despesas) AS media FROM despesas_consolidadas"
-    )
-    media = float(media_row["media"]) if media_row and media_row["media"] else 0.0
 
-    top5 = fetch_all(
-        """
-        SELECT
-            d.cnpj,
-            MAX(o.razao_social) AS razao_social,
-            MAX(o.uf) AS uf,
-            SUM(d.valor_despesas) AS total_despesas
-        FROM despesas_consolidadas d
-        JOIN operadoras o ON o.cnpj = d.cnpj
-        GROUP BY d.cnpj
-        ORDER BY total_despesas DESC
-        LIMIT 5
-        """
+def _encode_ndjson(rows) -> bytes:
+    return b"".join(
+        orjson.dumps(dict(zip(EXPORT_COLUMNS, row)), default=_json_default, option=orjson.OPT_APPEND_NEWLINE)
+        for row in rows
     )
 
-    por_uf = fetch_all(
-        """
-        SELECT o.uf, SUM(d.valor_despesas) AS total_despesas
+
+async def _open_export(pool, sql: str, params: tuple):
+    """Conexao + cursor nomeado (server-side) ja executado, antes de qualquer byte da resposta.
+
+    Erros aqui (PoolTimeout, UndefinedTable) sobem para os handlers e viram 503;
+    depois que o StreamingResponse envia os headers nao ha mais como trocar o status.
+    Devolve (stack, cur); `stack.aclose()` fecha o cursor e devolve a conexao.
+    """
+    stack = AsyncExitStack()
+    try:
+        conn = await stack.enter_async_context(timed_connection(pool))
+        cur = await stack.enter_async_context(conn.cursor(name="export_despesas", row_factory=tuple_row))
+        cur.itersize = EXPORT_CHUNK
+        t0 = time.perf_counter()
+        await cur.execute(sql, params)
+        metrics.QUERY_LATENCY.observe(time.perf_counter() - t0, "export.despesas")
+    except BaseException:
+        await stack.aclose()
+        raise
+    return stack, cur
+
+
+async def _stream_despesas(stack, cur, formato: str, gzip: bool):
+    # o Postgres entrega EXPORT_CHUNK linhas por vez; a conexao volta ao pool no fim do stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    def emit(data) -> bytes:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    try:
+        if formato == "csv":
+            yield emit(_encode_csv([], header=True))
+        total = 0
+        while True:
+            t0 = time.perf_counter()
+            rows = await cur.fetchmany(EXPORT_CHUNK)
+            metrics.QUERY_FETCH.observe(time.perf_counter() - t0, "export.despesas")
+            if not rows:
+                break
+            total += len(rows)
+            chunk = emit(_encode_csv(rows) if formato == "csv" else _encode_ndjson(rows))
+            if chunk:
+                yield chunk
+        metrics.QUERY_ROWS.observe(total, "export.despesas")
+    finally:
+        await stack.aclose()
+
+    if compressor:
+        yield compressor.flush()
+
+
+@app.get("/api/export/despesas")
+async def export_despesas(
+    request: Request,
+    formato: Literal["csv", "ndjson"] = "csv",
+    ano: Optional[int] = None,
+    trimestre: Optional[str] = None,
+    uf: Optional[str] = None,
+    modalidade: Optional[str] = None,
+):
+    filters = []
+    params = []
+    if ano is not None:
+        filters.append("d.ano = %s")
+        params.append(ano)
+    if trimestre and trimestre.strip():
+        filters.append("d.trimestre = %s")
+        params.append(trimestre.strip().upper())
+    if uf and uf.strip():
+        filters.append("o.uf = %s")
+        params.append(uf.strip().upper())
+    if modalidade and modalidade.strip():
+        filters.append("o.modalidade = %s")
+        params.append(modalidade.strip())
+
+    where = f"WHERE {' AND '.join(filters)}" if filters else ""
+    sql = f"""
+        SELECT d.cnpj, d.razao_social, o.uf, o.modalidade, d.ano, d.trimestre, d.valor_despesas
         FROM despesas_consolidadas d
-        JOIN operadoras o ON o.cnpj = d.cnpj
-        WHERE o.uf IS NOT NULL AND o.uf <> ''
-        GROUP BY o.uf
-        ORDER BY total_despesas DESC
-        LIMIT 10
-        """
+        LEFT JOIN (
+            SELECT DISTINCT ON (cnpj) cnpj, uf, modalidade
+            FROM operadoras
+            ORDER BY cnpj
+        ) o ON o.cnpj = d.cnpj
+        {where}
+    """
+
+    gzip = "gzip" in request.headers.get("accept-encoding", "").lower()
+    headers = {"Content-Disposition": f'attachment; filename="despesas.{formato}"', "Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    media_type = "text/csv; charset=utf-8" if formato == "csv" else "application/x-ndjson"
+    stack, cur = await _open_export(request.app.state.pool, sql, tuple(params))
+    return StreamingResponse(
+        _stream_despesas(stack, cur, formato, gzip),
+        media_type=media_type,
+        headers=headers,
+        # garante a devolucao da conexao mesmo se o stream nao for consumido ate o fim
+        background=BackgroundTask(stack.aclose),
     )
 
+
+async def _load_resumo(conn):
+    # sem a view (UndefinedTable) o handler responde 503
+    row = await fetch_one(conn, "resumo", SELECT_RESUMO)
     return {
-        "total_despesas": total,
-        "media_despesas": media,
-        "top5_operadoras": top5,
-        "top_ufs": por_uf,
+        "total_despesas": float(row["total_despesas"] or 0),
+        "media_despesas": float(row["media_despesas"] or 0),
+        "top5_operadoras": row["top5_operadoras"],
+        "top_ufs": row["top_ufs"],
+        "atualizado_em": row["atualizado_em"].isoformat(),
+    }
+
+
+async def current_resumo(pool):
+    data = estatisticas_cache.get("resumo")
+    if data is None:
+        async with timed_connection(pool) as conn:
+            data = await _load_resumo(conn)
+        estatisticas_cache.set("resumo", data)
+    return data
+
+
+# =========================
+# CUBO ANALITICO
+# =========================
+async def _montar_cubo(pool, versao):
+    async with timed_connection(pool) as conn:
+        rows = await fetch_all(conn, "cubo.celulas", SELECT_CELULAS)
+    celulas = [tuple(r.values()) for r in rows]
+    # montagem em numpy fora do event loop
+    return await asyncio.to_thread(Cubo, celulas, versao)
+
+
+async def cubo_atual(app):
+    """Cubo da versao atual dos dados (`atualizado_em` do resumo); remonta uma vez quando ela muda."""
+    resumo = await current_resumo(app.state.pool)
+    versao = resumo["atualizado_em"]
+    cubo = app.state.cubo
+    if cubo is not None and cubo.versao == versao:
+        return cubo
+    async with app.state.cubo_lock:
+        cubo = app.state.cubo
+        if cubo is None or cubo.versao != versao:
+            cubo = app.state.cubo = await _montar_cubo(app.state.pool, versao)
+    return cubo
+
+
+@app.get("/api/analitico")
+async def get_analitico(
+    request: Request,
+    por: str = Query("", description="dimensoes de agrupamento separadas por virgula: ano, trimestre, uf, modalidade, cnpj"),
+    ano: Optional[str] = Query(None, description="filtros aceitam varios valores separados por virgula"),
+    trimestre: Optional[str] = None,
+    uf: Optional[str] = None,
+    modalidade: Optional[str] = None,
+    cnpj: Optional[str] = None,
+    medida: Literal["total_despesas", "media_despesas", "desvio_padrao", "contagem"] = Query("total_despesas", description="medida usada na ordenacao/top-N"),
+    ordem: Literal["desc", "asc"] = "desc",
+    limite: int = Query(20, ge=1, le=1000),
+):
+    # responde do cubo em memoria, sem consulta ao banco (exceto ao remontar apos nova carga)
+    try:
+        dims = parse_dims(por)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filtros = {
+        "ano": parse_lista(ano),
+        "trimestre": parse_lista(trimestre),
+        "uf": parse_lista(uf),
+        "modalidade": parse_lista(modalidade),
+        "cnpj": [digits_only(c) for c in parse_lista(cnpj)],
+    }
+    cubo = await cubo_atual(request.app)
+    t0 = time.perf_counter()
+    res = cubo.consultar(dims, filtros, medida, ordem, limite)
+    metrics.add_timing("cubo", time.perf_counter() - t0)
+    return FastJSONResponse({"versao": cubo.versao, "por": list(dims), "medida": medida, **res})
+
+
+@app.get("/api/estatisticas")
+async def get_estatisticas(request: Request):
+    return FastJSONResponse(await current_resumo(request.app.state.pool))
+
+
+@app.post("/api/estatisticas/refresh")
+async def refresh_estatisticas(request: Request):
+    # chamar apos cada nova carga das tabelas (ou usar `python schema.py atualizar`)
+    async with timed_connection(request.app.state.pool) as conn:
+        await conn.execute(REFRESH_RESUMO)
+        await conn.commit()
+        data = await _load_resumo(conn)
+    estatisticas_cache.invalidate()
+    estatisticas_cache.set("resumo", data)
+    lookup_cache.invalidate()
+    count_cache.invalidate()
+    await modo_busca(request.app)
+    await cubo_atual(request.app)
+    return data
+
+
+@app.get("/api/pool")
+async def get_pool_stats(request: Request):
+    return async_pool_stats(request.app.state.pool)
+
+
+@app.get("/api/cache")
+async def get_cache_stats():
+    return lookup_cache.stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    pool = async_pool_stats(request.app.state.pool)
+    cache = lookup_cache.stats()
+    gauges = {
+        "api_pool_in_use": ("Conexoes em uso", pool["in_use"]),
+        "api_pool_idle": ("Conexoes ociosas", pool["idle"]),
+        "api_pool_waiting": ("Requests aguardando conexao", pool["waiting"]),
+        "api_lookup_cache_hits": ("Hits do cache de lookups", cache["hits"]),
+        "api_lookup_cache_misses": ("Misses do cache de lookups", cache["misses"]),
     }
+    cubo = request.app.state.cubo
+    gauges["api_cubo_montado"] = ("Cubo analitico montado (1) ou pendente (0)", int(cubo is not None))
+    if cubo is not None:
+        gauges["api_cubo_celulas"] = ("Celulas base do cubo analitico", cubo.celulas)
+    return PlainTextResponse(metrics.render(gauges), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,286 @@
+"""Compara o caminho sincrono (psycopg2 + threadpool) com o assincrono
+(psycopg 3 + AsyncConnectionPool) em concorrencia crescente.
+
+Uso:
+    python benchmarks/bench_api_async.py --requests 400 --concurrency 1,8,32,128
+
+Cada "request" simula um GET /api/operadoras/{cnpj} seguido da carga do
+/api/estatisticas (4 consultas). O caminho sincrono roda em um
+ThreadPoolExecutor de 40 workers, o mesmo limite padrao do threadpool do
+FastAPI/AnyIO; o assincrono roda as consultas do /api/estatisticas em
+paralelo, como a API faz.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import psycopg2  # noqa: E402
+from psycopg2.extras import RealDictCursor  # noqa: E402
+from psycopg2.pool import ThreadedConnectionPool  # noqa: E402
+
+from db import db_params, open_async_pool, pool_settings  # noqa: E402
+
+THREADPOOL_WORKERS = 40
+
+SQL_OPERADORA = """
+    SELECT cnpj, registro_ans, razao_social, modalidade, uf
+    FROM operadoras
+    WHERE cnpj = %s
+"""
+
+SQL_ESTATISTICAS = [
+    "SELECT SUM(valor_despesas) AS total FROM despesas_consolidadas",
+    "SELECT AVG(valor_despesas) AS media FROM despesas_consolidadas",
+    """
+    SELECT d.cnpj, MAX(o.razao_social) AS razao_social, MAX(o.uf) AS uf,
+           SUM(d.valor_despesas) AS total_despesas
+    FROM despesas_consolidadas d
+    JOIN operadoras o ON o.cnpj = d.cnpj
+    GROUP BY d.cnpj
+    ORDER BY total_despesas DESC
+    LIMIT 5
+    """,
+    """
+    SELECT o.uf, SUM(d.valor_despesas) AS total_despesas
+    FROM despesas_consolidadas d
+    JOIN operadoras o ON o.cnpj = d.cnpj
+    WHERE o.uf IS NOT NULL AND o.uf <> ''
+    GROUP BY o.uf
+    ORDER BY total_despesas DESC
+    LIMIT 10
+    """,
+]
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+# =========================
+# POOL SINCRONO (linha de base)
+# =========================
+class DBPool:
+    """Pool de conexoes psycopg2 com limite de espera e health check.
+
+    `timeout` e o maximo (segundos) que um request espera por uma conexao
+    livre antes de falhar com PoolExhausted. Conexoes ociosas ha mais de
+    `check_idle` segundos recebem um `SELECT 1` antes de serem entregues.
+    """
+
+    def __init__(self, minconn=1, maxconn=10, timeout=5.0, check_idle=30.0, **conn_kwargs):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self._pool = ThreadedConnectionPool(minconn, maxconn, **(conn_kwargs or db_params()))
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self._in_use = 0
+        self._acquired = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @classmethod
+    def from_env(cls):
+        return cls(**pool_settings())
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        last = self._last_used.get(id(conn))
+        if last is not None and time.monotonic() - last < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _checkout(self):
+        conn = self._pool.getconn()
+        if self._healthy(conn):
+            return conn
+        self._pool.putconn(conn, close=True)
+        with self._lock:
+            self._discarded += 1
+            self._last_used.pop(id(conn), None)
+        return self._pool.getconn()
+
+    @contextmanager
+    def connection(self):
+        t0 = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise PoolExhausted(f"nenhuma conexao livre em {self.timeout:.1f}s")
+
+        try:
+            conn = self._checkout()
+        except Exception:
+            self._slots.release()
+            raise
+
+        wait = time.perf_counter() - t0
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if conn.closed:
+                broken = True
+            else:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            raise
+        finally:
+            with self._lock:
+                self._in_use -= 1
+                if broken:
+                    self._discarded += 1
+                    self._last_used.pop(id(conn), None)
+                else:
+                    self._last_used[id(conn)] = time.monotonic()
+            self._pool.putconn(conn, close=broken)
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            acquired = self._acquired
+            return {
+                "max": self.maxconn,
+                "in_use": self._in_use,
+                "idle": len(self._pool._pool),
+                "acquired": acquired,
+                "timeouts": self._timeouts,
+                "discarded": self._discarded,
+                "wait_ms_avg": round(self._wait_total / acquired * 1000, 3) if acquired else 0.0,
+                "wait_ms_max": round(self._wait_max * 1000, 3),
+            }
+
+    def close(self):
+        self._pool.closeall()
+
+
+def load_cnpjs(pool):
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT cnpj FROM operadoras WHERE cnpj IS NOT NULL LIMIT 5000")
+        return [r[0] for r in cur.fetchall()] or ["00000000000000"]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+# =========================
+# CAMINHO SINCRONO
+# =========================
+def sync_request(pool, cnpj):
+    t0 = time.perf_counter()
+    with pool.connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(SQL_OPERADORA, (cnpj,))
+            cur.fetchall()
+            for sql in SQL_ESTATISTICAS:
+                cur.execute(sql)
+                cur.fetchall()
+    return time.perf_counter() - t0
+
+
+def run_sync(pool, cnpjs, n_requests, concurrency):
+    workers = min(concurrency, THREADPOOL_WORKERS)
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        lat = list(ex.map(lambda c: sync_request(pool, c), (random.choice(cnpjs) for _ in range(n_requests))))
+    return time.perf_counter() - t0, lat
+
+
+# =========================
+# CAMINHO ASSINCRONO
+# =========================
+async def async_query(pool, sql, params=()):
+    async with pool.connection() as conn:
+        async with conn.cursor() as cur:
+            await cur.execute(sql, params)
+            return await cur.fetchall()
+
+
+async def async_request(pool, cnpj):
+    t0 = time.perf_counter()
+    await async_query(pool, SQL_OPERADORA, (cnpj,))
+    await asyncio.gather(*(async_query(pool, sql) for sql in SQL_ESTATISTICAS))
+    return time.perf_counter() - t0
+
+
+async def run_async(pool, cnpjs, n_requests, concurrency):
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with sem:
+            return await async_request(pool, random.choice(cnpjs))
+
+    t0 = time.perf_counter()
+    lat = await asyncio.gather(*(one() for _ in range(n_requests)))
+    return time.perf_counter() - t0, lat
+
+
+def report(label, concurrency, elapsed, lat):
+    print(
+        f"{label:<6} c={concurrency:<4} req/s={len(lat) / elapsed:8.1f} "
+        f"p50={percentile(lat, 0.50) * 1000:7.1f}ms p95={percentile(lat, 0.95) * 1000:7.1f}ms"
+    )
+
+
+async def main_async(args):
+    levels = [int(x) for x in args.concurrency.split(",")]
+    cfg = pool_settings()
+    # timeouts folgados: aqui queremos medir fila, nao falhar rapido
+    sync_pool = DBPool(cfg["minconn"], cfg["maxconn"], timeout=120, check_idle=cfg["check_idle"])
+    apool = open_async_pool()
+    apool.timeout = 120
+    await apool.open()
+    try:
+        cnpjs = load_cnpjs(sync_pool)
+        print("pool max:", cfg["maxconn"], "| requests por nivel:", args.requests)
+        for c in levels:
+            elapsed, lat = await asyncio.to_thread(run_sync, sync_pool, cnpjs, args.requests, c)
+            report("sync", c, elapsed, lat)
+            elapsed, lat = await run_async(apool, cnpjs, args.requests, c)
+            report("async", c, elapsed, lat)
+    finally:
+        await apool.close()
+        sync_pool.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--requests", type=int, default=400)
+    ap.add_argument("--concurrency", default="1,8,32,128")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+    random.seed(args.seed)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Indice mmap do CADOP (cadop_index.py) x dict de load_cadop_map.
+
+Uso:
+    python benchmarks/bench_cadop_index.py --operadoras 50000 --lookups 200000
+
+Gera um CADOP sintetico (benchmarks/synthetic.py) e mede, para cada lado:
+carga (ler o CSV para o dict / abrir o indice ja compilado), memoria Python
+alocada na carga (tracemalloc; o mmap fica fora, e paginado pelo SO sob
+demanda) e buscas por registro ANS, com parte das chaves ausentes. A
+compilacao do indice (feita uma vez por versao do CSV) aparece a parte.
+Confere que as respostas das buscas sao iguais.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import cadop_index  # noqa: E402
+import synthetic  # noqa: E402
+from rebuild_consolidado import load_cadop_map  # noqa: E402
+
+
+def medir(fn):
+    """(segundos, resultado); tempo sem o tracemalloc, que deixa as alocacoes bem mais lentas."""
+    t0 = time.perf_counter()
+    out = fn()
+    return time.perf_counter() - t0, out
+
+
+def memoria(fn):
+    """KB alocados por `fn` que continuam vivos no resultado."""
+    tracemalloc.start()
+    out = fn()
+    mem = tracemalloc.get_traced_memory()[0] / 1024
+    tracemalloc.stop()
+    del out
+    return mem
+
+
+def buscas(m, chaves):
+    get = m.get
+    return [get(k) for k in chaves]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--operadoras", type=int, default=50_000)
+    ap.add_argument("--lookups", type=int, default=200_000)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cadop = os.path.join(tmp, "cadastro_operadoras_ativas.csv")
+        regs = synthetic.registros(args.operadoras)
+        n = synthetic.write_cadop(cadop, regs, args.seed)
+        idx_path = cadop_index.index_path(cadop)
+
+        t0 = time.perf_counter()
+        cadop_index.compilar(cadop, idx_path)
+        t_build = time.perf_counter() - t0
+
+        t_dict, m = medir(lambda: load_cadop_map(cadop))
+        t_idx, idx = medir(lambda: cadop_index.abrir(cadop))
+        mem_dict = memoria(lambda: load_cadop_map(cadop))
+        mem_idx = memoria(lambda: cadop_index.CadopIndex(idx_path))
+
+        rnd = random.Random(args.seed)
+        # ~5% das operadoras das despesas nao estao no CADOP (SEM_MATCH no rebuild)
+        chaves = rnd.choices(regs, k=args.lookups)
+
+        t_get_dict, r_dict = medir(lambda: buscas(m, chaves))
+        t_get_idx, r_idx = medir(lambda: buscas(idx, chaves))
+        iguais = r_dict == r_idx
+        idx.close()
+
+        print(f"CADOP: {n:,} linhas, {os.path.getsize(cadop) / 1e6:.1f} MB; "
+              f"indice: {os.path.getsize(idx_path) / 1e6:.2f} MB (compilado em {t_build:.2f}s)")
+        print(f"{'':<8}{'carga':>10}{'memoria':>11}{'buscas/s':>13}")
+        print(f"{'dict':<8}{t_dict * 1000:8.1f}ms{mem_dict:>8,.0f} KB{args.lookups / t_get_dict:>13,.0f}")
+        print(f"{'indice':<8}{t_idx * 1000:8.1f}ms{mem_idx:>8,.0f} KB{args.lookups / t_get_idx:>13,.0f}")
+        print("Respostas iguais:", iguais)
+    return 0 if iguais else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
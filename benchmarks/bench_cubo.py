@@ -0,0 +1,124 @@
+"""Consultas ao cubo (cubo.py) x GROUP BY em Python sobre as mesmas celulas.
+
+Uso:
+    python benchmarks/bench_cubo.py --operadoras 1500 --anos 3
+
+Gera celulas sinteticas (operadora x trimestre, cada uma com contagem, soma
+e M2), monta o cubo e roda consultas tipicas da API: top-5 operadoras, top
+UFs, totais por trimestre, fatias com filtros fora do agrupamento. Para
+cada consulta mede o tempo medio do cubo e de um agrupamento direto com
+dict + RunningStats.merge (o equivalente em memoria do GROUP BY a cada
+request) e confere que os resultados batem.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import synthetic  # noqa: E402
+from cubo import DIMS, Cubo, norm_valor  # noqa: E402
+from stats import RunningStats  # noqa: E402
+
+CONSULTAS = [
+    ("top5 operadoras", ("cnpj",), {}, 5),
+    ("top UFs", ("uf",), {}, 10),
+    ("por trimestre", ("ano", "trimestre"), {}, None),
+    ("top5 op. 1T SP/RJ", ("cnpj",), {"trimestre": ["1T"], "uf": ["SP", "RJ"]}, 5),
+    ("modalidade x UF ano", ("modalidade", "uf"), {"ano": ["2025"]}, 20),
+    ("total de uma operadora", (), {"cnpj": None}, None),
+]
+
+
+def gerar_celulas(operadoras, anos, seed):
+    rnd = random.Random(seed)
+    ufs = [u for u in synthetic.UFS if u.isupper()]
+    ops = []
+    for i, reg in enumerate(synthetic.registros(operadoras)):
+        ops.append((f"{int(reg) * 7919 % 10**14:014d}", f"OPERADORA {reg}",
+                    rnd.choice(ufs), rnd.choice(synthetic.MODALIDADES)))
+    celulas = []
+    for ano in range(2026 - anos, 2026):
+        for tri in ("1T", "2T", "3T", "4T"):
+            for cnpj, razao, uf, mod in ops:
+                if rnd.random() < 0.1:
+                    continue
+                vals = [rnd.lognormvariate(15, 1.5) for _ in range(rnd.randrange(1, 4))]
+                s = RunningStats(accuracy=None)
+                for v in vals:
+                    s.add(v)
+                celulas.append((ano, tri, uf, mod, cnpj, razao, s.count, s.total, s.m2))
+    return celulas
+
+
+def direto(celulas, por, filtros):
+    """GROUP BY em Python: filtra as celulas e combina os estados por grupo."""
+    idx = {d: i for i, d in enumerate(DIMS)}
+    alvo = {d: {norm_valor(d, v) for v in vs} for d, vs in filtros.items()}
+    grupos = {}
+    for c in celulas:
+        if any(norm_valor(d, c[idx[d]]) not in vs for d, vs in alvo.items()):
+            continue
+        chave = tuple(norm_valor(d, c[idx[d]]) for d in por)
+        s = RunningStats(accuracy=None)
+        s.count, s._sum, s.mean, s.m2 = c[6], c[7], c[7] / c[6], c[8]
+        g = grupos.get(chave)
+        if g is None:
+            grupos[chave] = s
+        else:
+            g.merge(s)
+    return grupos
+
+
+def iguais(res, grupos, por, limite):
+    ordenados = sorted(grupos.values(), key=lambda s: -s.total)
+    if limite:
+        ordenados = ordenados[:limite]
+    if len(ordenados) != len(res["linhas"]) or res["grupos"] != len(grupos):
+        return False
+    for row, s in zip(res["linhas"], ordenados):
+        if not math.isclose(row["total_despesas"], round(s.total, 2), rel_tol=1e-9):
+            return False
+        if row["contagem"] != s.count or not math.isclose(row["desvio_padrao"], round(s.std, 2), rel_tol=1e-6):
+            return False
+    return True
+
+
+def medir(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return (time.perf_counter() - t0) / repeat, out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--operadoras", type=int, default=1500)
+    ap.add_argument("--anos", type=int, default=3)
+    ap.add_argument("--repeat", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    celulas = gerar_celulas(args.operadoras, args.anos, args.seed)
+    cubo = Cubo(celulas, versao="bench")
+    print(f"{len(celulas):,} celulas; cubo montado em {cubo.segundos * 1000:.0f} ms, {cubo.nbytes / 1e6:.1f} MB")
+    print(f"{'consulta':<24}{'cubo':>10}{'direto':>11}{'ganho':>8}  iguais")
+
+    ok = True
+    for nome, por, filtros, limite in CONSULTAS:
+        filtros = {d: vs if vs is not None else [celulas[0][4]] for d, vs in filtros.items()}
+        t_cubo, res = medir(lambda: cubo.consultar(por, filtros, limite=limite), args.repeat)
+        t_dir, grupos = medir(lambda: direto(celulas, por, filtros), max(1, args.repeat // 10))
+        igual = iguais(res, grupos, por, limite)
+        ok = ok and igual
+        print(f"{nome:<24}{t_cubo * 1000:8.3f}ms{t_dir * 1000:9.1f}ms{t_dir / t_cubo:7.0f}x  {igual}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
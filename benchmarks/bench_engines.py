@@ -0,0 +1,78 @@
+"""Motor python x motor pandas do rebuild_consolidado.py num arquivo sintetico.
+
+Uso:
+    python benchmarks/bench_engines.py --rows 3000000
+
+Gera um arquivo trimestral no formato da ANS (sem header, latin-1, ';',
+valores com formatos de dinheiro misturados), agrega com os dois motores,
+confere que os agregados sao identicos e mostra tempo e linhas/s.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rebuild_consolidado as rc  # noqa: E402
+
+DESCRICOES = [
+    "EVENTOS/ SINISTROS CONHECIDOS OU AVISADOS",
+    "Sinistros a liquidar",
+    "DESPESAS ADMINISTRATIVAS",
+    "Receita de contraprestações",
+    "Eventos indenizáveis líquidos",
+]
+
+
+def money(rnd):
+    v = rnd.uniform(-1e5, 1e7)
+    kind = rnd.randrange(3)
+    if kind == 0:
+        return f"{v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    if kind == 1:
+        return f"{v:.2f}".replace(".", ",")
+    return f"{v:.2f}"
+
+
+def write_file(path, rows, seed):
+    rnd = random.Random(seed)
+    regs = [str(300000 + i) for i in range(1500)]
+    with open(path, "w", encoding="latin-1", newline="") as f:
+        for _ in range(rows):
+            cols = ["2025-01-01", rnd.choice(regs), "4111", rnd.choice(DESCRICOES), money(rnd)]
+            if rnd.random() < 0.8:
+                cols.append(money(rnd))
+            f.write(";".join(f'"{c}"' for c in cols) + "\n")
+
+
+def run(label, fn, files):
+    stats = {"total_rows": 0, "kept_rows": 0}
+    t0 = time.perf_counter()
+    agg = fn(files, stats)
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<8} {elapsed:8.2f}s {stats['total_rows'] / elapsed:12,.0f} linhas/s")
+    return agg
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=3_000_000)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "1T2025.csv")
+        print("Gerando", f"{args.rows:,}", "linhas em", path)
+        write_file(path, args.rows, args.seed)
+        files = [("1T", "2025", path)]
+
+        py = run("python", rc.aggregate, files)
+        pdx = run("pandas", rc.aggregate_pandas, files)
+        print("Agregados identicos:", py == pdx, f"({len(py)} grupos)")
+
+
+if __name__ == "__main__":
+    main()
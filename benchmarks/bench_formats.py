@@ -0,0 +1,113 @@
+"""Leitura do consolidado enriquecido: CSV x Arrow IPC (memory map).
+
+Uso:
+    python benchmarks/bench_formats.py --rows 1000000
+
+Gera um agregado sintetico, grava o enriquecido nos dois formatos com o
+write_outputs() do rebuild_consolidado.py e mede, para cada formato:
+- leitura pura das colunas que o main.py usa (Ano, Trimestre, ValorDespesas)
+- main.agrupar() completo (leitura + estatisticas)
+- prep_sql_import.iter_despesas() (leitura + normalizacao)
+Confere tambem que os resultados sao identicos.
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import colunar  # noqa: E402
+import main as agregacao  # noqa: E402
+import prep_sql_import as prep  # noqa: E402
+import rebuild_consolidado as rc  # noqa: E402
+
+UFS = ["SP", "RJ", "MG", "RS", "PR", "BA"]
+
+
+def make_agg(rows, seed):
+    rnd = random.Random(seed)
+    regs = [str(300000 + i) for i in range(max(1, rows // 20))]
+    cad_map = {
+        reg: {"cnpj": str(10**13 + i).zfill(14), "razao": f"OPERADORA SAÚDE {i}",
+              "modalidade": "Medicina de Grupo", "uf": rnd.choice(UFS)}
+        for i, reg in enumerate(regs)
+    }
+    agg = {}
+    while len(agg) < rows:
+        key = (rnd.choice(regs), rnd.randrange(2015, 2026), f"{rnd.randrange(1, 5)}T")
+        agg[key] = rnd.randrange(-10**6, 10**10)
+    return agg, cad_map
+
+
+def read_csv_cols(path, cols):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        reader = csv.DictReader(f, delimiter=";")
+        return sum(1 for row in reader if [row[c] for c in cols])
+
+
+def read_arrow_cols(path, cols):
+    return sum(1 for _ in colunar.iter_rows(path, cols))
+
+
+def consume_despesas(path):
+    # consome em streaming, como o write_csv/COPY; o crc confere a igualdade
+    crc = 0
+    for row in prep.iter_despesas(path):
+        crc = zlib.crc32("\x1f".join(row).encode(), crc)
+    return crc
+
+
+def timed(label, fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - t0
+    return label, elapsed, result
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    if not colunar.disponivel():
+        print("pyarrow nao instalado")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out_csv = os.path.join(tmp, "enriquecido.csv")
+        out_arrow = colunar.arrow_path(out_csv)
+        agg, cad_map = make_agg(args.rows, args.seed)
+        print("Gerando", f"{len(agg):,}", "linhas")
+        rc.write_outputs(agg, cad_map, None, out_csv, out_arrow)
+        print(f"Tamanho: CSV {os.path.getsize(out_csv) / 2**20:.1f} MB | "
+              f"Arrow {os.path.getsize(out_arrow) / 2**20:.1f} MB")
+
+        cols = ["Ano", "Trimestre", "ValorDespesas"]
+        keys = ["Ano", "Trimestre", "UF"]
+        casos = [
+            ("leitura (3 colunas)", read_csv_cols, (out_csv, cols), read_arrow_cols, (out_arrow, cols)),
+            ("main.agrupar", agregacao.agrupar, (out_csv, keys), agregacao.agrupar, (out_arrow, keys)),
+            ("prep.iter_despesas", consume_despesas, (out_csv,), consume_despesas, (out_arrow,)),
+        ]
+
+        print(f"{'caso':<22}{'csv':>10}{'arrow':>10}{'ganho':>8}  iguais")
+        for nome, fn_csv, a_csv, fn_arrow, a_arrow in casos:
+            _, t_csv, r_csv = timed(nome, fn_csv, *a_csv)
+            _, t_arrow, r_arrow = timed(nome, fn_arrow, *a_arrow)
+            if nome == "main.agrupar":
+                iguais = r_csv[1] == r_arrow[1] and {
+                    k: (s.count, s.total, s.std) for k, s in r_csv[0].items()
+                } == {k: (s.count, s.total, s.std) for k, s in r_arrow[0].items()}
+            else:
+                iguais = r_csv == r_arrow
+            print(f"{nome:<22}{t_csv:9.2f}s{t_arrow:9.2f}s{t_csv / t_arrow:7.1f}x  {iguais}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Tempo de serializacao JSON por 1k linhas: caminho antigo x caminho rapido.
+
+Uso:
+    python benchmarks/bench_json.py --rows 200 --repeat 200
+
+Antigo: linhas como dict com Decimal (RealDictRow/dict_row) passando pelo
+`jsonable_encoder` do FastAPI e pelo `json.dumps` do JSONResponse.
+Rapido: linhas como tupla com NUMERIC ja em float, `dict(zip(...))` e
+`orjson.dumps` (o que `api.fetch_all` + `FastJSONResponse` fazem).
+Nao precisa de banco: os payloads sao gerados com o formato das consultas
+de `list_operadoras` e `get_despesas_operadora`.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson  # noqa: E402
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+
+from api import _json_default  # noqa: E402
+
+OPERADORA_COLS = ["cnpj", "registro_ans", "razao_social", "modalidade", "uf"]
+DESPESA_COLS = ["ano", "trimestre", "total_despesas"]
+
+
+def operadora_tuples(n, rnd):
+    mods = ["Medicina de Grupo", "Cooperativa Médica", "Autogestão", "Odontologia de Grupo"]
+    return [
+        (
+            str(rnd.randrange(10**13, 10**14)),
+            str(rnd.randrange(300000, 430000)),
+            f"OPERADORA DE SAÚDE {i} LTDA",
+            rnd.choice(mods),
+            rnd.choice(["SP", "RJ", "MG", "RS", "PR"]),
+        )
+        for i in range(n)
+    ]
+
+
+def despesa_tuples(n, rnd):
+    return [
+        (2020 + i // 4, f"{i % 4 + 1}T", Decimal(f"{rnd.uniform(1e3, 1e9):.2f}"))
+        for i in range(n)
+    ]
+
+
+def old_path(cols, rows):
+    dict_rows = [dict(zip(cols, r)) for r in rows]
+    content = {"data": dict_rows, "page": 1, "limit": len(rows), "total": 1000}
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def fast_path(cols, rows):
+    content = {"data": [dict(zip(cols, r)) for r in rows], "page": 1, "limit": len(rows), "total": 1000}
+    return orjson.dumps(content, default=_json_default)
+
+
+def as_float_rows(rows):
+    # o FloatLoader entrega NUMERIC como float ja na leitura do banco
+    return [tuple(float(v) if isinstance(v, Decimal) else v for v in r) for r in rows]
+
+
+def bench(fn, cols, rows, repeat):
+    fn(cols, rows)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn(cols, rows)
+    elapsed = time.perf_counter() - t0
+    return elapsed / repeat / len(rows) * 1000 * 1000
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=200, help="linhas por payload (200 = maior pagina)")
+    ap.add_argument("--repeat", type=int, default=200)
+    args = ap.parse_args(argv)
+    rnd = random.Random(42)
+
+    cases = [
+        ("list_operadoras", OPERADORA_COLS, operadora_tuples(args.rows, rnd)),
+        ("get_despesas_operadora", DESPESA_COLS, despesa_tuples(args.rows, rnd)),
+    ]
+    print(f"{'payload':<24} {'antigo ms/1k':>13} {'rapido ms/1k':>13} {'ganho':>7}")
+    for name, cols, rows in cases:
+        old = bench(old_path, cols, rows, args.repeat)
+        new = bench(fast_path, cols, as_float_rows(rows), args.repeat)
+        print(f"{name:<24} {old:13.3f} {new:13.3f} {old / new:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
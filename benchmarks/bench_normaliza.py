@@ -0,0 +1,138 @@
+"""Throughput das funcoes do normaliza.py x implementacoes anteriores dos scripts.
+
+Uso:
+    python benchmarks/bench_normaliza.py --n 500000
+
+Entradas sinteticas no formato dos arquivos da ANS: CNPJ com e sem mascara
+("12.345.678/0001-90" / "12345678000190"), registro ANS e valores em reais
+("1.234.567,89", "1234,56", "1234.56", vazio). Para cada funcao mede a
+versao antiga (copiada abaixo) e a nova, confere que os resultados sao
+iguais e mostra milhoes de valores por segundo. Os casos "lote" comparam a
+chamada escalar por linha com normalize_column/iter_normalized, que
+reaproveitam o resultado de valores repetidos.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import normaliza as nz  # noqa: E402
+
+
+# =========================
+# VERSOES ANTERIORES
+# =========================
+def old_only_digits(s):
+    return "".join(ch for ch in nz.norm_text(s) if ch.isdigit())
+
+
+def old_norm_cnpj(s):
+    d = old_only_digits(s)
+    return d.zfill(14) if d else ""
+
+
+def old_norm_money(s):
+    if s is None:
+        return ""
+    t = str(s).strip()
+    if not t:
+        return ""
+    t = t.replace(" ", "")
+    if t.count(",") == 1 and t.count(".") >= 1:
+        t = t.replace(".", "").replace(",", ".")
+    elif t.count(",") == 1 and t.count(".") == 0:
+        t = t.replace(",", ".")
+    return t
+
+
+def old_money_to_cents(s):
+    t = old_norm_money(s)
+    try:
+        v = float(t) if t else 0.0
+    except Exception:
+        v = 0.0
+    return int(round(v * 100))
+
+
+# =========================
+# ENTRADAS
+# =========================
+def make_cnpjs(n, rnd, distinct):
+    base = [str(rnd.randrange(10**13, 10**14)) for _ in range(distinct)]
+    out = []
+    for _ in range(n):
+        d = rnd.choice(base)
+        if rnd.random() < 0.5:
+            d = f"{d[:2]}.{d[2:5]}.{d[5:8]}/{d[8:12]}-{d[12:]}"
+        out.append(d)
+    return out
+
+
+def make_money(n, rnd):
+    out = []
+    for _ in range(n):
+        c = rnd.randrange(-10**6, 10**10)
+        s = f"{abs(c) // 100:,}".replace(",", ".") + f",{abs(c) % 100:02d}"
+        if c < 0:
+            s = "-" + s
+        k = rnd.random()
+        if k < 0.2:
+            s = s.replace(".", "")
+        elif k < 0.3:
+            s = f"{c / 100:.2f}"
+        elif k < 0.35:
+            s = ""
+        out.append(s)
+    return out
+
+
+def timed(fn, values):
+    t0 = time.perf_counter()
+    out = fn(values)
+    return time.perf_counter() - t0, out
+
+
+def scalar(fn):
+    return lambda values: [fn(v) for v in values]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--n", type=int, default=500_000)
+    ap.add_argument("--distinct", type=int, default=1500,
+                    help="operadoras distintas (CNPJs/registros repetidos entre linhas)")
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    rnd = random.Random(args.seed)
+    cnpjs = make_cnpjs(args.n, rnd, args.distinct)
+    regs = [str(300000 + rnd.randrange(args.distinct)) for _ in range(args.n)]
+    money = make_money(args.n, rnd)
+    rows = [[c, m] for c, m in zip(cnpjs, money)]
+
+    casos = [
+        ("only_digits (registro)", scalar(old_only_digits), scalar(nz.only_digits), regs),
+        ("norm_cnpj", scalar(old_norm_cnpj), scalar(nz.norm_cnpj), cnpjs),
+        ("norm_money", scalar(old_norm_money), scalar(nz.norm_money), money),
+        ("money_to_cents", scalar(old_money_to_cents), scalar(nz.money_to_cents), money),
+        ("norm_cnpj lote", scalar(old_norm_cnpj),
+         lambda v: nz.normalize_column(v, nz.norm_cnpj, {}), cnpjs),
+        ("linhas cnpj+valor", lambda rs: [[old_norm_cnpj(c), old_norm_money(m)] for c, m in rs],
+         lambda rs: list(nz.iter_normalized(rs, [0, 1], [nz.norm_cnpj, nz.norm_money], memo_cols=(0,))),
+         rows),
+    ]
+
+    print(f"{args.n:,} valores por caso ({args.distinct:,} CNPJs distintos)")
+    print(f"{'caso':<24}{'antes':>10}{'depois':>10}{'ganho':>8}  iguais")
+    for nome, antes, depois, valores in casos:
+        t_old, r_old = timed(antes, valores)
+        t_new, r_new = timed(depois, valores)
+        print(f"{nome:<24}{args.n / t_old / 1e6:7.2f}M/s{args.n / t_new / 1e6:7.2f}M/s"
+              f"{t_old / t_new:7.1f}x  {r_old == r_new}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Pipeline completo (rebuild -> main -> prep) sobre dados sinteticos, com baseline.
+
+Uso:
+    python benchmarks/bench_pipeline.py --rows 1000000
+    python benchmarks/bench_pipeline.py --rows 1000000 --save-baseline
+    python benchmarks/bench_pipeline.py --rows 1000000 --data /tmp/ans_fake --repeat 3
+
+Gera os arquivos com benchmarks/synthetic.py (ou reaproveita `--data`, se ja
+tiver os arquivos) e roda cada script como processo separado, como no uso
+real, sempre com `--full`. Para cada etapa mede tempo de parede, linhas/s e
+pico de memoria do processo (os.wait4, inclui os workers). Com `--repeat`
+fica a melhor execucao de cada etapa.
+
+O resultado e comparado com o baseline salvo (`--baseline`, gravado com
+`--save-baseline`) quando os parametros dos dados sao os mesmos; uma etapa
+mais lenta ou com mais memoria do que `--tolerance` marca REGRESSAO e o
+script termina com status 1. O baseline depende da maquina: grave-o na
+mesma maquina em que a comparacao vai rodar.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+import synthetic  # noqa: E402
+
+BASELINE = os.path.join(HERE, "pipeline_baseline.json")
+
+
+def run_measured(cmd, log_path):
+    """Roda `cmd` e devolve (segundos, pico de RSS em MB ou None, status)."""
+    with open(log_path, "w", encoding="utf-8") as log:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+        if hasattr(os, "wait4"):
+            _, status, usage = os.wait4(proc.pid, 0)
+            elapsed = time.perf_counter() - t0
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            # Linux reporta em KB, macOS em bytes
+            rss = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+        else:  # Windows
+            proc.wait()
+            elapsed = time.perf_counter() - t0
+            rss = None
+    return elapsed, rss, proc.returncode
+
+
+def count_lines(path, header=True):
+    with open(path, "rb") as f:
+        n = sum(1 for _ in f)
+    return n - 1 if header and n else n
+
+
+def stages(info, out_dir):
+    """(nome, comando, linhas de entrada) de cada etapa; as linhas sao calculadas depois da anterior."""
+    py = sys.executable
+    enr = os.path.join(out_dir, "consolidado_despesas_enriquecido.csv")
+    agg = os.path.join(out_dir, "despesas_agregadas.csv")
+    return [
+        ("rebuild", [
+            py, "rebuild_consolidado.py", "--in-dir", info["in_dir"], "--cadop", info["cadop"],
+            "--out-cons", os.path.join(out_dir, "consolidado_despesas.csv"), "--out-enr", enr, "--full",
+        ], lambda: info["rows"]),
+        ("main", [
+            py, "main.py", "--input", enr, "--output", agg, "--group-by", "RazaoSocial,UF", "--full",
+        ], lambda: count_lines(enr)),
+        ("prep", [
+            py, "prep_sql_import.py", "--sql-dir", os.path.join(out_dir, "sql_import"),
+            "--cadop", info["cadop"], "--despesas", enr, "--agregadas", agg, "--full",
+        ], lambda: info["cadop_rows"] + count_lines(enr) + count_lines(agg)),
+    ]
+
+
+def load_baseline(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def compare(result, base, tolerance):
+    """Variacao de linhas/s e memoria por etapa em relacao ao baseline; lista as regressoes."""
+    linhas = {}
+    regressoes = []
+    for nome, atual in result["stages"].items():
+        ref = (base or {}).get("stages", {}).get(nome)
+        if not ref:
+            linhas[nome] = ""
+            continue
+        vel = atual["rows_per_s"] / ref["rows_per_s"] - 1
+        txt = f"{vel:+7.1%} vel."
+        if atual.get("peak_rss_mb") and ref.get("peak_rss_mb"):
+            mem = atual["peak_rss_mb"] / ref["peak_rss_mb"] - 1
+            txt += f" {mem:+7.1%} mem."
+        else:
+            mem = 0.0
+        if vel < -tolerance or mem > tolerance:
+            txt += "  REGRESSAO"
+            regressoes.append(nome)
+        linhas[nome] = txt
+    return linhas, regressoes
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--rows", type=int, default=1_000_000, help="linhas trimestrais no total")
+    ap.add_argument("--quarters", type=int, default=4)
+    ap.add_argument("--operadoras", type=int, default=1500)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--data", default=None,
+                    help="pasta dos dados sinteticos (reaproveitada se ja gerada; padrao: temporaria)")
+    ap.add_argument("--repeat", type=int, default=1, help="execucoes por etapa (fica a melhor)")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--save-baseline", action="store_true", help="grava o resultado como novo baseline")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="variacao aceita antes de marcar regressao")
+    args = ap.parse_args(argv)
+
+    quarters = synthetic.parse_quarters(None, args.quarters)
+    params = {"rows": args.rows, "quarters": quarters, "operadoras": args.operadoras, "seed": args.seed}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data = args.data or os.path.join(tmp, "dados")
+        info = synthetic.load_info(data) if args.data else None
+        if info is None or info["params"] != params:
+            t0 = time.perf_counter()
+            info = synthetic.gerar(data, args.rows, quarters, args.operadoras, args.seed)
+            print(f"Dados gerados em {data} ({time.perf_counter() - t0:.1f}s)")
+        else:
+            print("Dados reaproveitados:", data)
+        print(f"{info['rows']:,} linhas em {len(quarters)} trimestres, CADOP com {info['cadop_rows']:,}\n")
+
+        out_dir = os.path.join(tmp, "output")
+        os.makedirs(out_dir, exist_ok=True)
+        result = {"params": params, "python": sys.version.split()[0], "stages": {}}
+        total = 0.0
+        for nome, cmd, rows_of in stages(info, out_dir):
+            melhor = None
+            for _ in range(max(1, args.repeat)):
+                log_path = os.path.join(tmp, f"{nome}.log")
+                elapsed, rss, status = run_measured(cmd, log_path)
+                if status != 0:
+                    with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+                        print(f.read())
+                    print(f"ERRO: etapa {nome} terminou com status {status}")
+                    return 1
+                if melhor is None or elapsed < melhor[0]:
+                    melhor = (elapsed, rss)
+            elapsed, rss = melhor
+            rows = rows_of()
+            total += elapsed
+            result["stages"][nome] = {
+                "seconds": round(elapsed, 3),
+                "rows": rows,
+                "rows_per_s": round(rows / elapsed if elapsed else 0.0, 1),
+                "peak_rss_mb": round(rss, 1) if rss is not None else None,
+            }
+        result["total_seconds"] = round(total, 3)
+
+    base = load_baseline(args.baseline)
+    if base is not None and base.get("params") != params:
+        print("Baseline com outros parametros de dados, sem comparacao:", args.baseline)
+        base = None
+    linhas, regressoes = compare(result, base, args.tolerance)
+
+    print(f"{'etapa':<10}{'tempo':>9}{'linhas':>13}{'linhas/s':>13}{'pico RSS':>11}  baseline")
+    for nome, st in result["stages"].items():
+        rss = f"{st['peak_rss_mb']:.0f} MB" if st["peak_rss_mb"] is not None else "-"
+        print(f"{nome:<10}{st['seconds']:8.2f}s{st['rows']:>13,}{st['rows_per_s']:>13,.0f}{rss:>11}  {linhas[nome]}")
+    print(f"{'total':<10}{result['total_seconds']:8.2f}s")
+
+    if args.save_baseline:
+        tmp_path = args.baseline + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        os.replace(tmp_path, args.baseline)
+        print("Baseline gravado:", args.baseline)
+    if regressoes:
+        print("Regressao em:", ", ".join(regressoes))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""Gerador deterministico de dados sinteticos no formato da ANS.
+
+Uso:
+    python benchmarks/synthetic.py --dest /tmp/ans_fake --rows 1000000 --quarters 4
+
+Grava, sob `--dest`, a mesma arvore que os scripts esperam em BASE_DIR:
+- output/Despesas_Eventos_Sinistros/<N>T<AAAA>.csv: posicional, sem header,
+  latin-1, ';', parte das linhas com aspas, valores com formatos misturados
+  ("1.234.567,89", "1234567,89", "1234567.89", negativos, valor2 vazio)
+- data/cadastro_operadoras_ativas.csv: CADOP com o header real, latin-1
+
+Mesma semente e mesmos parametros geram arquivos identicos byte a byte; cada
+trimestre tem sua propria semente, entao gerar 2 ou 8 trimestres nao muda
+o conteudo dos primeiros. Escreve em blocos (memoria constante), o que
+permite de 10 mil a dezenas de milhoes de linhas.
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+DESP_DIRNAME = os.path.join("output", "Despesas_Eventos_Sinistros")
+CADOP_NAME = os.path.join("data", "cadastro_operadoras_ativas.csv")
+INFO_NAME = "synthetic.json"
+
+CADOP_HEADER = [
+    "REGISTRO_OPERADORA", "CNPJ", "Razao_Social", "Nome_Fantasia", "Modalidade", "Logradouro",
+    "Numero", "Complemento", "Bairro", "Cidade", "UF", "CEP", "DDD", "Telefone", "Fax",
+    "Endereco_eletronico", "Representante", "Cargo_Representante", "Regiao_de_Comercializacao",
+    "Data_Registro_ANS",
+]
+
+# (descricao, peso): cerca de metade das linhas casa com eventos/sinistros
+DESCRICOES = [
+    ("EVENTOS/ SINISTROS CONHECIDOS OU AVISADOS DE ASSISTÊNCIA A SAÚDE MEDICO HOSPITALAR", 20),
+    ("Eventos/Sinistros Conhecidos ou Avisados", 10),
+    ("SINISTROS A LIQUIDAR", 8),
+    ("Eventos indenizáveis líquidos", 7),
+    ("PROVISÃO DE EVENTOS/SINISTROS A LIQUIDAR PARA OUTROS PRESTADORES", 5),
+    ("DESPESAS ADMINISTRATIVAS", 15),
+    ("Receita de contraprestações", 15),
+    ("DESPESAS DE COMERCIALIZAÇÃO", 10),
+    ("Tributos Diretos de Operações com Planos de Assistência à Saúde", 10),
+]
+CONTAS = ["41", "411", "4111", "41111", "411111", "31", "311", "46", "461"]
+MODALIDADES = [
+    "Medicina de Grupo", "Cooperativa Médica", "Odontologia de Grupo", "Autogestão",
+    "Seguradora Especializada em Saúde", "Filantropia", "Cooperativa Odontológica",
+]
+UFS = ["SP", "RJ", "MG", "RS", "PR", "SC", "BA", "PE", "CE", "GO", "DF", "ES", "PA", "sp", "rj"]
+SUFIXOS = ["LTDA", "S.A.", "S/A", "COOPERATIVA DE TRABALHO MÉDICO", "ASSISTÊNCIA MÉDICA LTDA"]
+
+MONEY_POOL = 1 << 16
+BLOCK = 50_000
+
+
+def money(rnd):
+    """Valor em um dos formatos vistos nos arquivos da ANS."""
+    v = rnd.lognormvariate(10, 2.5) * (-1 if rnd.random() < 0.05 else 1)
+    kind = rnd.random()
+    if kind < 0.5:
+        s = f"{v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    elif kind < 0.8:
+        s = f"{v:.2f}".replace(".", ",")
+    elif kind < 0.95:
+        s = f"{v:.2f}"
+    else:
+        s = f"{v:.0f}"
+    return s
+
+
+def registros(n_operadoras):
+    return [str(300000 + i * 7) for i in range(n_operadoras)]
+
+
+def split_rows(rows, quarters):
+    base, extra = divmod(rows, len(quarters))
+    return [base + (1 if i < extra else 0) for i in range(len(quarters))]
+
+
+def parse_quarters(value, count=None):
+    """Lista de trimestres: `value` como "1T2024,2T2024" ou, com `count`, os ultimos ate 4T2025."""
+    if count:
+        out = []
+        ano, tri = 2025, 4
+        for _ in range(count):
+            out.append(f"{tri}T{ano}")
+            tri -= 1
+            if tri == 0:
+                ano, tri = ano - 1, 4
+        return out[::-1]
+    return [q.strip().upper() for q in value.split(",") if q.strip()]
+
+
+def write_quarter(path, quarter, rows, regs, seed):
+    rnd = random.Random(f"{seed}:{quarter}")
+    tri, ano = int(quarter[0]), int(quarter[2:])
+    data = f"{ano}-{3 * (tri - 1) + 1:02d}-01"
+    pool = [money(rnd) for _ in range(MONEY_POOL)]
+    descs = [d for d, _ in DESCRICOES]
+    pesos = [w for _, w in DESCRICOES]
+    # poucas operadoras concentram a maior parte das linhas, como nos arquivos reais
+    reg_pesos = [1.0 / (i + 1) ** 0.6 for i in range(len(regs))]
+
+    written = 0
+    with open(path, "w", encoding="latin-1", newline="") as f:
+        while written < rows:
+            n = min(BLOCK, rows - written)
+            rs = rnd.choices(regs, reg_pesos, k=n)
+            ds = rnd.choices(descs, pesos, k=n)
+            cs = rnd.choices(CONTAS, k=n)
+            v1 = rnd.choices(pool, k=n)
+            v2 = rnd.choices(pool, k=n)
+            lines = []
+            for i in range(n):
+                x = rnd.random()
+                cols = [data, rs[i], cs[i], ds[i], v1[i]]
+                if x < 0.8:
+                    cols.append(v2[i])
+                elif x < 0.85:
+                    cols.append("")
+                if x < 0.3 or x > 0.97:
+                    lines.append('"' + '";"'.join(cols) + '"\n')
+                else:
+                    lines.append(";".join(cols) + "\n")
+            f.write("".join(lines))
+            written += n
+    return written
+
+
+def write_cadop(path, regs, seed, cobertura=0.95):
+    """CADOP com `cobertura` dos registros usados nas despesas e alguns registros sem despesas."""
+    rnd = random.Random(f"{seed}:cadop")
+    presentes = [r for r in regs if rnd.random() < cobertura]
+    extras = [str(900000 + i) for i in range(max(1, len(regs) // 20))]
+    with open(path, "w", encoding="latin-1", newline="") as f:
+        f.write(";".join(f'"{c}"' for c in CADOP_HEADER) + "\n")
+        for reg in presentes + extras:
+            n = int(reg)
+            razao = f"OPERADORA DE SAÚDE {n} {rnd.choice(SUFIXOS)}"
+            cols = [
+                reg, f"{(n * 7919 + 11) % 10**14:014d}", razao, f"SAÚDE {n}",
+                rnd.choice(MODALIDADES), "RUA DAS FLORES", str(rnd.randrange(1, 3000)), "",
+                "CENTRO", "SÃO PAULO", rnd.choice(UFS), f"{rnd.randrange(10**7, 10**8)}",
+                "11", str(rnd.randrange(10**7, 10**8)), "", f"contato{n}@exemplo.com.br",
+                "FULANO DE TAL", "DIRETOR", str(rnd.randrange(1, 7)), "2001-01-01",
+            ]
+            f.write(";".join(f'"{c}"' for c in cols) + "\n")
+    return len(presentes) + len(extras)
+
+
+def gerar(dest, rows, quarters, operadoras=1500, seed=42):
+    """Gera a arvore em `dest` e grava caminhos/contagens em `dest`/synthetic.json (usado pelo bench_pipeline.py)."""
+    desp_dir = os.path.join(dest, DESP_DIRNAME)
+    cadop = os.path.join(dest, CADOP_NAME)
+    os.makedirs(desp_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(cadop), exist_ok=True)
+
+    regs = registros(operadoras)
+    files = {}
+    # trimestres de uma geracao anterior com outros parametros seriam lidos junto pelo rebuild
+    nomes = {f"{q}.csv" for q in quarters}
+    for name in os.listdir(desp_dir):
+        if name.endswith(".csv") and name not in nomes:
+            os.remove(os.path.join(desp_dir, name))
+    for quarter, n in zip(quarters, split_rows(rows, quarters)):
+        path = os.path.join(desp_dir, f"{quarter}.csv")
+        files[path] = write_quarter(path, quarter, n, regs, seed)
+    cadop_rows = write_cadop(cadop, regs, seed)
+    info = {
+        "dest": dest,
+        "in_dir": desp_dir,
+        "cadop": cadop,
+        "rows": sum(files.values()),
+        "cadop_rows": cadop_rows,
+        "files": files,
+        "params": {"rows": rows, "quarters": quarters, "operadoras": operadoras, "seed": seed},
+    }
+    with open(os.path.join(dest, INFO_NAME), "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=1)
+    return info
+
+
+def load_info(dest):
+    """Info gravada por gerar() em `dest`, ou None se os dados nao existem (ou mudaram de lugar)."""
+    try:
+        with open(os.path.join(dest, INFO_NAME), "r", encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not all(os.path.exists(p) for p in [info["cadop"], *info["files"]]):
+        return None
+    return info
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--dest", required=True, help="pasta raiz (recebe output/ e data/)")
+    ap.add_argument("--rows", type=int, default=1_000_000, help="linhas somando todos os trimestres")
+    ap.add_argument("--quarters", type=int, default=4, help="quantidade de trimestres ate 4T2025")
+    ap.add_argument("--trimestres", default=None, help="lista explicita, ex.: 1T2024,2T2024 (ignora --quarters)")
+    ap.add_argument("--operadoras", type=int, default=1500)
+    ap.add_argument("--seed", type=int, default=42)
+    args = ap.parse_args(argv)
+
+    quarters = parse_quarters(args.trimestres) if args.trimestres else parse_quarters(None, args.quarters)
+    t0 = time.perf_counter()
+    info = gerar(args.dest, args.rows, quarters, args.operadoras, args.seed)
+    elapsed = time.perf_counter() - t0
+    for path, n in info["files"].items():
+        print(f"{n:>12,}  {path}")
+    print(f"{info['cadop_rows']:>12,}  {info['cadop']}")
+    print(f"Tempo: {elapsed:.2f}s ({info['rows'] / elapsed if elapsed else 0:,.0f} linhas/s)")
+    return info
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""Indice binario do CADOP, mapeado em memoria.
+
+O CSV do cadastro de operadoras e compilado uma vez para
+`<pasta do CADOP>/.incremental/cadop.idx` e recompilado so quando o
+arquivo de origem muda (tamanho/mtime e, se preciso, sha256). Layout:
+
+- cabecalho fixo (HEADER) com a impressao do CSV e a posicao das secoes
+- registros de largura fixa (RECORD), na ordem do CSV: posicao/tamanho do
+  registro ANS, razao social e CNPJ no heap de textos, e ids de
+  modalidade/UF nas tabelas internadas
+- chaves por registro ANS (so digitos, largura fixa, ordenadas; a ultima
+  linha de um registro repetido vence, como no dict do rebuild) e por CNPJ
+  (14 digitos, ordenadas), cada uma com o numero do registro
+- heap de textos UTF-8 e as tabelas de modalidade/UF (JSON)
+
+Abrir o indice le so o cabecalho e as tabelas internadas; a busca e
+binaria direto no mmap.
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+
+from manifest import file_sha256, state_dir_for
+from normaliza import (
+    csv_rows,
+    find_col,
+    header_index,
+    iter_normalized,
+    norm_cnpj,
+    norm_text,
+    only_digits,
+    sniff_delim,
+)
+
+INDEX_NAME = "cadop.idx"
+MAGIC = b"CADOPIX1"
+VERSION = 1
+
+# magic, versao, linhas, chaves de registro, chaves de CNPJ, largura da chave de registro,
+# tamanho e mtime_ns do CSV, sha256 do CSV, offsets das secoes, tamanho das tabelas
+HEADER = struct.Struct("<8sIIIIIQq32s6QI")
+# registro (off, len), razao (off, len), cnpj (off, len), modalidade, uf
+RECORD = struct.Struct("<IHIHIHHH")
+REC_NO = struct.Struct("<I")
+CNPJ_W = 14
+# tamanhos no RECORD sao uint16: ate 4 bytes UTF-8 por caractere
+MAX_CHARS = 0xFFFF // 4
+
+REGISTRO_COLS = ["registro_operadora", "registro", "registro_ans", "registro ans"]
+RAZAO_COLS = ["razao_social", "razao social", "razao"]
+
+
+def _upper(s):
+    return norm_text(s).upper()
+
+
+def ler_cadop(path):
+    """(header, linhas) do CSV; `linhas` gera [registro, cnpj, razao, modalidade, uf] normalizados.
+
+    `linhas` e None quando nao ha coluna de registro.
+    """
+    reader = csv_rows(path, "latin-1", sniff_delim(path))
+    header = next(reader, [])
+    hm = header_index(header)
+    idxs = [
+        find_col(hm, REGISTRO_COLS),
+        find_col(hm, ["cnpj"]),
+        find_col(hm, RAZAO_COLS),
+        find_col(hm, ["modalidade"]),
+        find_col(hm, ["uf"]),
+    ]
+    if idxs[0] is None:
+        reader.close()
+        return header, None
+    fns = [norm_text, norm_cnpj, norm_text, norm_text, _upper]
+    return header, iter_normalized(reader, idxs, fns, memo_cols=(3, 4))
+
+
+def index_path(cadop):
+    return os.path.join(state_dir_for(cadop), INDEX_NAME)
+
+
+# =========================
+# COMPILACAO
+# =========================
+def compilar(cadop, dest):
+    """Compila o CSV `cadop` em `dest` (escrita atomica). Devolve o numero de linhas."""
+    st = os.stat(cadop)
+    sha = file_sha256(cadop)
+    _, linhas = ler_cadop(cadop)
+    if linhas is None:
+        raise ValueError(f"CADOP sem coluna de registro: {cadop}")
+
+    heap = bytearray()
+    textos = {}
+    tabelas = {"modalidade": [], "uf": []}
+    ids = {"modalidade": {}, "uf": {}}
+
+    def texto(s):
+        s = s[:MAX_CHARS]
+        ref = textos.get(s)
+        if ref is None:
+            b = s.encode("utf-8")
+            ref = textos[s] = (len(heap), len(b))
+            heap.extend(b)
+        return ref
+
+    def interna(tabela, s):
+        i = ids[tabela].get(s)
+        if i is None:
+            i = ids[tabela][s] = len(tabelas[tabela])
+            tabelas[tabela].append(s)
+        return i
+
+    records = bytearray()
+    por_reg = {}
+    por_cnpj = []
+    n = 0
+    for reg_raw, cnpj, razao, mod, uf in linhas:
+        r_off, r_len = texto(reg_raw)
+        z_off, z_len = texto(razao)
+        c_off, c_len = texto(cnpj)
+        records += RECORD.pack(r_off, r_len, z_off, z_len, c_off, c_len,
+                               interna("modalidade", mod), interna("uf", uf))
+        reg = only_digits(reg_raw)
+        if reg:
+            por_reg[reg] = n
+        if len(cnpj) == CNPJ_W:
+            por_cnpj.append((cnpj.encode("ascii"), n))
+        n += 1
+
+    reg_w = max((len(k) for k in por_reg), default=1)
+    chaves = sorted((k.encode("ascii").ljust(reg_w, b"\0"), i) for k, i in por_reg.items())
+    por_cnpj.sort()
+    tab = json.dumps(tabelas, ensure_ascii=False).encode("utf-8")
+
+    partes = [
+        bytes(records),
+        b"".join(k for k, _ in chaves),
+        b"".join(REC_NO.pack(i) for _, i in chaves),
+        b"".join(k for k, _ in por_cnpj),
+        b"".join(REC_NO.pack(i) for _, i in por_cnpj),
+        bytes(heap),
+    ]
+    offsets = []
+    pos = HEADER.size
+    for p in partes:
+        offsets.append(pos)
+        pos += len(p)
+    offsets_tab = pos
+
+    head = HEADER.pack(MAGIC, VERSION, n, len(chaves), len(por_cnpj), reg_w, st.st_size, st.st_mtime_ns,
+                       bytes.fromhex(sha), *offsets, len(tab))
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    # nome temporario por processo: duas etapas do pipeline podem compilar ao mesmo tempo
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(head)
+        for p in partes:
+            f.write(p)
+        f.write(tab)
+    assert offsets_tab + len(tab) == os.path.getsize(tmp)
+    os.replace(tmp, dest)
+    return n
+
+
+def _cabecalho(path):
+    try:
+        with open(path, "rb") as f:
+            data = f.read(HEADER.size)
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    h = HEADER.unpack(data)
+    if h[0] != MAGIC or h[1] != VERSION:
+        return None
+    return h
+
+
+def atualizado(cadop, path):
+    """True se o indice em `path` corresponde ao CSV atual (sha256 so quando tamanho/mtime mudam)."""
+    h = _cabecalho(path)
+    if h is None:
+        return False
+    st = os.stat(cadop)
+    if (h[6], h[7]) == (st.st_size, st.st_mtime_ns):
+        return True
+    if h[6] != st.st_size or h[8].hex() != file_sha256(cadop):
+        return False
+    # mesmo conteudo com outro mtime (copia, checkout): so atualiza a impressao
+    with open(path, "r+b") as f:
+        f.write(HEADER.pack(*h[:7], st.st_mtime_ns, *h[8:]))
+    return True
+
+
+def abrir(cadop, path=None):
+    """Indice do `cadop`, recompilado se o CSV mudou. None se o CSV nao existe."""
+    if not os.path.exists(cadop):
+        return None
+    path = path or index_path(cadop)
+    if not atualizado(cadop, path):
+        compilar(cadop, path)
+    return CadopIndex(path)
+
+
+# =========================
+# LEITURA
+# =========================
+class _Chaves:
+    """Sequencia somente leitura das chaves de largura fixa (para o bisect, que roda em C)."""
+
+    def __init__(self, mm, off, width, n):
+        self.mm = mm
+        self.off = off
+        self.width = width
+        self.n = n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        p = self.off + i * self.width
+        return self.mm[p:p + self.width]
+
+
+class CadopIndex:
+    """Consulta por registro ANS (`get`, como o dict de load_cadop_map) e por CNPJ (`por_cnpj`)."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        h = HEADER.unpack_from(self._mm, 0)
+        (_, _, self.n, n_reg, n_cnpj, reg_w, _, _, _,
+         self._rec, regk, self._regr, cnpjk, self._cnpjr, self._heap, tab_len) = h
+        self._reg = _Chaves(self._mm, regk, reg_w, n_reg)
+        self._cnpj = _Chaves(self._mm, cnpjk, CNPJ_W, n_cnpj)
+        self._reg_w = reg_w
+        tab_off = len(self._mm) - tab_len
+        tabelas = json.loads(self._mm[tab_off:].decode("utf-8"))
+        self._mod = tabelas["modalidade"]
+        self._uf = tabelas["uf"]
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._reg)
+
+    def _texto(self, off, n):
+        p = self._heap + off
+        return self._mm[p:p + n].decode("utf-8")
+
+    def _linha(self, i):
+        r_off, r_len, z_off, z_len, c_off, c_len, mod, uf = RECORD.unpack_from(self._mm, self._rec + i * RECORD.size)
+        return (self._texto(r_off, r_len), self._texto(c_off, c_len), self._texto(z_off, z_len),
+                self._mod[mod], self._uf[uf])
+
+    def _rec_no(self, recs, i):
+        return REC_NO.unpack_from(self._mm, recs + i * REC_NO.size)[0]
+
+    def get(self, reg, default=None):
+        if len(reg) > self._reg_w:
+            return default
+        key = reg.encode("ascii", "ignore").ljust(self._reg_w, b"\0")
+        i = bisect.bisect_left(self._reg, key)
+        if i == len(self._reg) or self._reg[i] != key:
+            return default
+        _, cnpj, razao, mod, uf = self._linha(self._rec_no(self._regr, i))
+        return {"cnpj": cnpj, "razao": razao, "modalidade": mod, "uf": uf}
+
+    def __contains__(self, reg):
+        return self.get(reg) is not None
+
+    def por_cnpj(self, cnpj):
+        """Operadoras com o CNPJ (normalizado), como (registro, dict), na ordem do CSV."""
+        cnpj = norm_cnpj(cnpj)
+        if len(cnpj) != CNPJ_W:
+            return []
+        key = cnpj.encode("ascii")
+        i = bisect.bisect_left(self._cnpj, key)
+        out = []
+        while i < len(self._cnpj) and self._cnpj[i] == key:
+            reg, cnpj, razao, mod, uf = self._linha(self._rec_no(self._cnpjr, i))
+            i += 1
+            out.append((only_digits(reg), {"cnpj": cnpj, "razao": razao, "modalidade": mod, "uf": uf}))
+        return out
+
+    def linhas(self):
+        """Todas as linhas do CSV, na ordem original: [registro, cnpj, razao, modalidade, uf]."""
+        for i in range(self.n):
+            yield list(self._linha(i))
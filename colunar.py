@@ -0,0 +1,103 @@
+import logging
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+except ImportError:  # pyarrow e opcional: sem ele o pipeline segue so com CSV
+    pa = None
+    ipc = None
+
+ARROW_EXT = ".arrow"
+
+logger = logging.getLogger(__name__)
+_avisado = False
+
+# Colunas do consolidado enriquecido, ja tipadas (poucos valores distintos -> dicionario)
+ENRIQUECIDO_COLS = [
+    "RegistroANS", "CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas", "Modalidade", "UF",
+]
+
+
+def disponivel():
+    return pa is not None
+
+
+def avisar_fallback(motivo):
+    """Registra uma vez por processo que o caminho Arrow foi trocado pelo CSV por falta do pyarrow."""
+    global _avisado
+    if not _avisado:
+        _avisado = True
+        logger.warning("pyarrow nao instalado: %s (pip install pyarrow)", motivo)
+
+
+def is_arrow(path):
+    return path.lower().endswith(ARROW_EXT)
+
+
+def arrow_path(csv_path):
+    return os.path.splitext(csv_path)[0] + ARROW_EXT
+
+
+def resolve_input(path):
+    """Troca o CSV pelo .arrow de mesmo nome quando ele existe e nao e mais antigo.
+
+    O CSV mais novo vence (ex.: gerado sem pyarrow depois do ultimo .arrow).
+    """
+    if is_arrow(path):
+        return path
+    alt = arrow_path(path)
+    if not os.path.exists(alt):
+        return path
+    if pa is None:
+        avisar_fallback(f"lendo {os.path.basename(path)} em vez de {os.path.basename(alt)}")
+        return path
+    if os.path.exists(path) and os.path.getmtime(path) > os.path.getmtime(alt):
+        return path
+    return alt
+
+
+def enriquecido_schema():
+    return pa.schema([
+        ("RegistroANS", pa.string()),
+        ("CNPJ", pa.string()),
+        ("RazaoSocial", pa.string()),
+        ("Trimestre", pa.dictionary(pa.int8(), pa.string())),
+        ("Ano", pa.int16()),
+        ("ValorDespesas", pa.float64()),
+        ("Modalidade", pa.dictionary(pa.int16(), pa.string())),
+        ("UF", pa.dictionary(pa.int16(), pa.string())),
+    ])
+
+
+def write_table(path, columns, schema):
+    """Grava `columns` (nome -> lista) como Arrow IPC sem compressao (mapeavel em memoria)."""
+    table = pa.Table.from_pydict(columns, schema=schema)
+    tmp = path + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+    return table.num_rows
+
+
+def read_columns(path, columns=None):
+    """Le so as colunas pedidas, via memory map: os buffers apontam para o arquivo."""
+    source = pa.memory_map(path, "r")
+    table = ipc.open_file(source).read_all()
+    return table.select(columns) if columns is not None else table
+
+
+def _pylist(col):
+    if pa.types.is_dictionary(col.type) and not col.null_count:
+        # um objeto str por valor distinto, reaproveitado em todas as linhas
+        values = col.dictionary.to_pylist()
+        return [values[i] for i in col.indices.to_pylist()]
+    return col.to_pylist()
+
+
+def iter_rows(path, columns):
+    """Linhas (tuplas) das colunas pedidas, em blocos para nao materializar tudo como objetos Python."""
+    table = read_columns(path, columns)
+    for batch in table.to_batches(max_chunksize=65536):
+        yield from zip(*(_pylist(col) for col in batch.columns))
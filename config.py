@@ -5,6 +5,17 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 OUTPUT_DIR = os.path.join(BASE_DIR, "output")
 
+# entradas
+CADOP_CSV = os.path.join(DATA_DIR, "cadastro_operadoras_ativas.csv")
+DESPESAS_DIR = os.path.join(OUTPUT_DIR, "Despesas_Eventos_Sinistros")
+DOWNLOAD_DIR = os.path.join(DATA_DIR, "demonstracoes_contabeis")
+
+# saidas
+CONSOLIDADO_CSV = os.path.join(OUTPUT_DIR, "consolidado_despesas.csv")
+ENRIQUECIDO_CSV = os.path.join(OUTPUT_DIR, "consolidado_despesas_enriquecido.csv")
+AGREGADAS_CSV = os.path.join(OUTPUT_DIR, "despesas_agregadas.csv")
+SQL_DIR = os.path.join(OUTPUT_DIR, "sql_import")
+
 
 def garantir_pastas():
     os.makedirs(DATA_DIR, exist_ok=True)
@@ -0,0 +1,254 @@
+"""Cubo OLAP em memoria das despesas: ano x trimestre x UF x modalidade x operadora.
+
+Uso:
+    python cubo.py --por uf --limite 5
+    python cubo.py --por cnpj --ano 2025 --trimestre 1T --medida total_despesas --limite 10
+    python cubo.py --input output/consolidado_despesas_enriquecido.csv --por ano,trimestre
+
+Cada celula base guarda contagem, soma e M2 (soma dos quadrados dos desvios,
+como no RunningStats do stats.py). Na construcao todos os 32 agregados
+(um por subconjunto de dimensoes) sao pre-calculados em arrays numpy; uma
+consulta escolhe o agregado com exatamente as dimensoes que usa (agrupamento
++ filtros), filtra com mascaras e, se filtrou por dimensoes fora do
+agrupamento, reagrupa so as linhas que sobraram. M2 de um grupo vem da
+decomposicao da variancia (M2 das partes + n * (media da parte - media do
+grupo)^2), entao media e desvio saem iguais aos de uma passada so.
+
+A API monta o cubo a partir do banco (SELECT_CELULAS, um GROUP BY na grade
+mais fina) e o refaz quando a versao dos dados muda; a linha de comando
+monta a partir do consolidado enriquecido (CSV ou Arrow).
+"""
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+import colunar
+from config import ENRIQUECIDO_CSV
+
+DIMS = ("ano", "trimestre", "uf", "modalidade", "cnpj")
+MEDIDAS = ("total_despesas", "media_despesas", "desvio_padrao", "contagem")
+
+# colunas do consolidado enriquecido para cada dimensao
+ENRIQUECIDO_KEYS = ["Ano", "Trimestre", "UF", "Modalidade", "CNPJ", "RazaoSocial"]
+
+# grade mais fina do cubo; uma linha por operadora, periodo, UF e modalidade.
+# DISTINCT ON evita contar duas vezes um CNPJ repetido no cadastro.
+SELECT_CELULAS = """
+SELECT
+    d.ano,
+    d.trimestre,
+    COALESCE(TRIM(o.uf), '') AS uf,
+    COALESCE(o.modalidade, '') AS modalidade,
+    COALESCE(d.cnpj, '') AS cnpj,
+    MAX(d.razao_social) AS razao_social,
+    COUNT(*) AS n,
+    SUM(d.valor_despesas) AS soma,
+    COALESCE(VAR_POP(d.valor_despesas), 0) * COUNT(*) AS m2
+FROM despesas_consolidadas d
+LEFT JOIN (
+    SELECT DISTINCT ON (cnpj) cnpj, uf, modalidade
+    FROM operadoras
+    ORDER BY cnpj
+) o ON o.cnpj = d.cnpj
+WHERE d.ano IS NOT NULL AND d.valor_despesas IS NOT NULL
+GROUP BY 1, 2, 3, 4, 5
+"""
+
+
+def norm_valor(dim, v):
+    s = "" if v is None else str(v).strip()
+    return s.upper() if dim in ("trimestre", "uf") else s
+
+
+def _rotulo(dim, s):
+    return int(s) if dim == "ano" and s.isdigit() else s
+
+
+def parse_lista(spec):
+    return [v.strip() for v in (spec or "").split(",") if v.strip()]
+
+
+def parse_dims(spec):
+    """"uf,modalidade" -> ("uf", "modalidade"); ValueError para dimensao desconhecida."""
+    dims = tuple(d.lower() for d in parse_lista(spec))
+    for d in dims:
+        if d not in DIMS:
+            raise ValueError(f"dimensao invalida: {d} (use {', '.join(DIMS)})")
+    if len(set(dims)) != len(dims):
+        raise ValueError("dimensao repetida em `por`")
+    return dims
+
+
+def _reagrupar(cod, n, soma, m2, dims, cards):
+    """Agrupa as linhas (codigos `cod[d]`) pelas `dims`; devolve (codigos, n, soma, m2) por grupo."""
+    key = np.zeros(len(n), dtype=np.int64)
+    for d in dims:
+        key = key * cards[d] + cod[d]
+    uniq, g = np.unique(key, return_inverse=True)
+    k = len(uniq)
+    n_g = np.bincount(g, weights=n, minlength=k)
+    soma_g = np.bincount(g, weights=soma, minlength=k)
+    media = soma / n
+    media_g = soma_g / n_g
+    m2_g = np.bincount(g, weights=m2 + n * (media - media_g[g]) ** 2, minlength=k)
+
+    out = {}
+    resto = uniq
+    for d in reversed(dims):
+        resto, out[d] = np.divmod(resto, cards[d])
+    return out, n_g, soma_g, m2_g
+
+
+class Cubo:
+    """Agregados pre-calculados de todas as combinacoes de DIMS, consultados em memoria."""
+
+    def __init__(self, celulas, versao=None):
+        """`celulas`: (ano, trimestre, uf, modalidade, cnpj, razao_social, n, soma, m2) por celula base."""
+        t0 = time.perf_counter()
+        self.versao = versao
+        self.rotulos = {d: [] for d in DIMS}
+        self._codigos = {d: {} for d in DIMS}
+        self.razao = {}
+        cod = {d: [] for d in DIMS}
+        n, soma, m2 = [], [], []
+
+        for *chave, razao, cn, cs, cm in celulas:
+            if not cn:
+                continue
+            for d, v in zip(DIMS, chave):
+                v = norm_valor(d, v)
+                c = self._codigos[d].get(v)
+                if c is None:
+                    c = self._codigos[d][v] = len(self.rotulos[d])
+                    self.rotulos[d].append(_rotulo(d, v))
+                cod[d].append(c)
+            if razao and not self.razao.get(cod["cnpj"][-1]):
+                self.razao[cod["cnpj"][-1]] = razao
+            n.append(cn)
+            soma.append(cs or 0.0)
+            m2.append(cm or 0.0)
+
+        self.celulas = len(n)
+        self._cards = {d: max(1, len(self.rotulos[d])) for d in DIMS}
+        base = (
+            {d: np.asarray(cod[d], dtype=np.int64) for d in DIMS},
+            np.asarray(n, dtype=np.float64),
+            np.asarray(soma, dtype=np.float64),
+            np.asarray(m2, dtype=np.float64),
+        )
+        self._agregados = {}
+        for r in range(len(DIMS) + 1):
+            for dims in itertools.combinations(DIMS, r):
+                self._agregados[dims] = _reagrupar(*base, dims, self._cards) if self.celulas else ({}, *base[1:])
+        self.segundos = time.perf_counter() - t0
+
+    @classmethod
+    def de_arquivo(cls, path, versao=None):
+        """Cubo a partir do consolidado enriquecido (CSV ou Arrow), agregado com main.agrupar."""
+        from main import agrupar
+
+        grupos, _ = agrupar(path, ENRIQUECIDO_KEYS, accuracy=None)
+        celulas = ((*k, s.count, s.total, s.m2) for k, s in grupos.items())
+        return cls(celulas, versao)
+
+    @property
+    def nbytes(self):
+        return sum(
+            a.nbytes
+            for cod, *medidas in self._agregados.values()
+            for a in itertools.chain(cod.values(), medidas)
+        )
+
+    def consultar(self, por=(), filtros=None, medida="total_despesas", ordem="desc", limite=None):
+        """Fatia/agrupa o cubo.
+
+        `por`: dimensoes de agrupamento; `filtros`: {dimensao: [valores]};
+        `medida`/`ordem`: ordenacao das linhas; `limite`: top-N. Devolve
+        {"grupos": total de grupos, "linhas": [...]}.
+        """
+        por = tuple(por)
+        filtros = {d: vs for d, vs in (filtros or {}).items() if vs}
+        for d in (*por, *filtros):
+            if d not in DIMS:
+                raise ValueError(f"dimensao invalida: {d} (use {', '.join(DIMS)})")
+        if medida not in MEDIDAS:
+            raise ValueError(f"medida invalida: {medida} (use {', '.join(MEDIDAS)})")
+
+        usadas = tuple(d for d in DIMS if d in por or d in filtros)
+        cod, n, soma, m2 = self._agregados[usadas]
+        if filtros and self.celulas:
+            mask = np.ones(len(n), dtype=bool)
+            for d, vs in filtros.items():
+                alvo = [c for c in (self._codigos[d].get(norm_valor(d, v)) for v in vs) if c is not None]
+                mask &= np.isin(cod[d], alvo)
+            cod = {d: c[mask] for d, c in cod.items()}
+            n, soma, m2 = n[mask], soma[mask], m2[mask]
+            agrupar = tuple(d for d in DIMS if d in por)
+            if agrupar != usadas and len(n):
+                cod, n, soma, m2 = _reagrupar(cod, n, soma, m2, agrupar, self._cards)
+
+        media = np.divide(soma, n, out=np.zeros_like(soma), where=n > 0)
+        valores = {
+            "total_despesas": soma,
+            "media_despesas": media,
+            "desvio_padrao": np.sqrt(np.divide(m2, n, out=np.zeros_like(m2), where=n > 0)),
+            "contagem": n,
+        }
+        v = valores[medida] if ordem == "asc" else -valores[medida]
+        total = len(n)
+        if limite is not None and limite < total:
+            idx = np.argpartition(v, limite - 1)[:limite]
+            idx = idx[np.argsort(v[idx], kind="stable")]
+        else:
+            idx = np.argsort(v, kind="stable")
+
+        linhas = []
+        for i in idx.tolist():
+            row = {d: self.rotulos[d][cod[d][i]] for d in por}
+            if "cnpj" in por:
+                row["razao_social"] = self.razao.get(int(cod["cnpj"][i]), "")
+            row.update({
+                "total_despesas": round(float(soma[i]), 2),
+                "media_despesas": round(float(valores["media_despesas"][i]), 2),
+                "desvio_padrao": round(float(valores["desvio_padrao"][i]), 2),
+                "contagem": int(n[i]),
+            })
+            linhas.append(row)
+        return {"grupos": total, "linhas": linhas}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Consultas ao cubo das despesas a partir do consolidado enriquecido.")
+    ap.add_argument("--input", default=ENRIQUECIDO_CSV,
+                    help="CSV ou .arrow; com pyarrow, um .arrow de mesmo nome e usado quando esta atualizado")
+    ap.add_argument("--por", default="", help="dimensoes de agrupamento: " + ", ".join(DIMS))
+    for d in DIMS:
+        ap.add_argument(f"--{d}", default=None, help=f"filtro por {d} (valores separados por virgula)")
+    ap.add_argument("--medida", default="total_despesas", choices=MEDIDAS)
+    ap.add_argument("--ordem", default="desc", choices=["desc", "asc"])
+    ap.add_argument("--limite", type=int, default=20)
+    args = ap.parse_args(argv)
+    try:
+        por = parse_dims(args.por)
+    except ValueError as e:
+        ap.error(str(e))
+
+    cubo = Cubo.de_arquivo(colunar.resolve_input(args.input))
+    print(f"Cubo: {cubo.celulas:,} celulas, {cubo.nbytes / 1024:,.0f} KB, montado em {cubo.segundos:.2f}s")
+
+    filtros = {d: parse_lista(getattr(args, d)) for d in DIMS}
+    t0 = time.perf_counter()
+    res = cubo.consultar(por, filtros, args.medida, args.ordem, args.limite)
+    elapsed = time.perf_counter() - t0
+    cols = list(res["linhas"][0]) if res["linhas"] else []
+    print(";".join(cols))
+    for row in res["linhas"]:
+        print(";".join(str(row[c]) for c in cols))
+    print(f"{len(res['linhas'])} de {res['grupos']} grupos em {elapsed * 1000:.2f} ms")
+    return res
+
+
+if __name__ == "__main__":
+    main()
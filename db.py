@@ -0,0 +1,96 @@
+import os
+import time
+import weakref
+
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg.types.numeric import FloatLoader
+from psycopg_pool import AsyncConnectionPool
+
+
+# =========================
+# CONFIGURACAO
+# =========================
+def db_params():
+    return {
+        "host": os.getenv("PGHOST", "127.0.0.1").strip(),
+        "port": os.getenv("PGPORT", "5432").strip(),
+        "dbname": os.getenv("PGDATABASE", "teste_intuitive").strip(),
+        "user": os.getenv("PGUSER", "postgres").strip(),
+        "password": os.getenv("PGPASSWORD", "").strip(),
+        "options": "-c client_encoding=UTF8",
+    }
+
+
+def pool_settings():
+    return {
+        "minconn": int(os.getenv("PGPOOL_MIN", "1")),
+        "maxconn": int(os.getenv("PGPOOL_MAX", "10")),
+        "timeout": float(os.getenv("PGPOOL_TIMEOUT", "5")),
+        "check_idle": float(os.getenv("PGPOOL_CHECK_IDLE", "30")),
+    }
+
+
+# =========================
+# POOL ASSINCRONO (API)
+# =========================
+# instante em que cada conexao ficou ociosa (criada ou devolvida ao pool)
+_ociosa_desde = weakref.WeakKeyDictionary()
+
+
+async def _marcar_ociosa(conn):
+    _ociosa_desde[conn] = time.monotonic()
+
+
+async def _configurar_conexao(conn):
+    # NUMERIC chega como float (nao Decimal), pronto para o orjson. Os valores
+    # saem do rebuild em centavos exatos, mas a partir daqui sao double: a
+    # precisao ao centavo nao e garantida na resposta da API (somas grandes
+    # podem diferir na ultima casa).
+    conn.adapters.register_loader("numeric", FloatLoader)
+    await _marcar_ociosa(conn)
+
+
+def open_async_pool():
+    """Cria (sem abrir) o pool psycopg 3 usado pela API assincrona.
+
+    Configurado pelas variaveis PGPOOL_*; as linhas vem como dict e
+    NUMERIC como float (loader registrado uma vez por conexao). Conexoes
+    ociosas ha mais de PGPOOL_CHECK_IDLE segundos recebem um `SELECT 1`
+    antes de serem entregues; as que falham sao trocadas por novas.
+    """
+    cfg = pool_settings()
+    check_idle = cfg["check_idle"]
+
+    async def checar(conn):
+        if time.monotonic() - _ociosa_desde.get(conn, 0.0) >= check_idle:
+            await AsyncConnectionPool.check_connection(conn)
+
+    return AsyncConnectionPool(
+        make_conninfo(**db_params()),
+        min_size=cfg["minconn"],
+        max_size=cfg["maxconn"],
+        timeout=cfg["timeout"],
+        kwargs={"row_factory": dict_row},
+        configure=_configurar_conexao,
+        check=checar,
+        reset=_marcar_ociosa,
+        open=False,
+    )
+
+
+def async_pool_stats(pool):
+    s = pool.get_stats()
+    size = s.get("pool_size", 0)
+    idle = s.get("pool_available", 0)
+    served = s.get("requests_num", 0)
+    return {
+        "max": pool.max_size,
+        "in_use": size - idle,
+        "idle": idle,
+        "waiting": s.get("requests_waiting", 0),
+        "acquired": served,
+        "timeouts": s.get("requests_errors", 0),
+        "discarded": s.get("connections_lost", 0),
+        "wait_ms_avg": round(s.get("requests_wait_ms", 0) / served, 3) if served else 0.0,
+    }
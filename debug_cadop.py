@@ -1,18 +1,13 @@
-import os
 import csv
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-PATH = os.path.join(BASE_DIR, "data", "cadastro_operadoras_ativas.csv")
+from config import CADOP_CSV
+from normaliza import sniff_delim
 
-print("Arquivo:", PATH)
+PATH = CADOP_CSV
 
-with open(PATH, "r", encoding="latin-1", errors="ignore", newline="") as f:
-    sample = f.read(8000)
+print("Arquivo:", PATH)
 
-best = ";"
-for d in [";", ",", "\t", "|"]:
-    if sample.count(d) > sample.count(best):
-        best = d
+best = sniff_delim(PATH, "latin-1")
 
 print("Delimitador provavel:", repr(best))
 
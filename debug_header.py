@@ -1,18 +1,13 @@
-import os
 import csv
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-INPUT_CSV = os.path.join(BASE_DIR, "output", "consolidado_despesas_enriquecido.csv")
+from config import ENRIQUECIDO_CSV
+from normaliza import sniff_delim
 
-print("Arquivo:", INPUT_CSV)
+INPUT_CSV = ENRIQUECIDO_CSV
 
-with open(INPUT_CSV, "r", encoding="utf-8", errors="ignore", newline="") as f:
-    sample = f.read(8000)
+print("Arquivo:", INPUT_CSV)
 
-best = ";"
-for d in [";", ",", "\t", "|"]:
-    if sample.count(d) > sample.count(best):
-        best = d
+best = sniff_delim(INPUT_CSV, "utf-8")
 
 print("Delimitador provavel:", repr(best))
 
@@ -0,0 +1,161 @@
+import argparse
+import csv
+import io
+import time
+
+import psycopg2
+
+import colunar
+from db import db_params
+from prep_sql_import import AGG_IN, CADOP_IN, DESP_IN, TABLES as SOURCES
+from schema import (
+    CREATE_RESUMO,
+    CREATE_RESUMO_INDEX,
+    criar_busca,
+    criar_tabela,
+    index_ddls,
+)
+
+STAGING = "_novo"
+OLD = "_antigo"
+
+
+class CopyStream(io.RawIOBase):
+    """Arquivo somente leitura que gera CSV sob demanda a partir de linhas.
+
+    `copy_expert` le em blocos; cada bloco e montado com as proximas linhas
+    do gerador, entao nada e materializado em disco ou em memoria inteira.
+    Campo vazio vira NULL (mesmo comportamento do `\\copy ... CSV`).
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf, lineterminator="\n")
+        self._pending = b""
+        self.rows = 0
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = 1 << 20
+        while len(self._pending) < size:
+            chunk = 0
+            for row in self._rows:
+                self._writer.writerow(row)
+                self.rows += 1
+                chunk += 1
+                if chunk == 1000:
+                    break
+            if not chunk:
+                break
+            self._pending += self._buf.getvalue().encode("utf-8")
+            self._buf.seek(0)
+            self._buf.truncate()
+        out, self._pending = self._pending[:size], self._pending[size:]
+        return out
+
+
+def copy_rows(conn, table, cols, rows):
+    stream = CopyStream(rows)
+    sql = f"COPY {table} ({', '.join(cols)}) FROM STDIN WITH (FORMAT csv)"
+    with conn.cursor() as cur:
+        cur.copy_expert(sql, stream, size=1 << 16)
+    return stream.rows
+
+
+def carregar_staging(conn, name, src):
+    """Cria `<tabela>_novo`, carrega via COPY e cria os indices. Devolve o numero de linhas."""
+    staging = name + STAGING
+    cols, rows_of = SOURCES[name]
+
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {staging}")
+    criar_tabela(conn, name, staging)
+    conn.commit()
+    if name == "operadoras":
+        # coluna gerada criada antes da carga: evita reescrever a tabela depois
+        criar_busca(conn, staging)
+
+    t0 = time.perf_counter()
+    n = copy_rows(conn, staging, cols, rows_of(src))
+    conn.commit()
+    elapsed = time.perf_counter() - t0
+    print(f"  COPY {n:,} linhas em {elapsed:.2f}s ({n / elapsed if elapsed else 0:,.0f} linhas/s)")
+
+    t0 = time.perf_counter()
+    with conn.cursor() as cur:
+        for _, ddl in index_ddls(conn, [name], STAGING):
+            cur.execute(ddl)
+        cur.execute(f"ANALYZE {staging}")
+    conn.commit()
+    print(f"  indices + ANALYZE em {time.perf_counter() - t0:.2f}s")
+    return n
+
+
+def trocar(conn, names):
+    """Troca as tabelas de carga pelas atuais numa unica transacao.
+
+    A API so enxerga o estado anterior completo ou o novo completo. O resumo
+    depende das tabelas antigas e e recriado (ja populado) na mesma transacao.
+    """
+    with conn.cursor() as cur:
+        for name in names:
+            cur.execute(f"ALTER TABLE IF EXISTS {name} RENAME TO {name}{OLD}")
+            cur.execute(f"ALTER TABLE {name}{STAGING} RENAME TO {name}")
+        for name in names:
+            cur.execute(f"DROP TABLE IF EXISTS {name}{OLD} CASCADE")
+        for index, _ in index_ddls(conn, names, STAGING):
+            cur.execute(f"ALTER INDEX {index} RENAME TO {index[:-len(STAGING)]}")
+        cur.execute(CREATE_RESUMO)
+        cur.execute(CREATE_RESUMO_INDEX)
+    conn.commit()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(
+        description="Carrega operadoras/despesas direto no PostgreSQL (COPY + troca atomica)."
+    )
+    ap.add_argument("--cadop", default=CADOP_IN)
+    ap.add_argument("--despesas", default=DESP_IN)
+    ap.add_argument("--agregadas", default=AGG_IN)
+    ap.add_argument("--tables", default=",".join(SOURCES),
+                    help="tabelas a carregar, separadas por virgula")
+    args = ap.parse_args(argv)
+
+    fontes = {
+        "operadoras": args.cadop,
+        "despesas_consolidadas": colunar.resolve_input(args.despesas),
+        "despesas_agregadas": args.agregadas,
+    }
+    names = [t.strip() for t in args.tables.split(",") if t.strip()]
+    for name in names:
+        if name not in SOURCES:
+            ap.error(f"tabela desconhecida: {name}")
+
+    t0 = time.perf_counter()
+    conn = psycopg2.connect(**db_params())
+    total = 0
+    try:
+        for i, name in enumerate(names, 1):
+            print(f"[{i}/{len(names)}] {name} <- {fontes[name]}")
+            total += carregar_staging(conn, name, fontes[name])
+
+        t_swap = time.perf_counter()
+        trocar(conn, names)
+        print(f"Troca atomica + resumo_estatisticas em {time.perf_counter() - t_swap:.2f}s")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    elapsed = time.perf_counter() - t0
+    print(f"OK: {total:,} linhas em {elapsed:.2f}s ({total / elapsed if elapsed else 0:,.0f} linhas/s no total)")
+    return {"rows": total, "seconds": elapsed}
+
+
+if __name__ == "__main__":
+    main()
@@ -1,85 +1,176 @@
-import os
+import argparse
 import csv
-import math
+import time
 
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+import colunar
+from config import AGREGADAS_CSV, ENRIQUECIDO_CSV
+from manifest import Manifest, state_dir_for
+from stats import RunningStats, save_groups
 
-INPUT_CSV = os.path.join(
-    BASE_DIR,
-    "output",
-    "consolidado_despesas_enriquecido.csv"
-)
+INPUT_CSV = ENRIQUECIDO_CSV
+OUTPUT_CSV = AGREGADAS_CSV
 
-OUTPUT_CSV = os.path.join(
-    BASE_DIR,
-    "output",
-    "despesas_agregadas.csv"
-)
 
-print("Entrada:", INPUT_CSV)
-print("Saida:", OUTPUT_CSV)
+GROUP_KEYS = ["Ano", "Trimestre", "UF", "Modalidade", "RazaoSocial", "RegistroANS", "CNPJ"]
+DEFAULT_GROUP = "Ano,Trimestre"
+DEFAULT_QUANTIS = "0.5,0.9"
 
-grupos = {}
 
-linhas_lidas = 0
+def parse_group(spec):
+    keys = [k.strip() for k in spec.split(",") if k.strip()]
+    lookup = {k.lower(): k for k in GROUP_KEYS}
+    out = []
+    for k in keys:
+        if k.lower() not in lookup:
+            raise ValueError(f"chave de agrupamento invalida: {k} (use {', '.join(GROUP_KEYS)})")
+        out.append(lookup[k.lower()])
+    return out
 
-with open(INPUT_CSV, "r", encoding="latin-1", newline="") as f:
-    reader = csv.DictReader(f, delimiter=";")
-    for row in reader:
-        linhas_lidas += 1
 
-        ano = row.get("Ano", "").strip()
-        trimestre = row.get("Trimestre", "").strip()
+def parse_quantis(spec):
+    qs = [float(q) for q in spec.split(",") if q.strip()]
+    for q in qs:
+        if not 0 <= q <= 1:
+            raise ValueError(f"quantil fora de [0, 1]: {q}")
+    return qs
 
-        if not ano or not trimestre:
-            continue
 
-        valor_str = row.get("ValorDespesas", "").replace(",", ".")
-        try:
-            valor = float(valor_str)
-        except Exception:
+def _linhas_csv(path, keys):
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        reader = csv.DictReader(f, delimiter=";")
+        for row in reader:
+            chave = tuple((row.get(k) or "").strip() for k in keys)
+            valor_str = (row.get("ValorDespesas") or "").replace(",", ".")
+            try:
+                valor = float(valor_str)
+            except Exception:
+                valor = None
+            yield chave, valor
+
+
+def _linhas_arrow(path, keys):
+    # so as colunas usadas; o valor ja vem como float
+    for *chave, valor in colunar.iter_rows(path, keys + ["ValorDespesas"]):
+        yield tuple("" if v is None else str(v).strip() for v in chave), valor
+
+
+def agrupar(path, keys, accuracy=0.01):
+    """Uma passada pelo consolidado enriquecido (CSV ou Arrow), com estado constante por grupo."""
+    grupos = {}
+    linhas_lidas = 0
+    obrigatorias = [i for i, k in enumerate(keys) if k in ("Ano", "Trimestre")]
+    linhas = _linhas_arrow(path, keys) if colunar.is_arrow(path) else _linhas_csv(path, keys)
+
+    for chave, valor in linhas:
+        linhas_lidas += 1
+
+        if any(not chave[i] for i in obrigatorias):
+            continue
+        if valor is None:
             continue
 
-        chave = (ano, trimestre)
-        grupos.setdefault(chave, []).append(valor)
-
-print("Linhas lidas:", linhas_lidas)
-print("Grupos formados:", len(grupos))
-
-resultados = []
-
-for (ano, trimestre), valores in grupos.items():
-    total = sum(valores)
-    media = total / len(valores)
-
-    if len(valores) > 1:
-        variancia = sum((v - media) ** 2 for v in valores) / len(valores)
-        desvio = math.sqrt(variancia)
-    else:
-        desvio = 0.0
-
-    resultados.append({
-        "Ano": ano,
-        "Trimestre": trimestre,
-        "TotalDespesas": round(total, 2),
-        "MediaDespesas": round(media, 2),
-        "DesvioPadrao": round(desvio, 2)
-    })
-
-# ordenar por ano + trimestre
-resultados.sort(key=lambda x: (x["Ano"], x["Trimestre"]))
-
-with open(OUTPUT_CSV, "w", encoding="latin-1", newline="") as f:
-    fieldnames = [
-        "Ano",
-        "Trimestre",
-        "TotalDespesas",
-        "MediaDespesas",
-        "DesvioPadrao"
-    ]
-    writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=";")
-    writer.writeheader()
-    for row in resultados:
-        writer.writerow(row)
-
-print("OK: despesas_agregadas.csv gerado por Ano e Trimestre.")
+        stats = grupos.get(chave)
+        if stats is None:
+            stats = grupos[chave] = RunningStats(accuracy)
+        stats.add(valor)
+
+    return grupos, linhas_lidas
+
+
+def calcular(grupos, keys, quantis=()):
+    resultados = []
+
+    for chave, s in grupos.items():
+        row = dict(zip(keys, chave))
+        row.update({
+            "TotalDespesas": round(s.total, 2),
+            "MediaDespesas": round(s.total / s.count, 2),
+            "DesvioPadrao": round(s.std, 2),
+            "Contagem": s.count,
+            "MinDespesas": round(s.min, 2),
+            "MaxDespesas": round(s.max, 2),
+        })
+        for q in quantis:
+            row[quantil_col(q)] = round(s.quantile(q), 2)
+        resultados.append(row)
+
+    # ordenar pelas chaves de agrupamento
+    resultados.sort(key=lambda x: tuple(x[k] for k in keys))
+    return resultados
+
+
+def quantil_col(q):
+    return f"P{q * 100:g}Despesas"
+
+
+def escrever(resultados, path, keys, quantis=()):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        fieldnames = keys + [
+            "TotalDespesas",
+            "MediaDespesas",
+            "DesvioPadrao",
+            "Contagem",
+            "MinDespesas",
+            "MaxDespesas",
+        ] + [quantil_col(q) for q in quantis]
+        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=";")
+        writer.writeheader()
+        for row in resultados:
+            writer.writerow(row)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Agrega as despesas consolidadas (padrao: por Ano e Trimestre).")
+    ap.add_argument("--input", default=INPUT_CSV,
+                    help="CSV ou .arrow; com pyarrow, um .arrow de mesmo nome e usado quando esta atualizado")
+    ap.add_argument("--output", default=OUTPUT_CSV)
+    ap.add_argument("--group-by", default=DEFAULT_GROUP,
+                    help="colunas de agrupamento separadas por virgula: " + ", ".join(GROUP_KEYS))
+    ap.add_argument("--quantis", default=DEFAULT_QUANTIS,
+                    help="quantis aproximados (erro relativo de 1%%), ex.: 0.5,0.9,0.99; vazio desliga")
+    ap.add_argument("--save-state", default=None,
+                    help="grava tambem o estado combinavel dos grupos (JSON), para merge_stats.py")
+    ap.add_argument("--state-dir", default=None,
+                    help="estado incremental (padrao: .incremental na pasta de saida)")
+    ap.add_argument("--full", action="store_true", help="recalcula mesmo sem mudancas na entrada")
+    args = ap.parse_args(argv)
+    try:
+        keys = parse_group(args.group_by)
+        quantis = parse_quantis(args.quantis)
+    except ValueError as e:
+        ap.error(str(e))
+
+    args.input = colunar.resolve_input(args.input)
+    print("Entrada:", args.input)
+    print("Saida:", args.output)
+
+    t0 = time.perf_counter()
+    state = Manifest(args.state_dir or state_dir_for(args.output))
+    params = {"group_by": keys, "quantis": quantis}
+    outputs = [args.output] + ([args.save_state] if args.save_state else [])
+    if not args.full and state.up_to_date("agregadas", [args.input], outputs, params):
+        state.save()
+        print("Entrada sem mudancas; despesas_agregadas.csv mantido.")
+        return state.info("agregadas")
+
+    grupos, linhas_lidas = agrupar(args.input, keys, accuracy=0.01 if quantis else None)
+    print("Linhas lidas:", linhas_lidas)
+    print("Grupos formados:", len(grupos))
+
+    resultados = calcular(grupos, keys, quantis)
+    escrever(resultados, args.output, keys, quantis)
+    if args.save_state:
+        save_groups(args.save_state, keys, grupos, linhas_lidas)
+        print("Estado dos grupos:", args.save_state)
+
+    print("OK: despesas_agregadas.csv gerado por", ", ".join(keys) + ".")
+    print(f"Tempo: {time.perf_counter() - t0:.2f}s")
+
+    result = {"rows_in": linhas_lidas, "rows_out": len(resultados)}
+    state.mark_done("agregadas", [args.input], outputs, params, info=result)
+    state.save()
+    return result
+
+
+if __name__ == "__main__":
+    main()
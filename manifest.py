@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import time
+
+STATE_DIRNAME = ".incremental"
+VERSION = 1
+
+
+def state_dir_for(output_path):
+    """Pasta de estado padrao: `.incremental` ao lado da saida (OUTPUT_DIR)."""
+    return os.path.join(os.path.dirname(os.path.abspath(output_path)), STATE_DIRNAME)
+
+
+def file_sha256(path, block=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+class Manifest:
+    """Estado das execucoes incrementais do pipeline.
+
+    Guarda a impressao digital (tamanho, mtime, sha256) de cada entrada e,
+    por etapa, as entradas e saidas da ultima execucao. O sha256 so e
+    recalculado quando tamanho ou mtime mudam. Agregados parciais por
+    arquivo ficam em `parts/`.
+    """
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        self.path = os.path.join(state_dir, "manifest.json")
+        self.parts_dir = os.path.join(state_dir, "parts")
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        if data.get("version") != VERSION:
+            data = {}
+        self.files = data.get("files", {})
+        self.steps = data.get("steps", {})
+        self._dirty = False
+
+    def digest(self, path):
+        key = os.path.abspath(path)
+        st = _stat(path)
+        if st is None:
+            raise FileNotFoundError(path)
+        fp = self.files.get(key)
+        if fp and [fp["size"], fp["mtime_ns"]] == st:
+            return fp["sha256"]
+        sha = file_sha256(path)
+        self.files[key] = {"size": st[0], "mtime_ns": st[1], "sha256": sha}
+        self._dirty = True
+        return sha
+
+    def up_to_date(self, step, inputs, outputs, params=None):
+        """True se as entradas e os parametros nao mudaram e as saidas estao intactas."""
+        rec = self.steps.get(step)
+        if rec is None or rec.get("params") != params:
+            return False
+        try:
+            current = {os.path.abspath(p): self.digest(p) for p in inputs}
+        except OSError:
+            return False
+        if current != rec["inputs"]:
+            return False
+        for p in outputs:
+            st = _stat(p)
+            # saida nunca registrada (ou apagada) nao conta como intacta
+            if st is None or st != rec["outputs"].get(os.path.abspath(p)):
+                return False
+        return True
+
+    def mark_done(self, step, inputs, outputs, params=None, info=None):
+        self.steps[step] = {
+            "inputs": {os.path.abspath(p): self.digest(p) for p in inputs},
+            "outputs": {os.path.abspath(p): _stat(p) for p in outputs},
+            "params": params,
+            "info": info or {},
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        self._dirty = True
+
+    def info(self, step):
+        rec = self.steps.get(step)
+        return dict(rec["info"]) if rec else {}
+
+    def forget(self, step=None):
+        if step is None:
+            self.steps.clear()
+        else:
+            self.steps.pop(step, None)
+        self._dirty = True
+
+    # =========================
+    # AGREGADOS PARCIAIS
+    # =========================
+    def load_part(self, name):
+        try:
+            with open(os.path.join(self.parts_dir, name + ".json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_part(self, name, data):
+        os.makedirs(self.parts_dir, exist_ok=True)
+        _write_json(os.path.join(self.parts_dir, name + ".json"), data)
+
+    def prune_parts(self, prefix, keep):
+        """Remove parciais `prefix*` que nao estao em `keep` (arquivos que sairam/mudaram)."""
+        if not os.path.isdir(self.parts_dir):
+            return
+        for fname in os.listdir(self.parts_dir):
+            name = fname[:-5] if fname.endswith(".json") else fname
+            if name.startswith(prefix) and name not in keep:
+                os.remove(os.path.join(self.parts_dir, fname))
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(self.state_dir, exist_ok=True)
+        # descarta impressoes de arquivos que sumiram
+        self.files = {k: v for k, v in self.files.items() if os.path.exists(k)}
+        _write_json(self.path, {"version": VERSION, "files": self.files, "steps": self.steps})
+        self._dirty = False
@@ -0,0 +1,54 @@
+import argparse
+import time
+
+from main import DEFAULT_QUANTIS, calcular, escrever, parse_quantis
+from stats import load_groups, merge_groups, save_groups
+
+
+def merge_files(paths):
+    """Combina estados gravados por `main.py --save-state` (mesmas chaves de agrupamento)."""
+    keys = None
+    grupos = {}
+    rows_in = 0
+    for path in paths:
+        part_keys, part, part_rows = load_groups(path)
+        if keys is None:
+            keys = part_keys
+        elif part_keys != keys:
+            raise ValueError(f"{path}: agrupado por {part_keys}, esperado {keys}")
+        merge_groups(grupos, part)
+        rows_in += part_rows
+    return keys or [], grupos, rows_in
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Combina estados de agregacao parciais sem reler as linhas.")
+    ap.add_argument("states", nargs="+", help="arquivos JSON de main.py --save-state")
+    ap.add_argument("--output", required=True, help="CSV agregado final")
+    ap.add_argument("--quantis", default=DEFAULT_QUANTIS)
+    ap.add_argument("--save-state", default=None, help="grava tambem o estado combinado")
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    try:
+        keys, grupos, rows_in = merge_files(args.states)
+        quantis = parse_quantis(args.quantis)
+    except ValueError as e:
+        ap.error(str(e))
+    if quantis and any(s.sketch is None for s in grupos.values()):
+        print("Aviso: estados sem sketch de quantis; quantis omitidos.")
+        quantis = []
+
+    resultados = calcular(grupos, keys, quantis)
+    escrever(resultados, args.output, keys, quantis)
+    if args.save_state:
+        save_groups(args.save_state, keys, grupos, rows_in)
+
+    print("Estados combinados:", len(args.states), "| grupos:", len(grupos), "| linhas de origem:", rows_in)
+    print("OK:", args.output)
+    print(f"Tempo: {time.perf_counter() - t0:.2f}s")
+    return {"rows_in": rows_in, "rows_out": len(resultados)}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import asynccontextmanager
+
+# Buckets em segundos (latencias) e em linhas (tamanho de resultado)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 200, 500, 1000, 5000, 10000)
+
+# Tempos do request atual, para o header Server-Timing
+_timings = contextvars.ContextVar("server_timings", default=None)
+
+
+class Histogram:
+    """Histograma cumulativo no formato do Prometheus, por conjunto de labels."""
+
+    def __init__(self, name, help_text, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        for labels, counts, total, count in sorted(items):
+            base = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, labels))
+            sep = "," if base else ""
+            acc = 0
+            for le, c in zip(self.buckets, counts):
+                acc += c
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{le}"}} {acc}')
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {count}')
+            plain = f"{{{base}}}" if base else ""
+            lines.append(f"{self.name}_sum{plain} {total}")
+            lines.append(f"{self.name}_count{plain} {count}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REQUEST_LATENCY = Histogram(
+    "api_request_duration_seconds", "Latencia dos requests HTTP", ("method", "route", "status")
+)
+QUERY_LATENCY = Histogram(
+    "api_query_duration_seconds", "Tempo de execucao das consultas SQL", ("query",)
+)
+QUERY_FETCH = Histogram(
+    "api_query_fetch_seconds", "Tempo materializando as linhas retornadas", ("query",)
+)
+QUERY_ROWS = Histogram(
+    "api_query_rows", "Linhas retornadas por consulta", ("query",), buckets=ROW_BUCKETS
+)
+POOL_ACQUIRE = Histogram(
+    "api_pool_acquire_seconds", "Espera para obter uma conexao do pool", ()
+)
+
+
+def add_timing(name, seconds):
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@asynccontextmanager
+async def timed_connection(pool):
+    t0 = time.perf_counter()
+    async with pool.connection() as conn:
+        elapsed = time.perf_counter() - t0
+        POOL_ACQUIRE.observe(elapsed)
+        add_timing("db-acquire", elapsed)
+        yield conn
+
+
+def render(gauges=None):
+    lines = []
+    for hist in (REQUEST_LATENCY, QUERY_LATENCY, QUERY_FETCH, QUERY_ROWS, POOL_ACQUIRE):
+        lines.extend(hist.render())
+    for name, (help_text, value) in (gauges or {}).items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _server_timing(timings, total):
+    merged = {}
+    for name, seconds in timings:
+        merged[name] = merged.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in merged.items()]
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latencia por rota e, opcionalmente, Server-Timing.
+
+    A rota e o template (`/api/operadoras/{cnpj}`), nao o path concreto,
+    para a cardinalidade dos labels ficar fixa.
+    """
+
+    def __init__(self, app, server_timing=False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        t0 = time.perf_counter()
+        timings = []
+        token = _timings.set(timings)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if self.server_timing:
+                    value = _server_timing(timings, time.perf_counter() - t0)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", value.encode("latin-1"))
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _timings.reset(token)
+            route = scope.get("route")
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - t0,
+                scope.get("method", ""),
+                getattr(route, "path", "unmatched"),
+                str(status[0]),
+            )
@@ -0,0 +1,205 @@
+"""Parsing e normalizacao compartilhados pelos scripts do pipeline.
+
+Funcoes escalares (uma celula) e uma API em lote (colunas/linhas inteiras)
+que reaproveita o resultado de valores repetidos: CNPJ, razao social,
+UF etc. se repetem muito nos arquivos da ANS.
+
+Os caminhos rapidos usam str.isdigit()/str.replace() (implementados em C).
+Tabelas de str.translate foram descartadas: no benchmarks/bench_normaliza.py
+ficaram mais lentas que esses caminhos. O unico fallback e a regex
+`_NON_DIGIT` do only_digits, para valores com caracteres fora da mascara de
+CNPJ.
+"""
+import csv
+import math
+import re
+
+DELIMS = [";", ",", "\t", "|"]
+SNIFF_BYTES = 8000
+# valores distintos guardados por coluna antes de limpar o cache (memoria limitada)
+MEMO_MAX = 100_000
+
+_NON_DIGIT = re.compile(r"[^0-9]+")
+# valor numerico valido apos norm_money (filtro vetorizado do engine pandas)
+FLOAT_RE = r"[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?"
+
+
+# =========================
+# ARQUIVOS
+# =========================
+def sniff_delim_text(sample):
+    best = ";"
+    for d in DELIMS:
+        if sample.count(d) > sample.count(best):
+            best = d
+    return best
+
+
+def sniff_delim(path, encoding="latin-1"):
+    with open(path, "r", encoding=encoding, errors="ignore") as f:
+        sample = f.read(SNIFF_BYTES)
+    return sniff_delim_text(sample)
+
+
+def header_index(header):
+    """Nome de coluna (sem espacos nas pontas, minusculo) -> posicao da primeira ocorrencia."""
+    hm = {}
+    for i, col in enumerate(header):
+        hm.setdefault(norm_text(col).lower(), i)
+    return hm
+
+
+def find_col(hm, names):
+    for name in names:
+        i = hm.get(name.lower())
+        if i is not None:
+            return i
+    return None
+
+
+def get_col(row, i):
+    return row[i] if i is not None and i < len(row) else ""
+
+
+# =========================
+# CELULAS
+# =========================
+def norm_text(s):
+    if s is None:
+        return ""
+    return str(s).strip()
+
+
+def only_digits(s):
+    if s is None:
+        return ""
+    t = str(s)
+    if t.isdigit() and t.isascii():
+        return t
+    # mascara de CNPJ ("12.345.678/0001-90"); qualquer outro caractere cai na regex
+    t = t.replace(".", "").replace("/", "").replace("-", "").strip()
+    if t.isdigit() and t.isascii():
+        return t
+    return _NON_DIGIT.sub("", t)
+
+
+def norm_cnpj(s):
+    d = only_digits(s)
+    return d.zfill(14) if d else ""
+
+
+def norm_uf(s):
+    t = norm_text(s).upper()
+    if len(t) == 2:
+        return t
+    return ""
+
+
+def norm_money(s):
+    """Texto de dinheiro (BR ou ponto decimal) -> "1234.56"; vazio fica vazio."""
+    if s is None:
+        return ""
+    t = str(s).strip()
+    if not t:
+        return ""
+    if " " in t:
+        t = t.replace(" ", "")
+    if t.count(",") == 1:
+        # "1.234,56" -> "1234.56": com uma virgula, pontos sao milhar
+        t = t.replace(".", "").replace(",", ".")
+    return t
+
+
+def _to_float(t):
+    if not t:
+        return 0.0
+    try:
+        return float(t)
+    except ValueError:
+        return 0.0
+
+
+def norm_money_to_float(s):
+    return _to_float(norm_money(s))
+
+
+def money_to_cents(s):
+    # centavos inteiros: a soma fica exata e independe da ordem (serial x paralelo)
+    t = norm_money(s)
+    # caso comum, "1234.56": conta inteira, igual a round(float * 100) ate 16 caracteres
+    if t[-3:-2] == "." and len(t) <= 16 and "_" not in t:
+        try:
+            return int(t[:-3] + t[-2:])
+        except ValueError:
+            pass
+    v = _to_float(t) * 100
+    # "nan", "inf", "1e400": 0, como no engine pandas
+    return int(round(v)) if math.isfinite(v) else 0
+
+
+def format_cents(c):
+    sign = "-" if c < 0 else ""
+    c = abs(c)
+    return f"{sign}{c // 100}.{c % 100:02d}"
+
+
+def match_eventos_sinistros(desc):
+    d = norm_text(desc).lower()
+    return ("eventos" in d) or ("sinistros" in d)
+
+
+# =========================
+# LOTES
+# =========================
+def normalize_column(values, fn, memo=None):
+    """`fn` aplicada a uma coluna inteira; com `memo` (dict) cada valor distinto e calculado uma vez.
+
+    O `memo` pode ser reaproveitado entre chamadas (ex.: blocos do mesmo arquivo).
+    """
+    if memo is None:
+        return [fn(v) for v in values]
+    out = []
+    append = out.append
+    get = memo.get
+    for v in values:
+        r = get(v)
+        if r is None:
+            r = memo[v] = fn(v)
+        append(r)
+    return out
+
+
+def iter_normalized(reader, idxs, fns, memo_cols=()):
+    """Linhas de `reader` reduzidas as colunas `idxs`, com fns[k] aplicada a coluna k.
+
+    Linhas vazias sao ignoradas; coluna ausente (indice None ou linha curta)
+    vira "". As colunas em `memo_cols` (posicoes em `idxs`) guardam o
+    resultado de cada valor distinto, ate MEMO_MAX valores.
+    """
+    plan = [(i, fn, {} if k in memo_cols else None) for k, (i, fn) in enumerate(zip(idxs, fns))]
+    for row in reader:
+        if not row:
+            continue
+        n = len(row)
+        out = []
+        for i, fn, memo in plan:
+            v = row[i] if i is not None and i < n else ""
+            if memo is None:
+                out.append(fn(v))
+                continue
+            r = memo.get(v)
+            if r is None:
+                if len(memo) >= MEMO_MAX:
+                    memo.clear()
+                r = memo[v] = fn(v)
+            out.append(r)
+        yield out
+
+
+def csv_rows(path, encoding, delim):
+    """Leitor csv de `path` (erros de decodificacao ignorados)."""
+    f = open(path, "r", encoding=encoding, errors="ignore", newline="")
+    try:
+        yield from csv.reader(f, delimiter=delim)
+    finally:
+        f.close()
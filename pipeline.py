@@ -0,0 +1,390 @@
+"""Orquestrador do pipeline: etapas declaradas como DAG, com perfil por etapa.
+
+    python pipeline.py                       # tudo que estiver desatualizado
+    python pipeline.py --baixar              # inclui o download (ans_api.py)
+    python pipeline.py --etapas agregar --profile agregar
+
+Cada etapa roda num processo proprio (as independentes em paralelo, ate
+`--jobs`) e e pulada quando entradas, parametros e saidas nao mudaram
+desde a ultima execucao. O relatorio de cada etapa (tempo de parede, CPU,
+linhas, pico de memoria, bytes lidos/gravados) vai para a tela e para um
+JSON (`--report`).
+"""
+import argparse
+import cProfile
+import json
+import multiprocessing as mp
+import os
+import pstats
+import sys
+import time
+import traceback
+from multiprocessing.connection import wait
+
+import colunar
+import config
+from main import DEFAULT_GROUP
+from manifest import Manifest, state_dir_for
+from perf import peak_rss_mb
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STATE_SUBDIR = "pipeline"
+SQL_FILES = {
+    "operadoras": "operadoras_sql.csv",
+    "despesas_consolidadas": "despesas_consolidadas_sql.csv",
+    "despesas_agregadas": "despesas_agregadas_sql.csv",
+}
+
+
+# =========================
+# ETAPAS
+# =========================
+class Etapa:
+    """Etapa do DAG.
+
+    `entradas`, `saidas` e `kwargs` sao funcoes, avaliadas so quando as
+    dependencias terminam (os arquivos da etapa anterior ja existem).
+    `executar` e uma funcao de modulo (vai para outro processo).
+    """
+
+    def __init__(self, nome, deps, entradas, saidas, executar, kwargs, params=None, sempre=False):
+        self.nome = nome
+        self.deps = deps
+        self.entradas = entradas
+        self.saidas = saidas
+        self.executar = executar
+        self.kwargs = kwargs
+        self.params = params
+        # sem entradas locais para comparar (ex.: download): roda sempre que selecionada
+        self.sempre = sempre
+
+
+def rodar_baixar(base_url, data_dir, workers):
+    import ans_api
+
+    # o rebuild le os membros dos ZIPs trimestrais em streaming: so o CADOP e extraido
+    pastas = [p for p in ans_api.PASTAS if p != ans_api.CADOP_DIR]
+    resumo = ans_api.sincronizar(base_url, data_dir, pastas, workers=workers, extrair=False)
+    cadop = ans_api.sincronizar(base_url, data_dir, [ans_api.CADOP_DIR], workers=workers)
+    baixados = sum(r["baixado"] + r["retomado"] for r in (resumo, cadop))
+    return {"rows_in": None, "rows_out": baixados}
+
+
+def rodar_consolidar(argv):
+    import rebuild_consolidado
+
+    return rebuild_consolidado.main(argv)
+
+
+def rodar_agregar(argv):
+    import main as agregacao
+
+    return agregacao.main(argv)
+
+
+def rodar_sql(table, src, dst):
+    import prep_sql_import as prep
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    cols, rows_of = prep.TABLES[table]
+    n = prep.write_csv(dst, cols, rows_of(src))
+    print("OK rows:", n, "->", dst)
+    return {"rows_in": n, "rows_out": n}
+
+
+def entradas_consolidar(in_dir, cadop):
+    import rebuild_consolidado as rc
+
+    files = rc.discover_files(in_dir) if os.path.isdir(in_dir) else []
+    paths = dict.fromkeys(rc.split_source(p)[0] for _, _, p in files if rc.source_exists(p))
+    return list(paths) + ([cadop] if os.path.exists(cadop) else [])
+
+
+def montar_etapas(args):
+    enr = args.enriquecido
+    if colunar.disponivel():
+        arrow = colunar.arrow_path(enr)
+    else:
+        arrow = None
+        colunar.avisar_fallback("etapas seguem so com CSV")
+    agregadas = args.agregadas
+    sql = {t: os.path.join(args.sql_dir, f) for t, f in SQL_FILES.items()}
+
+    argv_cons = ["--in-dir", args.in_dir, "--cadop", args.cadop, "--out-cons", args.consolidado,
+                 "--out-enr", enr, "--engine", args.engine, "--workers", str(args.workers)]
+    # a saida .arrow so e declarada (e pedida ao rebuild) quando o pyarrow esta instalado
+    argv_cons += ["--formato", "ambos", "--out-arrow", arrow] if arrow else ["--formato", "csv"]
+    argv_agg = ["--input", enr, "--output", agregadas, "--group-by", args.group_by]
+    if args.full:
+        argv_cons.append("--full")
+        argv_agg.append("--full")
+
+    return [
+        Etapa("baixar", [], lambda: [], lambda: [args.cadop], rodar_baixar,
+              lambda: {"base_url": args.base_url, "data_dir": args.data_dir, "workers": args.workers_download}, sempre=True),
+        Etapa("consolidar", ["baixar"], lambda: entradas_consolidar(args.in_dir, args.cadop),
+              lambda: [p for p in (args.consolidado, enr, arrow) if p], rodar_consolidar,
+              lambda: {"argv": argv_cons}, params={"engine": args.engine}),
+        Etapa("sql_operadoras", ["baixar"], lambda: [args.cadop], lambda: [sql["operadoras"]], rodar_sql,
+              lambda: {"table": "operadoras", "src": args.cadop, "dst": sql["operadoras"]}),
+        Etapa("agregar", ["consolidar"], lambda: [colunar.resolve_input(enr)], lambda: [agregadas],
+              rodar_agregar, lambda: {"argv": argv_agg}, params={"group_by": args.group_by}),
+        Etapa("sql_despesas", ["consolidar"], lambda: [colunar.resolve_input(enr)],
+              lambda: [sql["despesas_consolidadas"]], rodar_sql,
+              lambda: {"table": "despesas_consolidadas", "src": colunar.resolve_input(enr),
+                       "dst": sql["despesas_consolidadas"]}),
+        Etapa("sql_agregadas", ["agregar"], lambda: [agregadas], lambda: [sql["despesas_agregadas"]],
+              rodar_sql, lambda: {"table": "despesas_agregadas", "src": agregadas, "dst": sql["despesas_agregadas"]}),
+    ]
+
+
+# =========================
+# MEDICAO (no processo da etapa)
+# =========================
+def _io_bytes():
+    """(lidos, gravados) pelo processo e filhos ja encerrados; None se indisponivel."""
+    try:
+        with open("/proc/self/io", "r", encoding="ascii") as f:
+            campos = dict(line.split(":", 1) for line in f)
+        return int(campos["rchar"]), int(campos["wchar"])
+    except OSError:
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    io = psutil.Process().io_counters()
+    return io.read_bytes, io.write_bytes
+
+
+def _cpu():
+    if resource is not None:
+        ru_self = resource.getrusage(resource.RUSAGE_SELF)
+        ru_filhos = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return ru_self.ru_utime + ru_self.ru_stime + ru_filhos.ru_utime + ru_filhos.ru_stime
+    return time.process_time()
+
+
+def _processo_etapa(executar, kwargs, log_path, prof_path, conn):
+    # saida da etapa (e dos workers que ela criar) vai para o log: etapas paralelas nao se misturam
+    sys.stdout.flush()
+    sys.stderr.flush()
+    log = open(log_path, "w", encoding="utf-8")
+    os.dup2(log.fileno(), 1)
+    os.dup2(log.fileno(), 2)
+
+    io0 = _io_bytes()
+    cpu0 = _cpu()
+    t0 = time.perf_counter()
+    rel = {"status": "ok"}
+    try:
+        if prof_path:
+            prof = cProfile.Profile()
+            info = prof.runcall(executar, **kwargs)
+            prof.dump_stats(prof_path)
+            pstats.Stats(prof, stream=sys.stdout).sort_stats("cumulative").print_stats(25)
+        else:
+            info = executar(**kwargs)
+    except BaseException:
+        traceback.print_exc()
+        info = None
+        rel["status"] = "erro"
+    io1 = _io_bytes()
+    info = info if isinstance(info, dict) else {}
+    rel.update({
+        "wall_s": round(time.perf_counter() - t0, 3),
+        "cpu_s": round(_cpu() - cpu0, 3),
+        "rows_in": info.get("rows_in"),
+        "rows_out": info.get("rows_out"),
+        "peak_rss_mb": peak_rss_mb(children=True),
+        "bytes_read": io1[0] - io0[0] if io0 and io1 else None,
+        "bytes_written": io1[1] - io0[1] if io0 and io1 else None,
+        "info": info,
+    })
+    sys.stdout.flush()
+    sys.stderr.flush()
+    conn.send(rel)
+    conn.close()
+
+
+# =========================
+# AGENDAMENTO
+# =========================
+def executar(etapas, state, jobs=2, full=False, log_dir=None, profile=None, profile_out=None):
+    """Roda as etapas respeitando as dependencias. Devolve o relatorio (uma entrada por etapa)."""
+    nomes = {e.nome for e in etapas}
+    pendentes = list(etapas)
+    rodando = {}  # sentinel -> (etapa, processo, conn, entradas, log, perfil)
+    estado = {}   # nome -> "ok" | "pulada" | "erro" | "cancelada"
+    relatorio = {}
+    os.makedirs(log_dir, exist_ok=True)
+
+    def terminou(nome):
+        return nome not in nomes or nome in estado
+
+    while pendentes or rodando:
+        for etapa in list(pendentes):
+            if not all(terminou(d) for d in etapa.deps):
+                continue
+            falhas = [d for d in etapa.deps if estado.get(d) in ("erro", "cancelada")]
+            if falhas:
+                pendentes.remove(etapa)
+                estado[etapa.nome] = "cancelada"
+                relatorio[etapa.nome] = {"status": "cancelada", "motivo": "falhou: " + ", ".join(falhas)}
+                print(f"[{etapa.nome}] cancelada (dependencia falhou: {', '.join(falhas)})")
+                continue
+            if len(rodando) >= jobs:
+                break
+
+            pendentes.remove(etapa)
+            entradas, saidas = etapa.entradas(), etapa.saidas()
+            if (not full and not etapa.sempre and etapa.nome != profile
+                    and state.up_to_date(etapa.nome, entradas, saidas, etapa.params)):
+                estado[etapa.nome] = "pulada"
+                info = state.info(etapa.nome)
+                relatorio[etapa.nome] = {"status": "pulada", "rows_in": info.get("rows_in"),
+                                         "rows_out": info.get("rows_out")}
+                print(f"[{etapa.nome}] atualizada, pulada")
+                continue
+
+            log_path = os.path.join(log_dir, etapa.nome + ".log")
+            prof_path = (profile_out or os.path.join(log_dir, etapa.nome + ".prof")) if etapa.nome == profile else None
+            recv, send = mp.Pipe(duplex=False)
+            proc = mp.Process(target=_processo_etapa, name=etapa.nome,
+                              args=(etapa.executar, etapa.kwargs(), log_path, prof_path, send))
+            proc.start()
+            send.close()
+            rodando[proc.sentinel] = (etapa, proc, recv, entradas, log_path, prof_path)
+            print(f"[{etapa.nome}] iniciada (log: {log_path})")
+
+        if not rodando:
+            continue
+        for sentinel in wait(list(rodando)):
+            etapa, proc, recv, entradas, log_path, prof_path = rodando.pop(sentinel)
+            try:
+                rel = recv.recv()
+            except EOFError:
+                rel = {"status": "erro"}
+            proc.join()
+            if proc.exitcode != 0:
+                rel["status"] = "erro"
+            rel["log"] = log_path
+            if prof_path and rel["status"] == "ok":
+                rel["profile"] = prof_path
+            estado[etapa.nome] = rel["status"]
+            relatorio[etapa.nome] = rel
+
+            if rel["status"] == "ok":
+                info = {"rows_in": rel.get("rows_in"), "rows_out": rel.get("rows_out")}
+                state.mark_done(etapa.nome, entradas, etapa.saidas(), etapa.params, info=info)
+                state.save()
+                print(f"[{etapa.nome}] ok em {rel['wall_s']:.2f}s")
+            else:
+                state.forget(etapa.nome)
+                state.save()
+                print(f"[{etapa.nome}] ERRO (ver {log_path})")
+                with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+                    print("".join(f.readlines()[-15:]), end="")
+
+    return [dict(etapa=e.nome, **relatorio[e.nome]) for e in etapas]
+
+
+def _mb(n):
+    return f"{n / 2**20:,.1f}" if n is not None else "-"
+
+
+def imprimir(relatorio):
+    print(f"\n{'etapa':<16}{'status':<11}{'parede':>9}{'cpu':>9}{'linhas in':>12}{'linhas out':>12}"
+          f"{'RSS MB':>9}{'lido MB':>10}{'gravado MB':>12}")
+    for r in relatorio:
+        wall = f"{r['wall_s']:.2f}s" if r.get("wall_s") is not None else "-"
+        cpu = f"{r['cpu_s']:.2f}s" if r.get("cpu_s") is not None else "-"
+        rin = f"{r['rows_in']:,}" if r.get("rows_in") is not None else "-"
+        rout = f"{r['rows_out']:,}" if r.get("rows_out") is not None else "-"
+        rss = f"{r['peak_rss_mb']:.0f}" if r.get("peak_rss_mb") is not None else "-"
+        print(f"{r['etapa']:<16}{r['status']:<11}{wall:>9}{cpu:>9}{rin:>12}{rout:>12}"
+              f"{rss:>9}{_mb(r.get('bytes_read')):>10}{_mb(r.get('bytes_written')):>12}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Roda o pipeline (download -> consolidacao -> agregacao -> import SQL).")
+    ap.add_argument("--etapas", default=None,
+                    help="etapas separadas por virgula (padrao: todas menos baixar); dependencias fora da lista "
+                         "sao consideradas prontas")
+    ap.add_argument("--baixar", action="store_true", help="inclui o download dos dados abertos da ANS")
+    ap.add_argument("--jobs", type=int, default=2, help="etapas independentes rodando ao mesmo tempo")
+    ap.add_argument("--full", action="store_true", help="reprocessa tudo, mesmo sem mudancas")
+    ap.add_argument("--in-dir", default=None,
+                    help="arquivos trimestrais (padrao: Despesas_Eventos_Sinistros, ou os ZIPs baixados com --baixar)")
+    ap.add_argument("--cadop", default=None, help="CADOP (padrao: cadastro_operadoras_ativas.csv em --data-dir)")
+    ap.add_argument("--consolidado", default=config.CONSOLIDADO_CSV)
+    ap.add_argument("--enriquecido", default=config.ENRIQUECIDO_CSV)
+    ap.add_argument("--agregadas", default=config.AGREGADAS_CSV)
+    ap.add_argument("--sql-dir", default=config.SQL_DIR)
+    ap.add_argument("--group-by", default=DEFAULT_GROUP,
+                    help=f"agrupamento do main.py (padrao: {DEFAULT_GROUP}, o mesmo de `python main.py`)")
+    ap.add_argument("--engine", choices=["python", "pandas"], default="python")
+    ap.add_argument("--workers", type=int, default=1, help="processos de leitura do rebuild_consolidado.py")
+    ap.add_argument("--workers-download", type=int, default=4)
+    ap.add_argument("--base-url", default=None, help="raiz do FTP de dados abertos (padrao: a do ans_api.py)")
+    ap.add_argument("--data-dir", default=config.DATA_DIR, help="destino do download")
+    ap.add_argument("--profile", default=None, metavar="ETAPA",
+                    help="roda a etapa com cProfile (mesmo se atualizada) e grava o .prof")
+    ap.add_argument("--profile-out", default=None, help="arquivo .prof (padrao: na pasta de logs)")
+    ap.add_argument("--report", default=None, help="relatorio JSON (padrao: pipeline_relatorio.json na pasta de estado)")
+    ap.add_argument("--state-dir", default=None,
+                    help="estado do pipeline (padrao: .incremental/pipeline em OUTPUT_DIR)")
+    args = ap.parse_args(argv)
+    if args.in_dir is None:
+        downloads = os.path.join(args.data_dir, os.path.basename(config.DOWNLOAD_DIR))
+        args.in_dir = downloads if args.baixar else config.DESPESAS_DIR
+    if args.cadop is None:
+        args.cadop = os.path.join(args.data_dir, os.path.basename(config.CADOP_CSV))
+    if args.base_url is None:
+        from ans_api import BASE_URL
+
+        args.base_url = BASE_URL
+
+    etapas = montar_etapas(args)
+    todas = [e.nome for e in etapas]
+    if args.etapas:
+        escolhidas = [n.strip() for n in args.etapas.split(",") if n.strip()]
+    else:
+        escolhidas = [n for n in todas if n != "baixar"]
+    if args.baixar and "baixar" not in escolhidas:
+        escolhidas.insert(0, "baixar")
+    for nome in escolhidas + ([args.profile] if args.profile else []):
+        if nome not in todas:
+            ap.error(f"etapa desconhecida: {nome} (use {', '.join(todas)})")
+    if args.profile and args.profile not in escolhidas:
+        ap.error(f"--profile {args.profile}: etapa fora de --etapas")
+    etapas = [e for e in etapas if e.nome in escolhidas]
+
+    state_dir = args.state_dir or os.path.join(state_dir_for(args.enriquecido), STATE_SUBDIR)
+    state = Manifest(state_dir)
+    log_dir = os.path.join(state_dir, "logs")
+
+    t0 = time.perf_counter()
+    relatorio = executar(etapas, state, max(1, args.jobs), args.full, log_dir, args.profile, args.profile_out)
+    total = time.perf_counter() - t0
+    imprimir(relatorio)
+    print(f"Total: {total:.2f}s")
+
+    report = args.report or os.path.join(state_dir, "pipeline_relatorio.json")
+    os.makedirs(os.path.dirname(os.path.abspath(report)), exist_ok=True)
+    with open(report, "w", encoding="utf-8") as f:
+        json.dump({"total_s": round(total, 3), "jobs": args.jobs, "etapas": relatorio}, f, indent=2, default=str)
+    print("Relatorio:", report)
+    for r in relatorio:
+        if r.get("profile"):
+            print(f"Perfil de {r['etapa']}: {r['profile']} (ex.: snakeviz ou flameprof para flame graph)")
+
+    return 0 if all(r["status"] in ("ok", "pulada") for r in relatorio) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,205 +1,160 @@
+import argparse
 import os
 import csv
-
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, "data")
-OUTPUT_DIR = os.path.join(BASE_DIR, "output")
-
-CADOP_IN = os.path.join(DATA_DIR, "cadastro_operadoras_ativas.csv")
-DESP_IN = os.path.join(OUTPUT_DIR, "consolidado_despesas_enriquecido.csv")
-AGG_IN = os.path.join(OUTPUT_DIR, "despesas_agregadas.csv")
-
-SQL_DIR = os.path.join(OUTPUT_DIR, "sql_import")
-os.makedirs(SQL_DIR, exist_ok=True)
+import time
+
+import cadop_index
+import colunar
+from config import AGREGADAS_CSV, BASE_DIR, CADOP_CSV, ENRIQUECIDO_CSV, SQL_DIR
+from manifest import Manifest, state_dir_for
+from normaliza import (
+    csv_rows,
+    find_col,
+    header_index,
+    iter_normalized,
+    norm_cnpj,
+    norm_money,
+    norm_text,
+    norm_uf,
+    sniff_delim,
+)
+
+CADOP_IN = CADOP_CSV
+DESP_IN = ENRIQUECIDO_CSV
+AGG_IN = AGREGADAS_CSV
 
 CADOP_OUT = os.path.join(SQL_DIR, "operadoras_sql.csv")
 DESP_OUT = os.path.join(SQL_DIR, "despesas_consolidadas_sql.csv")
 AGG_OUT = os.path.join(SQL_DIR, "despesas_agregadas_sql.csv")
 
-def sniff_delim(path, encoding):
-    with open(path, "r", encoding=encoding, errors="ignore") as f:
-        sample = f.read(5000)
-    best = ";"
-    for d in [";", ",", "\t", "|"]:
-        if sample.count(d) > sample.count(best):
-            best = d
-    return best
-
-def norm_cnpj(s):
-    if s is None:
-        return ""
-    digits = "".join(ch for ch in str(s) if ch.isdigit())
-    return digits.zfill(14) if digits else ""
-
-def norm_text(s):
-    if s is None:
-        return ""
-    return str(s).strip()
-
-def norm_uf(s):
-    t = norm_text(s).upper()
-    if len(t) == 2:
-        return t
-    return ""
-
-def norm_money(s):
-    if s is None:
-        return ""
-    t = str(s).strip()
-    if not t:
-        return ""
-    t = t.replace(" ", "")
-    if t.count(",") == 1 and t.count(".") >= 1:
-        t = t.replace(".", "").replace(",", ".")
-    elif t.count(",") == 1 and t.count(".") == 0:
-        t = t.replace(",", ".")
-    return t
-
-def index_header(header):
-    m = {}
-    for i, col in enumerate(header):
-        key = norm_text(col).lower()
-        m[key] = i
-    return m
-
-print("BASE_DIR:", BASE_DIR)
-print("SQL_DIR:", SQL_DIR)
-
-# -------------------------
-# 1) operadoras_sql.csv
-# -------------------------
-print("\n[1/3] Building:", CADOP_OUT)
-cadop_delim = sniff_delim(CADOP_IN, "latin-1")
-with open(CADOP_IN, "r", encoding="latin-1", errors="ignore", newline="") as fin, \
-     open(CADOP_OUT, "w", encoding="utf-8", newline="") as fout:
-    reader = csv.reader(fin, delimiter=cadop_delim)
-    writer = csv.writer(fout, delimiter=",")
-
-    header = next(reader, [])
-    hm = index_header(header)
-
-    def find_col(possible):
-        for name in possible:
-            k = name.lower()
-            if k in hm:
-                return hm[k]
-        return None
-
-    idx_reg = find_col(["registro ans", "registro_ans", "registro"])
-    idx_cnpj = find_col(["cnpj"])
-    idx_razao = find_col(["razao social", "razao_social"])
-    idx_mod = find_col(["modalidade"])
-    idx_uf = find_col(["uf"])
-
-    writer.writerow(["cnpj", "registro_ans", "razao_social", "modalidade", "uf"])
-
-    rows = 0
-    for row in reader:
-        if not row:
-            continue
-        reg = row[idx_reg] if idx_reg is not None and idx_reg < len(row) else ""
-        cnpj = row[idx_cnpj] if idx_cnpj is not None and idx_cnpj < len(row) else ""
-        razao = row[idx_razao] if idx_razao is not None and idx_razao < len(row) else ""
-        mod = row[idx_mod] if idx_mod is not None and idx_mod < len(row) else ""
-        uf = row[idx_uf] if idx_uf is not None and idx_uf < len(row) else ""
-
-        writer.writerow([norm_cnpj(cnpj), norm_text(reg), norm_text(razao), norm_text(mod), norm_uf(uf)])
-        rows += 1
-
-print("OK rows:", rows)
-
-# -------------------------
-# 2) despesas_consolidadas_sql.csv
-# -------------------------
-print("\n[2/3] Building:", DESP_OUT)
-desp_delim = sniff_delim(DESP_IN, "utf-8")
-with open(DESP_IN, "r", encoding="utf-8", errors="ignore", newline="") as fin, \
-     open(DESP_OUT, "w", encoding="utf-8", newline="") as fout:
-    reader = csv.reader(fin, delimiter=desp_delim)
-    writer = csv.writer(fout, delimiter=",")
-
-    header = next(reader, [])
-    hm = index_header(header)
-
-    def find_col2(possible):
-        for name in possible:
-            k = name.lower()
-            if k in hm:
-                return hm[k]
-        return None
-
-    idx_cnpj = find_col2(["cnpj"])
-    idx_razao = find_col2(["razaosocial", "razao_social", "razao social"])
-    idx_tri = find_col2(["trimestre"])
-    idx_ano = find_col2(["ano"])
-    idx_val = find_col2(["valordespesas", "valor_despesas", "valor despesas", "valordespesa"])
-
-    writer.writerow(["cnpj", "razao_social", "trimestre", "ano", "valor_despesas"])
-
-    rows = 0
-    for row in reader:
-        if not row:
-            continue
-        cnpj = row[idx_cnpj] if idx_cnpj is not None and idx_cnpj < len(row) else ""
-        razao = row[idx_razao] if idx_razao is not None and idx_razao < len(row) else ""
-        tri = row[idx_tri] if idx_tri is not None and idx_tri < len(row) else ""
-        ano = row[idx_ano] if idx_ano is not None and idx_ano < len(row) else ""
-        val = row[idx_val] if idx_val is not None and idx_val < len(row) else ""
-
-        writer.writerow([norm_cnpj(cnpj), norm_text(razao), norm_text(tri), norm_text(ano), norm_money(val)])
-        rows += 1
-
-print("OK rows:", rows)
-
-# -------------------------
-# 3) despesas_agregadas_sql.csv
-# -------------------------
-print("\n[3/3] Building:", AGG_OUT)
-agg_delim = sniff_delim(AGG_IN, "utf-8")
-with open(AGG_IN, "r", encoding="utf-8", errors="ignore", newline="") as fin, \
-     open(AGG_OUT, "w", encoding="utf-8", newline="") as fout:
-    reader = csv.reader(fin, delimiter=agg_delim)
-    writer = csv.writer(fout, delimiter=",")
-
-    header = next(reader, [])
-    hm = index_header(header)
-
-    def find_col3(possible):
-        for name in possible:
-            k = name.lower()
-            if k in hm:
-                return hm[k]
-        return None
-
-    idx_razao = find_col3(["razaosocial", "razao_social", "razao social"])
-    idx_uf = find_col3(["uf"])
-    idx_ano = find_col3(["ano"])
-    idx_tri = find_col3(["trimestre"])
-    idx_total = find_col3(["total_despesas", "totaldespesas", "total"])
-    idx_media = find_col3(["media_despesas", "mediadespesas", "media"])
-    idx_std = find_col3(["desvio_padrao", "desviopadrao", "desvio", "std", "stdev"])
-
-    writer.writerow(["razao_social", "uf", "ano", "trimestre", "total_despesas", "media_despesas", "desvio_padrao"])
-
-    rows = 0
-    for row in reader:
-        if not row:
+OPERADORAS_COLS = ["cnpj", "registro_ans", "razao_social", "modalidade", "uf"]
+DESPESAS_COLS = ["cnpj", "razao_social", "trimestre", "ano", "valor_despesas"]
+AGREGADAS_COLS = ["razao_social", "uf", "ano", "trimestre", "total_despesas", "media_despesas", "desvio_padrao"]
+
+def iter_operadoras(src):
+    # CADOP compilado (cadop_index.py), o mesmo indice do rebuild: o CSV so e relido quando muda
+    try:
+        idx = cadop_index.abrir(src)
+    except (OSError, ValueError):
+        idx = None
+    if idx is not None:
+        with idx:
+            for reg, cnpj, razao, mod, uf in idx.linhas():
+                yield [cnpj, reg, razao, mod, uf if len(uf) == 2 else ""]
+        return
+    reader = csv_rows(src, "latin-1", sniff_delim(src, "latin-1"))
+    hm = header_index(next(reader, []))
+    idxs = [
+        find_col(hm, ["cnpj"]),
+        find_col(hm, ["registro ans", "registro_ans", "registro_operadora", "registro"]),
+        find_col(hm, ["razao social", "razao_social"]),
+        find_col(hm, ["modalidade"]),
+        find_col(hm, ["uf"]),
+    ]
+    fns = [norm_cnpj, norm_text, norm_text, norm_text, norm_uf]
+    yield from iter_normalized(reader, idxs, fns, memo_cols=(3, 4))
+
+def iter_despesas_arrow(src):
+    # intermediario tipado: textos ja normalizados pelo rebuild e valor numerico,
+    # sem sniff nem parse/normalizacao de texto
+    cols = ["CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas"]
+    for cnpj, razao, tri, ano, val in colunar.iter_rows(src, cols):
+        yield [cnpj or "", razao or "", tri or "",
+               "" if ano is None else str(ano), "" if val is None else f"{val:.2f}"]
+
+def iter_despesas(src):
+    if colunar.is_arrow(src):
+        yield from iter_despesas_arrow(src)
+        return
+    reader = csv_rows(src, "utf-8", sniff_delim(src, "utf-8"))
+    hm = header_index(next(reader, []))
+    idxs = [
+        find_col(hm, ["cnpj"]),
+        find_col(hm, ["razaosocial", "razao_social", "razao social"]),
+        find_col(hm, ["trimestre"]),
+        find_col(hm, ["ano"]),
+        find_col(hm, ["valordespesas", "valor_despesas", "valor despesas", "valordespesa"]),
+    ]
+    fns = [norm_cnpj, norm_text, norm_text, norm_text, norm_money]
+    # cnpj/razao/trimestre/ano se repetem por operadora e periodo
+    yield from iter_normalized(reader, idxs, fns, memo_cols=(0, 1, 2, 3))
+
+def iter_agregadas(src):
+    reader = csv_rows(src, "utf-8", sniff_delim(src, "utf-8"))
+    hm = header_index(next(reader, []))
+    idxs = [
+        find_col(hm, ["razaosocial", "razao_social", "razao social"]),
+        find_col(hm, ["uf"]),
+        find_col(hm, ["ano"]),
+        find_col(hm, ["trimestre"]),
+        find_col(hm, ["total_despesas", "totaldespesas", "total"]),
+        find_col(hm, ["media_despesas", "mediadespesas", "media"]),
+        find_col(hm, ["desvio_padrao", "desviopadrao", "desvio", "std", "stdev"]),
+    ]
+    fns = [norm_text, norm_uf, norm_text, norm_text, norm_money, norm_money, norm_money]
+    yield from iter_normalized(reader, idxs, fns, memo_cols=(0, 1, 2, 3))
+
+# tabela -> (colunas, gerador de linhas normalizadas); usado tambem pelo load_pg.py
+TABLES = {
+    "operadoras": (OPERADORAS_COLS, iter_operadoras),
+    "despesas_consolidadas": (DESPESAS_COLS, iter_despesas),
+    "despesas_agregadas": (AGREGADAS_COLS, iter_agregadas),
+}
+
+def write_csv(dst, cols, rows):
+    with open(dst, "w", encoding="utf-8", newline="") as fout:
+        writer = csv.writer(fout, delimiter=",")
+        writer.writerow(cols)
+        n = 0
+        for row in rows:
+            writer.writerow(row)
+            n += 1
+    return n
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Gera os CSVs de importacao para o PostgreSQL.")
+    ap.add_argument("--sql-dir", default=SQL_DIR)
+    ap.add_argument("--cadop", default=CADOP_IN)
+    ap.add_argument("--despesas", default=DESP_IN)
+    ap.add_argument("--agregadas", default=AGG_IN)
+    ap.add_argument("--state-dir", default=None,
+                    help="estado incremental (padrao: .incremental em OUTPUT_DIR)")
+    ap.add_argument("--full", action="store_true", help="regera todos os arquivos")
+    args = ap.parse_args(argv)
+    args.despesas = colunar.resolve_input(args.despesas)
+
+    print("BASE_DIR:", BASE_DIR)
+    print("SQL_DIR:", args.sql_dir)
+    os.makedirs(args.sql_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    state = Manifest(args.state_dir or state_dir_for(args.sql_dir))
+    steps = [
+        ("sql_operadoras", "operadoras", args.cadop, os.path.join(args.sql_dir, os.path.basename(CADOP_OUT))),
+        ("sql_despesas", "despesas_consolidadas", args.despesas, os.path.join(args.sql_dir, os.path.basename(DESP_OUT))),
+        ("sql_agregadas", "despesas_agregadas", args.agregadas, os.path.join(args.sql_dir, os.path.basename(AGG_OUT))),
+    ]
+
+    result = {}
+    for i, (step, table, src, dst) in enumerate(steps, 1):
+        print(f"\n[{i}/{len(steps)}] Building:", dst)
+        if not args.full and state.up_to_date(step, [src], [dst]):
+            result[step] = state.info(step).get("rows", 0)
+            print("Sem mudancas, mantido. rows:", result[step])
             continue
-        razao = row[idx_razao] if idx_razao is not None and idx_razao < len(row) else ""
-        uf = row[idx_uf] if idx_uf is not None and idx_uf < len(row) else ""
-        ano = row[idx_ano] if idx_ano is not None and idx_ano < len(row) else ""
-        tri = row[idx_tri] if idx_tri is not None and idx_tri < len(row) else ""
-        total = row[idx_total] if idx_total is not None and idx_total < len(row) else ""
-        media = row[idx_media] if idx_media is not None and idx_media < len(row) else ""
-        std = row[idx_std] if idx_std is not None and idx_std < len(row) else ""
-
-        writer.writerow([norm_text(razao), norm_uf(uf), norm_text(ano), norm_text(tri),
-                         norm_money(total), norm_money(media), norm_money(std)])
-        rows += 1
-
-print("OK rows:", rows)
-
-print("\nDONE. Files created in:", SQL_DIR)
-print(" -", CADOP_OUT)
-print(" -", DESP_OUT)
-print(" -", AGG_OUT)
+        cols, rows_of = TABLES[table]
+        rows = write_csv(dst, cols, rows_of(src))
+        print("OK rows:", rows)
+        state.mark_done(step, [src], [dst], info={"rows": rows})
+        result[step] = rows
+
+    state.save()
+
+    print("\nDONE. Files created in:", args.sql_dir)
+    for _, _, _, dst in steps:
+        print(" -", dst)
+    print(f"Tempo: {time.perf_counter() - t0:.2f}s")
+    return result
+
+if __name__ == "__main__":
+    main()
@@ -1,207 +1,680 @@
-import os
+import argparse
+import codecs
 import csv
-
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-
-IN_DIR = os.path.join(BASE_DIR, "output", "Despesas_Eventos_Sinistros")
-CADOP = os.path.join(BASE_DIR, "data", "cadastro_operadoras_ativas.csv")
-
-OUT_CONS = os.path.join(BASE_DIR, "output", "consolidado_despesas.csv")
-OUT_ENR = os.path.join(BASE_DIR, "output", "consolidado_despesas_enriquecido.csv")
-
-FILES = [
-    ("2T", "2025", os.path.join(IN_DIR, "2T2025.csv")),
-    ("3T", "2025", os.path.join(IN_DIR, "3T2025.csv")),
-]
-
-def sniff_delim(path):
-    with open(path, "r", encoding="latin-1", errors="ignore") as f:
-        sample = f.read(8000)
-    best = ";"
-    for d in [";", ",", "\t", "|"]:
-        if sample.count(d) > sample.count(best):
-            best = d
-    return best
-
-def norm_text(s):
-    if s is None:
-        return ""
-    return str(s).strip()
-
-def only_digits(s):
-    return "".join(ch for ch in norm_text(s) if ch.isdigit())
-
-def norm_cnpj(s):
-    d = only_digits(s)
-    return d.zfill(14) if d else ""
-
-def norm_money_to_float(s):
-    t = norm_text(s)
-    if not t:
-        return 0.0
-    t = t.replace(" ", "")
-    if t.count(",") == 1 and t.count(".") >= 1:
-        t = t.replace(".", "").replace(",", ".")
-    elif t.count(",") == 1 and t.count(".") == 0:
-        t = t.replace(",", ".")
+import hashlib
+import io
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+
+import cadop_index
+import colunar
+from config import CADOP_CSV, CONSOLIDADO_CSV, DESPESAS_DIR, ENRIQUECIDO_CSV
+from manifest import Manifest, state_dir_for
+from normaliza import (
+    FLOAT_RE,
+    format_cents,
+    match_eventos_sinistros,
+    money_to_cents,
+    only_digits,
+    sniff_delim,
+    sniff_delim_text,
+)
+from perf import peak_rss_mb
+
+IN_DIR = DESPESAS_DIR
+CADOP = CADOP_CSV
+
+OUT_CONS = CONSOLIDADO_CSV
+OUT_ENR = ENRIQUECIDO_CSV
+
+# 1T2025.csv, 2t2024.txt, despesas_3T2023.csv ...
+QUARTER_RE = re.compile(r"([1-4])T(\d{4})", re.IGNORECASE)
+
+def discover_files(in_dir):
+    """Arquivos trimestrais em `in_dir` (recursivo), como (tri, ano, fonte) em ordem cronologica.
+
+    CSV/TXT soltos e membros de ZIPs (fonte `arquivo.zip::membro`, lida em
+    streaming). Trimestre e ano saem do nome do membro (ou do ZIP, se o membro
+    nao tiver). Um CSV ja extraido ao lado do ZIP que o contem e ignorado.
+    """
+    files = []
+    if not os.path.isdir(in_dir):
+        return files
+    soltos = []
+    em_zip = set()
+    for root, _, names in os.walk(in_dir):
+        for name in sorted(names):
+            path = os.path.join(root, name)
+            lower = name.lower()
+            if lower.endswith((".csv", ".txt")):
+                soltos.append(path)
+            elif lower.endswith(".zip"):
+                try:
+                    with zipfile.ZipFile(path) as zf:
+                        members = [i.filename for i in zf.infolist() if not i.is_dir()]
+                except (OSError, zipfile.BadZipFile) as e:
+                    print("ZIP invalido:", path, "-", e)
+                    continue
+                for member in members:
+                    if not member.lower().endswith((".csv", ".txt")):
+                        continue
+                    m = QUARTER_RE.search(os.path.basename(member)) or QUARTER_RE.search(name)
+                    if not m:
+                        continue
+                    files.append((f"{m.group(1)}T", m.group(2), f"{path}{ZIP_SEP}{member}"))
+                    em_zip.add(os.path.join(root, os.path.basename(member)))
+    for path in soltos:
+        m = QUARTER_RE.search(os.path.basename(path))
+        if not m or path in em_zip:
+            continue
+        files.append((f"{m.group(1)}T", m.group(2), path))
+    files.sort(key=lambda f: (f[1], f[0], f[2]))
+    return files
+
+# =========================
+# FONTES EM ZIP (streaming)
+# =========================
+ZIP_SEP = "::"
+HEAD_BYTES = 64 * 1024
+
+def split_source(path):
+    """`arquivo.zip::membro` -> (arquivo.zip, membro); caminho comum -> (path, None)."""
+    if ZIP_SEP in path:
+        archive, member = path.split(ZIP_SEP, 1)
+        return archive, member
+    return path, None
+
+def source_exists(path):
+    return os.path.exists(split_source(path)[0])
+
+def detect_encoding(head):
+    if head.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig"
     try:
-        return float(t)
-    except Exception:
-        return 0.0
-
-def match_eventos_sinistros(desc):
-    d = norm_text(desc).lower()
-    return ("eventos" in d) or ("sinistros" in d)
-
-def lower_list(cols):
-    return [norm_text(x).lower() for x in cols]
-
-def idx(header_lower, names):
-    for n in names:
-        n = n.lower()
-        if n in header_lower:
-            return header_lower.index(n)
-    return None
-
-def load_cadop_map():
-    if not os.path.exists(CADOP):
-        print("CADOP nao encontrado:", CADOP)
+        # o bloco pode terminar no meio de um caractere multibyte
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "latin-1"
+
+class _Prefixed(io.RawIOBase):
+    """Bytes de `head` (ja lidos para a deteccao) seguidos do resto de `rest`."""
+
+    def __init__(self, head, rest):
+        self._head = memoryview(head)
+        self._rest = rest
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if len(self._head):
+            n = min(len(b), len(self._head))
+            b[:n] = self._head[:n]
+            self._head = self._head[n:]
+            return n
+        data = self._rest.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+# marca de fim de linha para o engine pandas (ver _FimDeLinha)
+FIM = "\x02"
+
+
+class _FimDeLinha:
+    """Stream de texto que acrescenta `delim + FIM` a cada linha.
+
+    O parser do pandas completa linhas curtas com "", entao uma coluna
+    ausente fica igual a uma coluna vazia; com a marca, a coluna em que o FIM
+    aparece diz quantos campos a linha tinha (como len(row) no csv.reader).
+    Quebras de linha dentro de aspas (nao aparecem nos arquivos da ANS)
+    tambem recebem a marca.
+    """
+
+    def __init__(self, stream, delim):
+        self._stream = stream
+        self._fim = delim + FIM
+        self._pend = ""
+        self._meio_da_linha = False
+        self._eof = False
+
+    def read(self, size=-1):
+        if self._eof:
+            return ""
+        data = self._stream.read(size)
+        if not data:
+            self._eof = True
+            if self._pend:
+                return self._fim + "\n"
+            # ultima linha sem quebra
+            return self._fim if self._meio_da_linha else ""
+        data = self._pend + data
+        self._pend = ""
+        # \r\n pode vir partido entre duas leituras
+        if data.endswith("\r"):
+            self._pend = "\r"
+            data = data[:-1]
+        if not data:
+            return self.read(size)
+        self._meio_da_linha = not data.endswith("\n")
+        return data.replace("\r\n", "\n").replace("\r", "\n").replace("\n", self._fim + "\n")
+
+    def __iter__(self):
+        return iter(lambda: self.read(1 << 20), "")
+
+
+@contextmanager
+def open_zip_member(path):
+    """Texto descomprimido de um membro do ZIP, sem extrair para o disco.
+
+    Encoding e delimitador sao detectados no primeiro bloco do fluxo.
+    Produz (stream de texto, delimitador, encoding).
+    """
+    archive, member = split_source(path)
+    with zipfile.ZipFile(archive) as zf, zf.open(member) as raw:
+        head = raw.read(HEAD_BYTES)
+        encoding = detect_encoding(head)
+        delim = sniff_delim_text(head[:8000].decode(encoding, errors="ignore"))
+        stream = io.TextIOWrapper(
+            io.BufferedReader(_Prefixed(head, raw), HEAD_BYTES),
+            encoding=encoding, errors="ignore", newline="",
+        )
+        yield stream, delim, encoding
+
+def source_name(path):
+    archive, member = split_source(path)
+    return f"{os.path.basename(archive)}:{member}" if member else os.path.basename(path)
+
+def load_cadop_map(path=CADOP):
+    if not os.path.exists(path):
+        print("CADOP nao encontrado:", path)
         return {}
 
-    d = sniff_delim(CADOP)
-    m = {}
+    # Real header fields (from your debug):
+    # REGISTRO_OPERADORA, CNPJ, Razao_Social, Modalidade, UF ...
+    header, linhas = cadop_index.ler_cadop(path)
+    if linhas is None:
+        print("ERRO: nao achei coluna de registro no CADOP.")
+        print("Header:", header)
+        return {}
 
-    with open(CADOP, "r", encoding="latin-1", errors="ignore", newline="") as f:
-        r = csv.reader(f, delimiter=d)
-        header = next(r, [])
-        hl = lower_list(header)
-
-        # Real header fields (from your debug):
-        # REGISTRO_OPERADORA, CNPJ, Razao_Social, Modalidade, UF ...
-        i_reg = idx(hl, ["registro_operadora", "registro", "registro_ans", "registro ans"])
-        i_cnpj = idx(hl, ["cnpj"])
-        i_razao = idx(hl, ["razao_social", "razao social", "razao_social", "razao"])
-        i_mod = idx(hl, ["modalidade"])
-        i_uf = idx(hl, ["uf"])
-
-        if i_reg is None:
-            print("ERRO: nao achei coluna de registro no CADOP.")
-            print("Header:", header)
-            return {}
-
-        for row in r:
-            if not row:
-                continue
-
-            reg_raw = row[i_reg] if i_reg < len(row) else ""
-            reg = only_digits(reg_raw)
-            if not reg:
-                continue
-
-            cnpj = norm_cnpj(row[i_cnpj]) if i_cnpj is not None and i_cnpj < len(row) else ""
-            razao = norm_text(row[i_razao]) if i_razao is not None and i_razao < len(row) else ""
-            mod = norm_text(row[i_mod]) if i_mod is not None and i_mod < len(row) else ""
-            uf = norm_text(row[i_uf]).upper() if i_uf is not None and i_uf < len(row) else ""
-
-            m[reg] = {
-                "cnpj": cnpj,
-                "razao": razao,
-                "modalidade": mod,
-                "uf": uf,
-            }
+    m = {}
+    for reg, cnpj, razao, mod, uf in linhas:
+        reg = only_digits(reg)
+        if not reg:
+            continue
+        m[reg] = {
+            "cnpj": cnpj,
+            "razao": razao,
+            "modalidade": mod,
+            "uf": uf,
+        }
 
     return m
 
-cad_map = load_cadop_map()
-print("Cadastros carregados:", len(cad_map))
-
-# Aggregate by (registro_operadora, ano, trimestre)
-agg = {}
-total_rows = 0
-kept_rows = 0
-
-for tri, ano, path in FILES:
-    if not os.path.exists(path):
-        print("Arquivo nao encontrado:", path)
-        continue
-
-    delim = sniff_delim(path)
-    print("Lendo:", os.path.basename(path), "delim:", repr(delim))
-
-    with open(path, "r", encoding="latin-1", errors="ignore", newline="") as f:
-        r = csv.reader(f, delimiter=delim)
-        for row in r:
-            total_rows += 1
-            if not row or len(row) < 5:
-                continue
-
-            # No header, by position:
-            # 0 data, 1 registro, 2 codigo, 3 descricao, 4 valor1, 5 valor2 (sometimes)
-            reg = only_digits(row[1]) if len(row) > 1 else ""
-            desc = row[3] if len(row) > 3 else ""
-            if not reg:
-                continue
-            if not match_eventos_sinistros(desc):
-                continue
-
-            val = norm_money_to_float(row[5]) if len(row) > 5 else norm_money_to_float(row[4])
-
-            key = (reg, int(ano), tri)
-            agg[key] = agg.get(key, 0.0) + val
-            kept_rows += 1
-
-print("Total linhas lidas:", total_rows)
-print("Linhas mantidas (eventos/sinistros):", kept_rows)
-print("Grupos agregados:", len(agg))
-
-# Write consolidado_despesas.csv WITH RegistroANS extra column
-with open(OUT_CONS, "w", encoding="utf-8", newline="") as fout:
-    w = csv.writer(fout, delimiter=";")
-    w.writerow(["RegistroANS", "CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas"])
 
-    written = 0
-    sem_match = 0
-
-    for (reg, ano, tri), total in sorted(agg.items()):
-        info = cad_map.get(reg)
-        if info:
-            cnpj = info["cnpj"]
-            razao = info["razao"]
+def load_cadop(path=CADOP, use_index=True):
+    """Indice mmap do CADOP (cadop_index.py); cai para o dict se nao der para compilar/gravar o indice."""
+    if use_index and os.path.exists(path):
+        try:
+            return cadop_index.abrir(path)
+        except (OSError, ValueError) as e:
+            print("Indice do CADOP indisponivel, lendo o CSV:", e)
+    return load_cadop_map(path)
+
+# =========================
+# LEITURA EM STREAMING
+# =========================
+def iter_despesas(lines, delim, stats):
+    """Gera (registro, centavos) das linhas de eventos/sinistros.
+
+    `lines` e qualquer iteravel de linhas de texto (arquivo aberto ou um
+    pedaco dele); `stats` acumula total_rows/kept_rows.
+    """
+    # registro e descricao se repetem em quase todas as linhas: normaliza cada valor distinto uma vez
+    regs = {}
+    descs = {}
+    r = csv.reader(lines, delimiter=delim)
+    for row in r:
+        stats["total_rows"] += 1
+        if not row or len(row) < 5:
+            continue
+
+        # No header, by position:
+        # 0 data, 1 registro, 2 codigo, 3 descricao, 4 valor1, 5 valor2 (sometimes)
+        reg = regs.get(row[1])
+        if reg is None:
+            reg = regs[row[1]] = only_digits(row[1])
+        if not reg:
+            continue
+        ok = descs.get(row[3])
+        if ok is None:
+            ok = descs[row[3]] = match_eventos_sinistros(row[3])
+        if not ok:
+            continue
+
+        # valor2 quando a coluna existe (mesmo vazia), senao valor1
+        val = money_to_cents(row[5]) if len(row) > 5 else money_to_cents(row[4])
+
+        stats["kept_rows"] += 1
+        yield reg, val
+
+def aggregate_lines(lines, delim, tri, ano, stats, agg=None):
+    # Aggregate by (registro_operadora, ano, trimestre)
+    agg = {} if agg is None else agg
+    key_ano = int(ano)
+    for reg, val in iter_despesas(lines, delim, stats):
+        key = (reg, key_ano, tri)
+        agg[key] = agg.get(key, 0) + val
+    return agg
+
+def add_part(agg, stats, parts, path, part_agg, part_stats):
+    """Soma o resultado de um arquivo (ou faixa) no total e, se `parts`, no parcial daquele arquivo."""
+    stats["total_rows"] += part_stats["total_rows"]
+    stats["kept_rows"] += part_stats["kept_rows"]
+    for key, val in part_agg.items():
+        agg[key] = agg.get(key, 0) + val
+    if parts is None:
+        return
+    part = parts.setdefault(path, {"stats": {"total_rows": 0, "kept_rows": 0}, "agg": {}})
+    part["stats"]["total_rows"] += part_stats["total_rows"]
+    part["stats"]["kept_rows"] += part_stats["kept_rows"]
+    by_reg = part["agg"]
+    for (reg, _, _), val in part_agg.items():
+        by_reg[reg] = by_reg.get(reg, 0) + val
+
+def aggregate(files, stats, parts=None):
+    """Agrega os arquivos em serie; com `parts` ({}), guarda tambem o parcial de cada arquivo."""
+    agg = {}
+    for tri, ano, path in files:
+        if not source_exists(path):
+            print("Arquivo nao encontrado:", path)
+            continue
+        file_stats = {"total_rows": 0, "kept_rows": 0}
+        if split_source(path)[1]:
+            with open_zip_member(path) as (f, delim, encoding):
+                print("Lendo:", source_name(path), "delim:", repr(delim), "encoding:", encoding)
+                file_agg = aggregate_lines(f, delim, tri, ano, file_stats)
         else:
-            sem_match += 1
-            cnpj = ""
-            razao = ""
-
-        w.writerow([reg, cnpj, razao, tri, ano, f"{total:.2f}"])
-        written += 1
-
-print("OK consolidado_despesas.csv escrito:", written, "sem_match:", sem_match)
-print("Arquivo:", OUT_CONS)
-
-# Write enriched version (add Modalidade, UF)
-with open(OUT_ENR, "w", encoding="utf-8", newline="") as fout:
-    w = csv.writer(fout, delimiter=";")
-    w.writerow(["RegistroANS", "CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas", "Modalidade", "UF"])
+            delim = sniff_delim(path)
+            print("Lendo:", os.path.basename(path), "delim:", repr(delim))
+            with open(path, "r", encoding="latin-1", errors="ignore", newline="") as f:
+                file_agg = aggregate_lines(f, delim, tri, ano, file_stats)
+        add_part(agg, stats, parts, path, file_agg, file_stats)
+    return agg
+
+# =========================
+# MODO PARALELO
+# =========================
+def split_ranges(path, chunk_bytes):
+    """Divide o arquivo em faixas [inicio, fim) de ~chunk_bytes.
+
+    Cada faixa fica com as linhas que *comecam* dentro dela, entao os cortes
+    nao precisam cair em fim de linha (os arquivos da ANS nao tem quebras de
+    linha dentro de campos).
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    n = max(1, -(-size // chunk_bytes))
+    step = -(-size // n)
+    return [(start, min(start + step, size)) for start in range(0, size, step)]
+
+def iter_range_lines(f, start, end):
+    if start > 0:
+        f.seek(start - 1)
+        f.readline()  # termina a linha que comecou antes da faixa
+    else:
+        f.seek(0)
+    while f.tell() < end:
+        line = f.readline()
+        if not line:
+            break
+        yield line.decode("latin-1")
+
+def aggregate_range(task):
+    path, tri, ano, delim, start, end = task
+    stats = {"total_rows": 0, "kept_rows": 0}
+    if split_source(path)[1]:
+        # membro de ZIP: um worker le o fluxo descomprimido inteiro
+        with open_zip_member(path) as (f, delim, _):
+            agg = aggregate_lines(f, delim, tri, ano, stats)
+        return agg, stats
+    with open(path, "rb") as f:
+        agg = aggregate_lines(iter_range_lines(f, start, end), delim, tri, ano, stats)
+    return agg, stats
+
+def aggregate_parallel(files, stats, workers, chunk_bytes, parts=None):
+    """Mesma saida de aggregate(), com arquivos/faixas em processos separados.
+
+    Cada worker devolve um agregado parcial por (registro, ano, trimestre);
+    como os valores sao centavos inteiros, a fusao e exata. Todos os arquivos
+    dividem o mesmo pool.
+    """
+    tasks = []
+    for tri, ano, path in files:
+        if not source_exists(path):
+            print("Arquivo nao encontrado:", path)
+            continue
+        if split_source(path)[1]:
+            # fluxo comprimido nao tem acesso aleatorio: uma tarefa por membro
+            print("Lendo:", source_name(path), "(zip)")
+            tasks.append((path, tri, ano, None, 0, None))
+            continue
+        delim = sniff_delim(path)
+        ranges = split_ranges(path, chunk_bytes)
+        print("Lendo:", os.path.basename(path), "delim:", repr(delim), "faixas:", len(ranges))
+        tasks.extend((path, tri, ano, delim, start, end) for start, end in ranges)
+
+    agg = {}
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for task, (part, part_stats) in zip(tasks, ex.map(aggregate_range, tasks)):
+            add_part(agg, stats, parts, task[0], part, part_stats)
+    return agg
+
+# =========================
+# MOTOR COLUNAR (pandas)
+# =========================
+def aggregate_pandas(files, stats, chunk_rows=1_000_000, parts=None):
+    """Mesma agregacao de aggregate(), com operacoes vetorizadas do pandas.
+
+    Le cada arquivo em blocos de `chunk_rows` linhas. Registro e descricao
+    tem poucos valores distintos: sao lidos como categoria e limpos/filtrados
+    uma vez por categoria. A conversao do valor e a soma por registro sao
+    feitas por coluna (strings Arrow quando o pyarrow esta instalado).
+    """
+    import numpy as np
+    import pandas as pd
 
+    try:
+        import pyarrow  # noqa: F401
+        money_dtype = "string[pyarrow]"
+    except ImportError:
+        money_dtype = str
+
+    agg = {}
+    for tri, ano, path in files:
+        if not source_exists(path):
+            print("Arquivo nao encontrado:", path)
+            continue
+        key_ano = int(ano)
+        file_agg = {}
+        file_stats = {"total_rows": 0, "kept_rows": 0}
+
+        with ExitStack() as stack:
+            if split_source(path)[1]:
+                source, delim, encoding = stack.enter_context(open_zip_member(path))
+            else:
+                delim, encoding = sniff_delim(path), "latin-1"
+                source = stack.enter_context(open(path, "r", encoding=encoding, errors="ignore", newline=""))
+            print("Lendo:", source_name(path), "delim:", repr(delim), "(pandas)")
+
+            reader = pd.read_csv(
+                _FimDeLinha(source, delim),
+                sep=delim,
+                header=None,
+                # 6 campos + FIM
+                names=list(range(7)),
+                usecols=[1, 3, 4, 5],
+                dtype={1: "category", 3: "category", 4: money_dtype, 5: money_dtype},
+                keep_default_na=False,
+                na_values=[],
+                index_col=False,
+                chunksize=chunk_rows,
+            )
+            for chunk in reader:
+                file_stats["total_rows"] += len(chunk)
+
+                reg_cat = chunk[1].cat
+                reg_clean = np.asarray(reg_cat.categories.astype(str).str.replace(r"\D+", "", regex=True), dtype=object)
+                desc_cat = chunk[3].cat
+                desc_ok = np.asarray(
+                    desc_cat.categories.astype(str).str.lower().str.contains("eventos|sinistros", regex=True),
+                    dtype=bool,
+                )
+
+                reg_codes = reg_cat.codes.to_numpy()
+                desc_codes = desc_cat.codes.to_numpy()
+                v1 = chunk[4]
+                v2 = chunk[5]
+
+                # FIM na coluna 4: menos de 5 campos; na coluna 5: sem valor2
+                keep = (
+                    (reg_codes >= 0)
+                    & (desc_codes >= 0)
+                    & desc_ok[desc_codes]
+                    & (reg_clean[reg_codes] != "")
+                    & (v1 != FIM).to_numpy(dtype=bool)
+                )
+                if not keep.any():
+                    continue
+
+                v1 = v1[keep]
+                v2 = v2[keep]
+                # valor2 quando a coluna existe (mesmo vazia), senao valor1
+                raw = v2.where(v2 != FIM, v1).str.strip().str.replace(" ", "", regex=False)
+
+                # mesmo criterio de norm_money_to_float: com exatamente uma virgula,
+                # pontos sao milhar e a virgula e o decimal
+                br = (raw.str.count(",") == 1).to_numpy(dtype=bool)
+                norm = raw.where(~br, raw.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+                valid = norm.str.fullmatch(FLOAT_RE).to_numpy(dtype=bool)
+                values = norm.where(valid, "0").astype("float64").to_numpy() * 100
+                # "1e400" passa no FLOAT_RE mas vira inf: 0, como no money_to_cents
+                values[~np.isfinite(values)] = 0
+                cents = np.rint(values).astype(np.int64)
+
+                codes = reg_codes[keep]
+                totals = pd.Series(cents).groupby(codes, sort=False).sum()
+
+                file_stats["kept_rows"] += len(cents)
+                for code, total in totals.items():
+                    key = (reg_clean[code], key_ano, tri)
+                    file_agg[key] = file_agg.get(key, 0) + int(total)
+        add_part(agg, stats, parts, path, file_agg, file_stats)
+    return agg
+
+# =========================
+# EXECUCAO INCREMENTAL
+# =========================
+def part_name(tri, ano, sha):
+    return f"consolidado-{ano}{tri}-{sha[:20]}"
+
+def aggregate_incremental(files, stats, state, run, full=False):
+    """Agrega so os arquivos novos ou alterados; os demais vem dos parciais em cache.
+
+    `run(files, stats, parts)` e o motor escolhido (serial, paralelo ou
+    pandas), chamado uma vez com todos os arquivos a reprocessar; `parts`
+    recebe o parcial de cada arquivo. Devolve o agregado completo e quantos
+    arquivos foram reprocessados.
+    """
+    names = {}
+    cached = {}
+    stale = []
+    for tri, ano, path in files:
+        if not source_exists(path):
+            print("Arquivo nao encontrado:", path)
+            continue
+        archive, member = split_source(path)
+        sha = state.digest(archive)
+        if member:
+            sha = hashlib.sha256(f"{sha}{ZIP_SEP}{member}".encode()).hexdigest()
+        name = names[path] = part_name(tri, ano, sha)
+        part = None if full else state.load_part(name)
+        if part is None:
+            stale.append((tri, ano, path))
+        else:
+            print("Em cache:", source_name(path))
+            cached[path] = part
+
+    fresh = {}
+    if stale:
+        run(stale, {"total_rows": 0, "kept_rows": 0}, fresh)
+        for _, _, path in stale:
+            part = fresh.setdefault(path, {"stats": {"total_rows": 0, "kept_rows": 0}, "agg": {}})
+            state.save_part(names[path], part)
+
+    agg = {}
+    for tri, ano, path in files:
+        part = cached.get(path) or fresh.get(path)
+        if part is None:
+            continue
+        stats["total_rows"] += part["stats"]["total_rows"]
+        stats["kept_rows"] += part["stats"]["kept_rows"]
+        key_ano = int(ano)
+        for reg, val in part["agg"].items():
+            key = (reg, key_ano, tri)
+            agg[key] = agg.get(key, 0) + val
+
+    state.prune_parts("consolidado-", set(names.values()))
+    return agg, len(stale)
+
+# =========================
+# ESCRITA (uma passada: CSVs e/ou Arrow)
+# =========================
+def write_outputs(agg, cad_map, out_cons=OUT_CONS, out_enr=OUT_ENR, out_arrow=None):
+    # consolidado_despesas.csv WITH RegistroANS extra column, and the
+    # enriched version (+ Modalidade, UF), from the same sorted iteration.
+    # out_cons/out_enr = None pula o CSV; out_arrow grava o enriquecido tipado.
     written = 0
     sem_match = 0
-
-    for (reg, ano, tri), total in sorted(agg.items()):
-        info = cad_map.get(reg)
-        if info:
-            cnpj = info["cnpj"]
-            razao = info["razao"]
-            mod = info["modalidade"]
-            uf = info["uf"]
-        else:
-            sem_match += 1
-            cnpj = ""
-            razao = ""
-            mod = "SEM_MATCH"
-            uf = "SEM_MATCH"
-
-        w.writerow([reg, cnpj, razao, tri, ano, f"{total:.2f}", mod, uf])
-        written += 1
-
-print("OK consolidado_despesas_enriquecido.csv escrito:", written, "sem_match:", sem_match)
-print("Arquivo:", OUT_ENR)
+    cols = {name: [] for name in colunar.ENRIQUECIDO_COLS} if out_arrow else None
+
+    with ExitStack() as stack:
+        wc = we = None
+        if out_cons:
+            wc = csv.writer(stack.enter_context(open(out_cons, "w", encoding="utf-8", newline="")), delimiter=";")
+            wc.writerow(["RegistroANS", "CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas"])
+        if out_enr:
+            we = csv.writer(stack.enter_context(open(out_enr, "w", encoding="utf-8", newline="")), delimiter=";")
+            we.writerow(["RegistroANS", "CNPJ", "RazaoSocial", "Trimestre", "Ano", "ValorDespesas", "Modalidade", "UF"])
+
+        for (reg, ano, tri), total in sorted(agg.items()):
+            info = cad_map.get(reg)
+            if info:
+                cnpj = info["cnpj"]
+                razao = info["razao"]
+                mod = info["modalidade"]
+                uf = info["uf"]
+            else:
+                sem_match += 1
+                cnpj = ""
+                razao = ""
+                mod = "SEM_MATCH"
+                uf = "SEM_MATCH"
+
+            valor = format_cents(total)
+            if wc:
+                wc.writerow([reg, cnpj, razao, tri, ano, valor])
+            if we:
+                we.writerow([reg, cnpj, razao, tri, ano, valor, mod, uf])
+            if cols is not None:
+                for name, v in zip(colunar.ENRIQUECIDO_COLS, (reg, cnpj, razao, tri, ano, total / 100, mod, uf)):
+                    cols[name].append(v)
+            written += 1
+
+    if out_arrow:
+        colunar.write_table(out_arrow, cols, colunar.enriquecido_schema())
+
+    return written, sem_match
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Consolida as despesas de eventos/sinistros por operadora e trimestre.")
+    ap.add_argument("--in-dir", default=IN_DIR, help="pasta com os arquivos trimestrais (ex.: 2T2025.csv)")
+    ap.add_argument("--cadop", default=CADOP)
+    ap.add_argument("--no-cadop-index", action="store_true",
+                    help="le o CADOP direto do CSV em vez do indice em <pasta do CADOP>/.incremental/cadop.idx")
+    ap.add_argument("--out-cons", default=OUT_CONS)
+    ap.add_argument("--out-enr", default=OUT_ENR)
+    ap.add_argument("--out-arrow", default=None,
+                    help="enriquecido em Arrow IPC (padrao: mesmo nome do --out-enr com .arrow)")
+    ap.add_argument("--formato", choices=["ambos", "arrow", "csv"], default="ambos",
+                    help="arrow: so o intermediario colunar; csv: so os CSVs; ambos (padrao)")
+    ap.add_argument("--engine", choices=["python", "pandas"], default="python",
+                    help="python: csv linha a linha; pandas: leitura em blocos e operacoes vetorizadas")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="processos para ler os arquivos (1 = serial, 0 = todos os nucleos)")
+    ap.add_argument("--chunk-mb", type=float, default=64,
+                    help="tamanho das faixas de um arquivo no modo paralelo")
+    ap.add_argument("--state-dir", default=None,
+                    help="estado incremental (padrao: .incremental na pasta de saida)")
+    ap.add_argument("--full", action="store_true",
+                    help="ignora o estado incremental e reprocessa todos os arquivos")
+    args = ap.parse_args(argv)
+    workers = args.workers or os.cpu_count() or 1
+    chunk_bytes = max(1, int(args.chunk_mb * 1024 * 1024))
+
+    formato = args.formato
+    if formato != "csv" and not colunar.disponivel():
+        if formato == "arrow":
+            ap.error("--formato arrow requer o pyarrow")
+        colunar.avisar_fallback("gravando so os CSVs")
+        formato = "csv"
+    out_cons = args.out_cons if formato != "arrow" else None
+    out_enr = args.out_enr if formato != "arrow" else None
+    out_arrow = (args.out_arrow or colunar.arrow_path(args.out_enr)) if formato != "csv" else None
+
+    t0 = time.perf_counter()
+
+    files = discover_files(args.in_dir)
+    print("Arquivos trimestrais:", ", ".join(source_name(p) for _, _, p in files) or "nenhum")
+
+    state = Manifest(args.state_dir or state_dir_for(args.out_cons))
+    # ZIPs entram uma vez so no manifesto, mesmo com varios membros
+    inputs = list(dict.fromkeys(split_source(p)[0] for _, _, p in files if source_exists(p)))
+    n_files = sum(1 for _, _, p in files if source_exists(p))
+    if os.path.exists(args.cadop):
+        inputs.append(args.cadop)
+    outputs = [p for p in (out_cons, out_enr, out_arrow) if p]
+
+    if not args.full and state.up_to_date("consolidado", inputs, outputs):
+        state.save()
+        print("Nada mudou desde a ultima execucao; saidas mantidas.")
+        print(f"Tempo: {time.perf_counter() - t0:.2f}s")
+        return state.info("consolidado")
+
+    def run(part_files, part_stats, parts=None):
+        if args.engine == "pandas":
+            return aggregate_pandas(part_files, part_stats, parts=parts)
+        if workers > 1:
+            return aggregate_parallel(part_files, part_stats, workers, chunk_bytes, parts=parts)
+        return aggregate(part_files, part_stats, parts=parts)
+
+    if args.engine == "python" and workers > 1:
+        print("Modo paralelo:", workers, "workers")
+
+    stats = {"total_rows": 0, "kept_rows": 0}
+    agg, processed = aggregate_incremental(files, stats, state, run, full=args.full)
+    print("Arquivos reprocessados:", processed, "de", n_files)
+
+    print("Total linhas lidas:", stats["total_rows"])
+    print("Linhas mantidas (eventos/sinistros):", stats["kept_rows"])
+    print("Grupos agregados:", len(agg))
+
+    # CADOP so e aberto para o join: o indice (mmap) fica aberto o minimo possivel
+    cad_map = load_cadop(args.cadop, use_index=not args.no_cadop_index)
+    print("Cadastros carregados:", len(cad_map))
+    try:
+        written, sem_match = write_outputs(agg, cad_map, out_cons, out_enr, out_arrow)
+    finally:
+        # no Windows o mmap aberto impede o os.replace do cadop.idx numa recompilacao
+        if isinstance(cad_map, cadop_index.CadopIndex):
+            cad_map.close()
+    print("OK consolidado escrito:", written, "linhas, sem_match:", sem_match)
+    print("Arquivos:", *outputs)
+
+    peak = peak_rss_mb(children=workers > 1)
+    print(f"Tempo: {time.perf_counter() - t0:.2f}s | pico de memoria: "
+          + (f"{peak:.1f} MB" if peak is not None else "indisponivel"))
+
+    result = {"rows_in": stats["total_rows"], "rows_kept": stats["kept_rows"], "rows_out": written}
+    state.mark_done("consolidado", inputs, outputs, info=result)
+    state.save()
+    return result
+
+if __name__ == "__main__":
+    main()
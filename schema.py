@@ -0,0 +1,247 @@
+import argparse
+
+import psycopg2
+
+from db import db_params
+
+# =========================
+# TABELAS
+# =========================
+# `{table}` permite criar a mesma estrutura numa tabela de carga (load_pg.py)
+TABLES = {
+    "operadoras": """
+    CREATE TABLE IF NOT EXISTS {table} (
+        cnpj VARCHAR(14),
+        registro_ans VARCHAR(20),
+        razao_social TEXT,
+        modalidade TEXT,
+        uf CHAR(2)
+    )
+    """,
+    "despesas_consolidadas": """
+    CREATE TABLE IF NOT EXISTS {table} (
+        cnpj VARCHAR(14),
+        razao_social TEXT,
+        trimestre VARCHAR(2),
+        ano INTEGER,
+        valor_despesas NUMERIC(18,2)
+    )
+    """,
+    "despesas_agregadas": """
+    CREATE TABLE IF NOT EXISTS {table} (
+        razao_social TEXT,
+        uf CHAR(2),
+        ano INTEGER,
+        trimestre VARCHAR(2),
+        total_despesas NUMERIC(18,2),
+        media_despesas NUMERIC(18,2),
+        desvio_padrao NUMERIC(18,2)
+    )
+    """,
+}
+
+
+def criar_tabela(conn, name, table=None):
+    with conn.cursor() as cur:
+        cur.execute(TABLES[name].format(table=table or name))
+
+
+# =========================
+# BUSCA DE OPERADORAS
+# =========================
+# Chave de busca sem acento/caixa. Tenta desfazer o mojibake das bases da
+# ANS (UTF-8 lido como latin-1, ex.: "SAÃ\x9aDE" -> "SAÚDE"); quando o
+# segundo byte ja se perdeu ("SAÃ?DE") o par e descartado. So usa funcoes
+# nativas para nao depender da extensao unaccent.
+CREATE_BUSCA_FUNCTION = """
+CREATE OR REPLACE FUNCTION busca_normaliza(t text) RETURNS text
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $$
+DECLARE
+    s text := COALESCE(t, '');
+BEGIN
+    IF s ~ '[ÃÂ]' THEN
+        BEGIN
+            s := convert_from(convert_to(s, 'LATIN1'), 'UTF8');
+        EXCEPTION WHEN others THEN
+            s := regexp_replace(s, '[ÃÂ][^A-Za-z0-9 ]', '', 'g');
+        END;
+    END IF;
+    s := translate(
+        s,
+        'ÁÀÂÃÄáàâãäÉÈÊËéèêëÍÌÎÏíìîïÓÒÔÕÖóòôõöÚÙÛÜúùûüÇçÑñ',
+        'AAAAAaaaaaEEEEeeeeIIIIiiiiOOOOOoooooUUUUuuuuCcNn'
+    );
+    s := regexp_replace(lower(s), '[^a-z0-9]+', ' ', 'g');
+    RETURN btrim(s);
+END
+$$
+"""
+
+ADD_BUSCA_COLUMN = """
+ALTER TABLE {table}
+ADD COLUMN IF NOT EXISTS busca text
+GENERATED ALWAYS AS (busca_normaliza(razao_social)) STORED
+"""
+
+CREATE_TRGM = "CREATE EXTENSION IF NOT EXISTS pg_trgm"
+
+
+def criar_busca(conn, table="operadoras"):
+    with conn.cursor() as cur:
+        cur.execute(CREATE_BUSCA_FUNCTION)
+        cur.execute(ADD_BUSCA_COLUMN.format(table=table))
+    conn.commit()
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(CREATE_TRGM)
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print("AVISO: pg_trgm indisponivel, busca sem indice trigram:", str(e).splitlines()[0])
+
+
+# =========================
+# INDICES
+# =========================
+# (nome, tabela, definicao); `suffix` cria o mesmo indice numa tabela de carga
+INDEXES = [
+    # ordenacao/keyset do GET /api/operadoras
+    ("operadoras_razao_cnpj", "operadoras", "(razao_social, (COALESCE(cnpj, '')))"),
+    # igualdade e prefixo (LIKE '123%') de CNPJ
+    ("operadoras_cnpj_prefix", "operadoras", "(cnpj text_pattern_ops)"),
+    # despesas de uma operadora e filtros do export
+    ("despesas_consolidadas_cnpj", "despesas_consolidadas", "(cnpj, ano, trimestre)"),
+    ("despesas_consolidadas_periodo", "despesas_consolidadas", "(ano, trimestre)"),
+]
+
+TRGM_INDEXES = [
+    ("operadoras_busca_trgm", "operadoras", "USING gin (busca gin_trgm_ops)"),
+]
+
+
+def has_extension(conn, name):
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_extension WHERE extname = %s", (name,))
+        return cur.fetchone() is not None
+
+
+def index_ddls(conn, tables=None, suffix=""):
+    defs = list(INDEXES)
+    if has_extension(conn, "pg_trgm"):
+        defs.extend(TRGM_INDEXES)
+    return [
+        (name + suffix, f"CREATE INDEX IF NOT EXISTS {name}{suffix} ON {table}{suffix} {spec}")
+        for name, table, spec in defs
+        if tables is None or table in tables
+    ]
+
+
+def criar_indices(conn, tables=None, suffix=""):
+    with conn.cursor() as cur:
+        for _, ddl in index_ddls(conn, tables, suffix):
+            cur.execute(ddl)
+    conn.commit()
+
+
+# =========================
+# RESUMO PRE-CALCULADO (/api/estatisticas)
+# =========================
+# Uma linha so: total/media num unico scan + top5 operadoras e top UFs em
+# JSON. `id` tem indice unico para permitir REFRESH ... CONCURRENTLY, que
+# nao bloqueia as leituras da API durante a atualizacao.
+CREATE_RESUMO = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS resumo_estatisticas AS
+WITH base AS (
+    SELECT SUM(valor_despesas) AS total, AVG(valor_despesas) AS media
+    FROM despesas_consolidadas
+),
+por_operadora AS (
+    SELECT
+        d.cnpj,
+        MAX(o.razao_social) AS razao_social,
+        MAX(o.uf) AS uf,
+        SUM(d.valor_despesas) AS total_despesas
+    FROM despesas_consolidadas d
+    JOIN operadoras o ON o.cnpj = d.cnpj
+    GROUP BY d.cnpj
+    ORDER BY total_despesas DESC
+    LIMIT 5
+),
+por_uf AS (
+    SELECT o.uf, SUM(d.valor_despesas) AS total_despesas
+    FROM despesas_consolidadas d
+    JOIN operadoras o ON o.cnpj = d.cnpj
+    WHERE o.uf IS NOT NULL AND o.uf <> ''
+    GROUP BY o.uf
+    ORDER BY total_despesas DESC
+    LIMIT 10
+)
+SELECT
+    1 AS id,
+    COALESCE((SELECT total FROM base), 0) AS total_despesas,
+    COALESCE((SELECT media FROM base), 0) AS media_despesas,
+    COALESCE(
+        (SELECT json_agg(p ORDER BY p.total_despesas DESC) FROM por_operadora p),
+        '[]'::json
+    ) AS top5_operadoras,
+    COALESCE(
+        (SELECT json_agg(u ORDER BY u.total_despesas DESC) FROM por_uf u),
+        '[]'::json
+    ) AS top_ufs,
+    now() AS atualizado_em
+"""
+
+CREATE_RESUMO_INDEX = """
+CREATE UNIQUE INDEX IF NOT EXISTS resumo_estatisticas_id ON resumo_estatisticas (id)
+"""
+
+REFRESH_RESUMO = "REFRESH MATERIALIZED VIEW CONCURRENTLY resumo_estatisticas"
+
+SELECT_RESUMO = """
+SELECT total_despesas, media_despesas, top5_operadoras, top_ufs, atualizado_em
+FROM resumo_estatisticas
+"""
+
+
+def criar_resumo(conn):
+    with conn.cursor() as cur:
+        cur.execute(CREATE_RESUMO)
+        cur.execute(CREATE_RESUMO_INDEX)
+    conn.commit()
+
+
+def atualizar_resumo(conn):
+    criar_resumo(conn)
+    with conn.cursor() as cur:
+        cur.execute(REFRESH_RESUMO)
+    conn.commit()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Objetos derivados do banco (indices, views/resumos).")
+    ap.add_argument(
+        "acao",
+        choices=["criar", "atualizar"],
+        help="criar: cria o resumo se nao existir; atualizar: recalcula apos uma nova carga",
+    )
+    args = ap.parse_args(argv)
+
+    conn = psycopg2.connect(**db_params())
+    try:
+        for name in TABLES:
+            criar_tabela(conn, name)
+        conn.commit()
+        criar_busca(conn)
+        criar_indices(conn)
+        if args.acao == "criar":
+            criar_resumo(conn)
+        else:
+            atualizar_resumo(conn)
+    finally:
+        conn.close()
+    print("OK resumo_estatisticas:", args.acao)
+
+
+if __name__ == "__main__":
+    main()
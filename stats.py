@@ -0,0 +1,248 @@
+import json
+import math
+import os
+
+STATE_VERSION = 1
+
+# =========================
+# QUANTIS APROXIMADOS
+# =========================
+class QuantileSketch:
+    """Sketch de quantis com erro relativo limitado (estilo DDSketch).
+
+    Cada valor cai num balde logaritmico de base gamma = (1+a)/(1-a); o
+    quantil devolvido fica a no maximo `accuracy` (relativo) do valor exato.
+    O estado e so a contagem por balde, entao o tamanho nao depende do
+    numero de linhas.
+    """
+
+    __slots__ = ("accuracy", "_gamma", "_log_gamma", "pos", "neg", "zero", "count")
+
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.pos = {}
+        self.neg = {}
+        self.zero = 0
+        self.count = 0
+
+    def _key(self, x):
+        return math.ceil(math.log(x) / self._log_gamma)
+
+    def _value(self, key):
+        return 2 * self._gamma ** key / (self._gamma + 1)
+
+    def add(self, x):
+        self.count += 1
+        if x > 0:
+            k = self._key(x)
+            self.pos[k] = self.pos.get(k, 0) + 1
+        elif x < 0:
+            k = self._key(-x)
+            self.neg[k] = self.neg.get(k, 0) + 1
+        else:
+            self.zero += 1
+
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise ValueError("sketches com precisao diferente nao podem ser combinados")
+        for k, c in other.pos.items():
+            self.pos[k] = self.pos.get(k, 0) + c
+        for k, c in other.neg.items():
+            self.neg[k] = self.neg.get(k, 0) + c
+        self.zero += other.zero
+        self.count += other.count
+        return self
+
+    def to_dict(self):
+        return {
+            "accuracy": self.accuracy,
+            "pos": {str(k): c for k, c in self.pos.items()},
+            "neg": {str(k): c for k, c in self.neg.items()},
+            "zero": self.zero,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        sk = cls(d["accuracy"])
+        sk.pos = {int(k): c for k, c in d["pos"].items()}
+        sk.neg = {int(k): c for k, c in d["neg"].items()}
+        sk.zero = d["zero"]
+        sk.count = sum(sk.pos.values()) + sum(sk.neg.values()) + sk.zero
+        return sk
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = int(q * (self.count - 1) + 0.5)
+        seen = 0
+        for k in sorted(self.neg, reverse=True):
+            seen += self.neg[k]
+            if seen > rank:
+                return -self._value(k)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.pos):
+            seen += self.pos[k]
+            if seen > rank:
+                return self._value(k)
+        return self._value(max(self.pos))
+
+
+# =========================
+# ESTATISTICAS EM UMA PASSADA
+# =========================
+class RunningStats:
+    """Total, media, desvio, min/max e quantis de um grupo, em uma passada.
+
+    Estado constante por grupo: soma compensada (Neumaier), media e M2 de
+    Welford, min, max e um QuantileSketch. O desvio e o populacional
+    (divide por n), como no calculo anterior do main.py.
+    """
+
+    __slots__ = ("count", "_sum", "_comp", "mean", "m2", "min", "max", "sketch")
+
+    def __init__(self, accuracy=0.01):
+        self.count = 0
+        self._sum = 0.0
+        self._comp = 0.0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch(accuracy) if accuracy else None
+
+    def _add_sum(self, x):
+        t = self._sum + x
+        if abs(self._sum) >= abs(x):
+            self._comp += (self._sum - t) + x
+        else:
+            self._comp += (x - t) + self._sum
+        self._sum = t
+
+    def add(self, x):
+        self.count += 1
+        self._add_sum(x)
+
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+
+        if x < self.min:
+            self.min = x
+        if x > self.max:
+            self.max = x
+        if self.sketch is not None:
+            self.sketch.add(x)
+
+    @property
+    def total(self):
+        return self._sum + self._comp
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def merge(self, other):
+        """Combina outro estado neste (Chan et al.); o resultado equivale a uma passada so."""
+        if not other.count:
+            return self
+        if not self.count:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self._sum, self._comp = other._sum, other._comp
+            self.min, self.max = other.min, other.max
+            if self.sketch is not None and other.sketch is not None:
+                self.sketch.merge(other.sketch)
+            else:
+                self.sketch = None
+            return self
+
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.count * other.count / n
+        self.mean += delta * other.count / n
+        self.count = n
+
+        self._add_sum(other._sum)
+        self._add_sum(other._comp)
+
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if self.sketch is not None and other.sketch is not None:
+            self.sketch.merge(other.sketch)
+        else:
+            self.sketch = None
+        return self
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self._sum,
+            "comp": self._comp,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "sketch": self.sketch.to_dict() if self.sketch is not None else None,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        s = cls(None)
+        s.count = d["count"]
+        s._sum = d["sum"]
+        s._comp = d["comp"]
+        s.mean = d["mean"]
+        s.m2 = d["m2"]
+        s.min = d["min"] if d["min"] is not None else math.inf
+        s.max = d["max"] if d["max"] is not None else -math.inf
+        s.sketch = QuantileSketch.from_dict(d["sketch"]) if d["sketch"] else None
+        return s
+
+    def quantile(self, q):
+        if self.sketch is None or not self.count:
+            return None
+        # o balde pode cair um pouco fora do intervalo observado
+        return min(max(self.sketch.quantile(q), self.min), self.max)
+
+
+# =========================
+# ESTADO EM DISCO
+# =========================
+def save_groups(path, keys, grupos, rows_in=0):
+    """Grava o estado de todos os grupos (JSON) para ser combinado depois."""
+    data = {
+        "version": STATE_VERSION,
+        "keys": list(keys),
+        "rows_in": rows_in,
+        "groups": [[list(chave), s.to_dict()] for chave, s in grupos.items()],
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def load_groups(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("version") != STATE_VERSION:
+        raise ValueError(f"{path}: versao de estado nao suportada")
+    grupos = {tuple(chave): RunningStats.from_dict(d) for chave, d in data["groups"]}
+    return data["keys"], grupos, data.get("rows_in", 0)
+
+
+def merge_groups(into, other):
+    for chave, s in other.items():
+        atual = into.get(chave)
+        if atual is None:
+            into[chave] = s
+        else:
+            atual.merge(s)
+    return into
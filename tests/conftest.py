@@ -0,0 +1,5 @@
+import os
+import sys
+
+# os modulos ficam na raiz do repositorio (scripts planos, sem pacote)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,56 @@
+from contextlib import asynccontextmanager
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("psycopg")
+
+import api  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+OPERADORAS = {"11222333000181": {"cnpj": "11222333000181", "registro_ans": "123456",
+                                 "razao_social": "OPERADORA TESTE", "modalidade": "Medicina de Grupo", "uf": "SP"}}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # sem banco: resumo fixo e consultas respondidas pelo dict acima
+    async def current_resumo(pool):
+        return {"atualizado_em": "2026-01-01T00:00:00+00:00"}
+
+    @asynccontextmanager
+    async def timed_connection(pool):
+        yield None
+
+    async def fetch_one(conn, label, sql, params=()):
+        return OPERADORAS.get(params[0])
+
+    monkeypatch.setattr(api, "current_resumo", current_resumo)
+    monkeypatch.setattr(api, "timed_connection", timed_connection)
+    monkeypatch.setattr(api, "fetch_one", fetch_one)
+    api.lookup_cache.invalidate()
+    api.app.state.pool = None
+    # sem `with`: o lifespan (que abre o pool) nao roda
+    yield TestClient(api.app)
+    api.lookup_cache.invalidate()
+
+
+def test_if_none_match_estrela_nao_esconde_404(client):
+    r = client.get("/api/operadoras/99999999000199", headers={"If-None-Match": "*"})
+    assert r.status_code == 404
+    # de novo, agora com a ausencia ja no lookup_cache
+    r = client.get("/api/operadoras/99999999000199", headers={"If-None-Match": "*"})
+    assert r.status_code == 404
+
+
+def test_if_none_match_estrela_em_recurso_existente(client):
+    r = client.get("/api/operadoras/11222333000181", headers={"If-None-Match": "*"})
+    assert r.status_code == 304
+
+
+def test_etag_da_resposta_revalida(client):
+    r = client.get("/api/operadoras/11222333000181")
+    assert r.status_code == 200
+    assert r.json()["razao_social"] == "OPERADORA TESTE"
+    r = client.get("/api/operadoras/11222333000181", headers={"If-None-Match": r.headers["etag"]})
+    assert r.status_code == 304
@@ -0,0 +1,32 @@
+import pytest
+
+from normaliza import money_to_cents
+
+
+@pytest.mark.parametrize("valor", ["nan", "NaN", "inf", "-inf", "Infinity", "1e400", "-1e400"])
+def test_money_to_cents_nao_finito_vira_zero(valor):
+    assert money_to_cents(valor) == 0
+
+
+@pytest.mark.parametrize("valor, cents", [("1234.56", 123456), ("1.234,56", 123456), ("12,5", 1250), ("", 0)])
+def test_money_to_cents(valor, cents):
+    assert money_to_cents(valor) == cents
+
+
+def test_engines_concordam_com_valor_nao_finito(tmp_path):
+    pytest.importorskip("pandas")
+    from rebuild_consolidado import aggregate, aggregate_pandas
+
+    path = tmp_path / "1T2025.csv"
+    path.write_text(
+        "DATA;REG_ANS;CD_CONTA_CONTABIL;DESCRICAO;VL_SALDO_INICIAL;VL_SALDO_FINAL\n"
+        "2025-01-01;123456;41;EVENTOS INDENIZAVEIS;0;10,50\n"
+        "2025-01-01;123456;41;EVENTOS INDENIZAVEIS;0;nan\n"
+        "2025-01-01;123456;41;SINISTROS;0;1e400\n",
+        encoding="latin-1",
+    )
+    files = [("1T", "2025", str(path))]
+    stats_py = {"total_rows": 0, "kept_rows": 0}
+    stats_pd = {"total_rows": 0, "kept_rows": 0}
+    assert aggregate(files, stats_py) == aggregate_pandas(files, stats_pd) == {("123456", 2025, "1T"): 1050}
+    assert stats_py == stats_pd